@@ -1,7 +1,6 @@
 from django.contrib.auth.models import AbstractUser, AnonymousUser
 # Create your models here.
 from django.db import models
-from django.db.models import Count, Q
 
 from course.utils.utils import ensure_uqj
 
@@ -26,7 +25,9 @@ class MyUser(AbstractUser):
 
     @property
     def tokens(self):
-        return self.actions.all().aggregate(models.Sum('token_change'))['token_change__sum']
+        from canvas.utils.token_balance import read_token_balance
+
+        return read_token_balance(self, None).tokens_received
 
     @property
     def is_teacher(self):
@@ -46,15 +47,9 @@ class MyUser(AbstractUser):
 
     @property
     def success_rate_by_category(self):
-        data = list(
-            self.question_junctions.values('question__category')
-                .annotate(total=Count('*'), solved=Count('pk', filter=Q(is_solved=True)))
-        )
-        data = [{
-            'category': category['question__category'],
-            'avgSuccess': 0 if category['total'] == 0 else 100 * category['solved'] / category['total']
-        } for category in data]
-        return data
+        from course.utils.category_stats import get_success_rate_by_category, get_category_question_counts
+
+        return get_success_rate_by_category(self.category_stats.all(), get_category_question_counts())
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
@@ -3,3 +3,12 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from accounts.models import MyUser
+        from canvas.models import CanvasCourseRegistration
+        from course.models.models import Question, QuestionCategory
+        from utils.cache_versions import track_cache_versions
+
+        # The cached list responses of the api are keyed on the version stamps of these models
+        track_cache_versions(Question, QuestionCategory, MyUser, CanvasCourseRegistration)
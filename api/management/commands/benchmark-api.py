@@ -0,0 +1,69 @@
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import MyUser, TEACHER
+from api.views import QuestionViewSet
+from course.models.models import Question
+from utils.cache_versions import bump_cache_versions
+
+
+class Command(BaseCommand):
+    help = 'Time the question list api on generated questions, the changes are rolled back at the end'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=10000, help='Number of questions to generate')
+        parser.add_argument('--page-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.benchmark(options['questions'], options['page_size'])
+            transaction.set_rollback(True)
+        bump_cache_versions(Question)
+
+    def benchmark(self, num_questions, page_size):
+        user = MyUser.objects.create_user('api-benchmark', 'api-benchmark@example.com', role=TEACHER)
+        content_type = ContentType.objects.get_for_model(Question, for_concrete_model=False)
+        Question.objects.bulk_create([
+            Question(title='Question {}'.format(i), text='<p>Text of question {}</p>'.format(i),
+                     max_submission_allowed=10, author=user, polymorphic_ctype=content_type)
+            for i in range(num_questions)
+        ], batch_size=500)
+        bump_cache_versions(Question)
+        self.stdout.write('{} questions in the database'.format(Question.objects.count()))
+
+        factory = APIRequestFactory()
+        view = QuestionViewSet.as_view({'get': 'list'})
+
+        def get(params):
+            request = factory.get('/api/questions/', params)
+            force_authenticate(request, user)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = view(request)
+                response.render()
+                elapsed = time.perf_counter() - start
+            return response, elapsed, len(queries)
+
+        for name, params in [
+            ('first page', {'page_size': page_size}),
+            ('first page, cached', {'page_size': page_size}),
+            ('first page, id and title', {'page_size': page_size, 'fields': 'id,title'}),
+        ]:
+            _, elapsed, num_queries = get(params)
+            self.stdout.write('{}: {:.1f} ms, {} queries'.format(name, elapsed * 1000, num_queries))
+
+        params = {'page_size': page_size}
+        total_time = total_queries = num_pages = 0
+        while params is not None:
+            response, elapsed, num_queries = get(params)
+            total_time += elapsed
+            total_queries += num_queries
+            num_pages += 1
+            next_url = response.data['next']
+            params = next_url and factory.get(next_url).GET
+        self.stdout.write('all {} pages: {:.1f} ms, {} queries'.format(num_pages, total_time * 1000, total_queries))
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from api.schema import write_schema
+
+
+class Command(BaseCommand):
+    help = 'Write the OpenAPI schema of the api to OPENAPI_SCHEMA_FILE, run it on every deploy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.OPENAPI_SCHEMA_FILE, help='Path of the schema file')
+
+    def handle(self, *args, **options):
+        content = write_schema(options['output'])
+        self.stdout.write('Wrote {} bytes to {}'.format(len(content), options['output']))
@@ -0,0 +1,75 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from utils.cache_versions import get_cache_versions, get_versions_cache
+
+
+class ConditionalGetMixin:
+    """
+    Answers list and retrieve requests with 304 Not Modified when the ETag or Last-Modified sent by the client still
+    matches the time_modified of the objects, without serializing them
+    """
+
+    def _get_validators(self, queryset):
+        summary = queryset.order_by().aggregate(num=Count('pk'), last_modified=Max('time_modified'))
+        if summary['last_modified'] is None:
+            return None, None
+        etag = quote_etag('{}-{}'.format(summary['num'], summary['last_modified'].timestamp()))
+        return etag, summary['last_modified'].timestamp()
+
+    def _conditional_response(self, request, queryset, get_response):
+        etag, last_modified = self._get_validators(queryset)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified and int(last_modified))
+        if response is not None:
+            return response
+
+        response = get_response()
+        if etag is not None and response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional_response(request, queryset, lambda: super(ConditionalGetMixin, self).list(
+            request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        return self._conditional_response(request, queryset, lambda: super(ConditionalGetMixin, self).retrieve(
+            request, *args, **kwargs))
+
+
+class CachedListMixin:
+    """
+    Caches the serialized pages of the list action. The cache keys contain the version stamps of the models in
+    `cache_dependencies`, so a change to one of their rows makes the cached pages stale. The pages and the stamps are
+    kept in API_CACHE, the lists are not cached until it is set.
+    """
+    cache_dependencies = ()
+    list_cache_timeout = 5 * 60
+
+    def get_list_cache_key(self, request):
+        versions = get_cache_versions(self.cache_dependencies)
+        key = repr([self.basename, versions, request.get_full_path()])
+        return 'api:list:' + hashlib.md5(key.encode()).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        cache = get_versions_cache()
+        if cache is None:
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.list_cache_timeout)
+        return response
@@ -0,0 +1,21 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ApiCursorPagination(CursorPagination):
+    ordering = 'pk'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class OptionalCursorPagination(ApiCursorPagination):
+    """
+    Only paginates when the client asks for a cursor or a page size, for the lists the bundled front end reads as
+    plain arrays
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params and \
+                self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from rest_framework.renderers import JSONOpenAPIRenderer
+from rest_framework.schemas.openapi import SchemaGenerator
+
+SCHEMA_TITLE = "Canvas Gamification API"
+SCHEMA_DESCRIPTION = "All the available APIs"
+SCHEMA_VERSION = "1.0.0"
+
+
+def generate_schema():
+    """
+    Returns the OpenAPI schema of every endpoint of the api rendered as json
+    """
+    generator = SchemaGenerator(title=SCHEMA_TITLE, description=SCHEMA_DESCRIPTION, version=SCHEMA_VERSION)
+    return JSONOpenAPIRenderer().render(generator.get_schema(public=True))
+
+
+def write_schema(path=None):
+    content = generate_schema()
+    with open(path or settings.OPENAPI_SCHEMA_FILE, 'wb') as f:
+        f.write(content)
+    return content
+
+
+class SchemaArtifact:
+    """
+    Process-local copy of the schema and its ETag. It is read from OPENAPI_SCHEMA_FILE, written at deploy time by
+    the generate-openapi-schema command, or generated once when the file does not exist.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.content = None
+        self.etag = None
+
+    def _load(self):
+        path = settings.OPENAPI_SCHEMA_FILE
+        if settings.OPENAPI_SCHEMA_REGENERATE or not os.path.exists(path):
+            return generate_schema()
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def get(self):
+        """
+        Returns the schema and its strong ETag. The schema is generated again on every call when
+        OPENAPI_SCHEMA_REGENERATE is set, for development.
+        """
+        with self.lock:
+            if self.content is None or settings.OPENAPI_SCHEMA_REGENERATE:
+                self.content = self._load()
+                self.etag = '"{}"'.format(hashlib.sha1(self.content).hexdigest())
+            return self.content, self.etag
+
+    def clear(self):
+        with self.lock:
+            self.content = self.etag = None
+
+
+schema_artifact = SchemaArtifact()
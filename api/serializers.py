@@ -1,19 +1,45 @@
 from rest_framework import serializers
 
 from accounts.models import UserConsent, MyUser
-from course.models.models import Question, MultipleChoiceQuestion, QuestionCategory
+from course.models.models import Question, MultipleChoiceQuestion, QuestionCategory, QuestionStats
+from course.utils.category_stats import get_success_rate_by_category
+from course.utils.submissions import MAX_BULK_SUBMISSIONS
 from general.models import ContactUs
 from utils.recaptcha import validate_recaptcha
 
 
-class QuestionSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Only serializes the fields listed in the comma separated `fields` query parameter when it is given
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = request.query_params.get('fields') if request is not None else None
+        if fields:
+            requested = set(fields.split(','))
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+class QuestionStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = QuestionStats
+        fields = ['attempted', 'solved', 'partially_solved', 'total_submissions', 'success_rate',
+                  'mean_attempts_to_solve', 'first_try_success_rate']
+
+
+class QuestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    stats = QuestionStatsSerializer(read_only=True)
+
     class Meta:
         model = Question
-        fields = ['title', 'text', 'max_submission_allowed', 'time_created', 'time_modified', 'author', 'category',
-                  'difficulty', 'is_verified']
+        fields = ['id', 'title', 'text', 'max_submission_allowed', 'time_created', 'time_modified', 'author',
+                  'category', 'difficulty', 'is_verified', 'stats']
 
 
-class MultipleChoiceQuestionSerializer(serializers.ModelSerializer):
+class MultipleChoiceQuestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = MultipleChoiceQuestion
         fields = ['id', 'title', 'text', 'answer', 'max_submission_allowed', 'time_created', 'time_modified', 'author',
@@ -44,7 +70,7 @@ class ContactUsSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class QuestionCategorySerializer(serializers.ModelSerializer):
+class QuestionCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     numQuestions = serializers.SerializerMethodField('count_questions')
     avgSuccess = serializers.SerializerMethodField('get_avg_success')
     nextCategories = serializers.SerializerMethodField('next_categories_ids')
@@ -63,12 +89,47 @@ class QuestionCategorySerializer(serializers.ModelSerializer):
         fields = ['pk', 'name', 'description', 'parent', 'numQuestions', 'avgSuccess', 'nextCategories']
 
 
-class UserStatsSerializer(serializers.ModelSerializer):
+class UserStatsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     successRateByCategory = serializers.SerializerMethodField('success_rate_by_category')
 
     def success_rate_by_category(self, user):
-        return user.success_rate_by_category
+        question_counts = self.context.get('category_question_counts')
+        if question_counts is None:
+            return user.success_rate_by_category
+        return get_success_rate_by_category(user.category_stats.all(), question_counts)
 
     class Meta:
         model = MyUser
         fields = ['pk', 'successRateByCategory']
+
+
+class MultipleChoiceAnswerField(serializers.Field):
+    """
+    The key of the chosen answer, or the list of the chosen keys of a checkbox question
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            return data
+        if isinstance(data, list) and all(isinstance(key, str) for key in data):
+            # Stored the same way as the answers submitted with the html form
+            return str(data)
+        raise serializers.ValidationError('Expected a choice key or a list of choice keys.')
+
+    def to_representation(self, value):
+        return value
+
+
+class MultipleChoiceAnswerSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    answer = MultipleChoiceAnswerField()
+
+
+class BulkMultipleChoiceSubmissionSerializer(serializers.Serializer):
+    submissions = MultipleChoiceAnswerSerializer(many=True, allow_empty=False)
+
+    def validate_submissions(self, submissions):
+        if len(submissions) > MAX_BULK_SUBMISSIONS:
+            raise serializers.ValidationError(
+                'At most {} answers can be submitted at once.'.format(MAX_BULK_SUBMISSIONS))
+        return submissions
@@ -1 +1,25 @@
 # Create your tests here.
+import os
+import tempfile
+
+from django.test import TestCase
+
+from api.schema import schema_artifact, write_schema
+
+
+class OpenApiSchemaTest(TestCase):
+
+    def setUp(self):
+        schema_artifact.clear()
+        self.addCleanup(schema_artifact.clear)
+
+    def test_schema_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'openapi.json')
+            with self.settings(OPENAPI_SCHEMA_FILE=path):
+                write_schema()
+                response = self.client.get('/api/openapi')
+                self.assertIn('/api/questions/', response.json()['paths'])
+
+                os.remove(path)
+                self.assertEqual(self.client.get('/api/openapi', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
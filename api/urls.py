@@ -1,11 +1,11 @@
 from django.urls import path
 from django.views.generic import TemplateView
 from rest_framework.routers import DefaultRouter
-from rest_framework.schemas import get_schema_view
 from rest_framework.authtoken import views
 
 from api.views import QuestionViewSet, SampleMultipleChoiceQuestionViewSet, UserConsentViewSet, ContactUsViewSet, \
-    QuestionCategoryViewSet, UserStatsViewSet
+    QuestionCategoryViewSet, UserStatsViewSet, CourseGradebookViewSet, MultipleChoiceSubmissionViewSet, \
+    openapi_schema_view
 
 router = DefaultRouter()
 router.register(r'questions', QuestionViewSet, basename='question')
@@ -15,14 +15,13 @@ router.register(r'user-consent', UserConsentViewSet, basename='user_consent')
 router.register(r'contact-us', ContactUsViewSet, basename='contact_us')
 router.register(r'question-category', QuestionCategoryViewSet, basename='question-category')
 router.register(r'user-stats', UserStatsViewSet, basename='user-stats')
+router.register(r'course-gradebook', CourseGradebookViewSet, basename='course-gradebook')
+router.register(r'multiple-choice-submissions', MultipleChoiceSubmissionViewSet,
+                basename='multiple-choice-submissions')
 
 app_name = 'api'
 urlpatterns = [
-    path('openapi', get_schema_view(
-        title="Canvas Gamification API",
-        description="All the available APIs",
-        version="1.0.0",
-    ), name='openapi-schema'),
+    path('openapi', openapi_schema_view, name='openapi-schema'),
     path('docs/', TemplateView.as_view(
         template_name='api/docs.html',
         extra_context={'schema_url': 'api:openapi-schema'}
@@ -1,22 +1,43 @@
 # Create your views here.
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from rest_framework import viewsets, mixins
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from accounts.models import UserConsent, MyUser
+from api.mixins import ConditionalGetMixin, CachedListMixin
+from api.pagination import ApiCursorPagination, OptionalCursorPagination
+from api.schema import schema_artifact
 from api.permissions import TeacherAccessPermission, UserConsentPermission
 from api.serializers import QuestionSerializer, MultipleChoiceQuestionSerializer,\
-    UserConsentSerializer, ContactUsSerializer, QuestionCategorySerializer, UserStatsSerializer
-from course.models.models import Question, MultipleChoiceQuestion, QuestionCategory
+    UserConsentSerializer, ContactUsSerializer, QuestionCategorySerializer, UserStatsSerializer, \
+    BulkMultipleChoiceSubmissionSerializer
+from canvas.models import CanvasCourse, CanvasCourseRegistration
+from canvas.utils.gradebook import Gradebook
+from course.models.models import Question, MultipleChoiceQuestion, QuestionCategory, QuestionStats, CategoryStats, \
+    UserCategoryStats
+from course.exceptions import SubmissionException
+from course.utils.category_stats import get_category_question_counts
+from course.utils.submissions import submit_multiple_choice_answers
 
 
-class QuestionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Question.objects.all()
+class QuestionViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
+    # The serializer only reads fields of the base model, so the rows are not turned into their concrete classes
+    queryset = Question.objects.non_polymorphic().prefetch_related('stats').all()
     serializer_class = QuestionSerializer
     permission_classes = [TeacherAccessPermission, ]
+    pagination_class = ApiCursorPagination
+    cache_dependencies = [Question, QuestionStats]
 
 
-class SampleMultipleChoiceQuestionViewSet(viewsets.ModelViewSet):
+class SampleMultipleChoiceQuestionViewSet(ConditionalGetMixin, CachedListMixin, viewsets.ModelViewSet):
     queryset = MultipleChoiceQuestion.objects.filter(is_sample=True).all()
     serializer_class = MultipleChoiceQuestionSerializer
+    pagination_class = OptionalCursorPagination
+    cache_dependencies = [Question]
 
 
 class UserConsentViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
@@ -29,11 +50,81 @@ class ContactUsViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     serializer_class = ContactUsSerializer
 
 
-class QuestionCategoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = QuestionCategory.objects.all()
+class QuestionCategoryViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = QuestionCategory.objects.select_related('stats').prefetch_related('next_categories').all()
     serializer_class = QuestionCategorySerializer
+    pagination_class = OptionalCursorPagination
+    cache_dependencies = [QuestionCategory, CategoryStats]
 
 
-class UserStatsViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = MyUser.objects.all()
+class UserStatsViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = UserStatsSerializer
+    pagination_class = ApiCursorPagination
+    cache_dependencies = [MyUser, UserCategoryStats, CanvasCourseRegistration, Question]
+
+    def get_queryset(self):
+        users = MyUser.objects.prefetch_related('category_stats')
+        course_id = self.request.query_params.get('course')
+        if course_id is not None:
+            if not course_id.isdigit():
+                raise ValidationError({'course': 'A valid course id is required.'})
+            users = users.filter(canvascourseregistration__course_id=course_id)
+        return users
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['category_question_counts'] = get_category_question_counts()
+        return context
+
+
+class CourseGradebookViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated, ]
+
+    def retrieve(self, request, pk=None):
+        course = get_object_or_404(CanvasCourse, pk=pk)
+        if not course.has_edit_permission(request.user):
+            raise PermissionDenied()
+        return Response(Gradebook(course).to_dict())
+
+
+class MultipleChoiceSubmissionViewSet(viewsets.GenericViewSet):
+    """
+    Submit a batch of answers to multiple choice questions, for example the answers given offline, and get the
+    verdict of every answer in the same order
+    """
+    serializer_class = BulkMultipleChoiceSubmissionSerializer
+    permission_classes = [IsAuthenticated, ]
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        answers = [(item['question'], item['answer']) for item in serializer.validated_data['submissions']]
+        results = submit_multiple_choice_answers(request.user, answers)
+        return Response([
+            self.get_verdict(question_id, result) for (question_id, _), result in zip(answers, results)
+        ])
+
+    def get_verdict(self, question_id, result):
+        if isinstance(result, SubmissionException):
+            return {'question': question_id, 'accepted': False, 'error': str(result)}
+        if result.question.is_exam:
+            # The grades of exam questions are not shown to the students
+            return {'question': question_id, 'accepted': True, 'status': 'Received'}
+        return {
+            'question': question_id,
+            'accepted': True,
+            'status': result.status,
+            'grade': result.grade,
+            'tokens_received': result.tokens_received,
+        }
+
+
+def openapi_schema_view(request):
+    content, etag = schema_artifact.get()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/vnd.oai.openapi+json')
+        response['ETag'] = etag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -1,10 +1,13 @@
 from django.contrib import admin
 
 # Register your models here.
-from canvas.models import CanvasCourse, CanvasCourseRegistration, Event, TokenUseOption, TokenUse
+from canvas.models import CanvasCourse, CanvasCourseRegistration, Event, TokenUseOption, TokenUse, TokenBalance, \
+    TokenTransaction
 
 admin.site.register(CanvasCourse)
 admin.site.register(CanvasCourseRegistration)
 admin.site.register(Event)
 admin.site.register(TokenUseOption)
 admin.site.register(TokenUse)
+admin.site.register(TokenBalance)
+admin.site.register(TokenTransaction)
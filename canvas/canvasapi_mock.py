@@ -22,9 +22,9 @@ class Course(object):
 
     def get_users(self, **kwargs):
         return [
-            User(1, 'Firstname Lastname', '00000000'),
-            User(2, 'multiple student', '12345678'),
-            User(3, 'multiple student', '13579135')
+            User(1, 'Firstname Lastname', '00000000', 'student1@example.com'),
+            User(2, 'multiple student', '12345678', 'student2@example.com'),
+            User(3, 'multiple student', '13579135', 'student3@example.com')
         ]
 
     def submissions_bulk_update(self, **kwargs):
@@ -43,7 +43,8 @@ class Assignment(object):
 
 
 class User(object):
-    def __init__(self, id, name, student_id):
+    def __init__(self, id, name, student_id, email=None):
         self.id = id
         self.name = name
         self.sis_user_id = student_id
+        self.email = email
@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand
+
+from canvas.mock_server import CanvasServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the Canvas API to benchmark the website offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--port', type=int, default=8100, help='Port to listen on')
+        parser.add_argument('--students', type=int, default=100, help='Number of students in the roster')
+        parser.add_argument('--latency', type=float, default=0, help='Seconds added to every request')
+        parser.add_argument('--jitter', type=float, default=0, help='Maximum random seconds added on top of latency')
+        parser.add_argument('--max-per-page', type=int, default=100, help='Maximum page size of paginated lists')
+        parser.add_argument('--rate-limit', type=float, default=0,
+                            help='Requests per second allowed before throttling, 0 disables throttling')
+        parser.add_argument('--rate-limit-burst', type=int, default=700,
+                            help='Number of requests allowed in a burst before throttling')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        server = CanvasServer(
+            (options['host'], options['port']),
+            num_students=options['students'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            max_per_page=options['max_per_page'],
+            rate_limit=options['rate_limit'],
+            rate_limit_burst=options['rate_limit_burst'],
+            verbose=options['verbose'],
+        )
+        self.stdout.write('Canvas stand-in is running at {}, request stats at {}/__stats'.format(
+            server.url, server.url))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from canvas.utils.token_balance import rebuild_token_balances
+
+
+class Command(BaseCommand):
+    help = 'Verify the materialized token balances against the source data and rebuild the ones that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, default=None, help='Only verify the balances of this course id')
+        parser.add_argument('--user', type=int, default=None, help='Only verify the balances of this user id')
+        parser.add_argument('--check', action='store_true', help='Only report the mismatches without fixing them')
+
+    def handle(self, *args, **options):
+        mismatches = rebuild_token_balances(
+            user_id=options['user'],
+            course_id=options['course'],
+            commit=not options['check'],
+        )
+
+        for user_id, course_id, expected, actual in mismatches:
+            self.stdout.write('user {} course {}: expected {:.2f}, found {:.2f}'.format(
+                user_id, course_id, expected, actual))
+
+        self.stdout.write('{} balances {}'.format(len(mismatches), 'mismatched' if options['check'] else 'rebuilt'))
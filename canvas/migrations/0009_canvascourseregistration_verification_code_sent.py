@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canvas', '0008_event_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='canvascourseregistration',
+            name='verification_code_sent',
+            field=models.BooleanField(default=False),
+        ),
+    ]
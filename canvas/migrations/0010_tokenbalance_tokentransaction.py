@@ -0,0 +1,48 @@
+# Generated by Django 3.0.7 on 2026-10-19 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('course', '0011_auto_20201213_1913'),
+        ('canvas', '0009_canvascourseregistration_verification_code_sent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenTransaction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('Question', 'Question'), ('Token Use', 'Token Use'), ('Adjustment', 'Adjustment')], max_length=100)),
+                ('amount', models.FloatField()),
+                ('time_created', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_transactions', to='canvas.CanvasCourse')),
+                ('token_use', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='token_transactions', to='canvas.TokenUse')),
+                ('uqj', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='token_transactions', to='course.UserQuestionJunction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TokenBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tokens_received', models.FloatField(default=0)),
+                ('tokens_used', models.FloatField(default=0)),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='token_balances', to='canvas.CanvasCourse')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tokenbalance',
+            constraint=models.UniqueConstraint(fields=('user', 'course'), name='unique_token_balance'),
+        ),
+        migrations.AddConstraint(
+            model_name='tokenbalance',
+            constraint=models.UniqueConstraint(condition=models.Q(course__isnull=True), fields=('user',), name='unique_user_token_balance'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-19 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canvas', '0010_tokenbalance_tokentransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='canvascourseregistration',
+            name='verification_code_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.0.7 on 2026-10-19 12:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('canvas', '0011_canvascourseregistration_verification_code_sent_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20)),
+                ('minute', models.IntegerField(default=0)),
+                ('value', models.IntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_counters', to='canvas.Event')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExamActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.IntegerField()),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_activities', to='canvas.Event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_activities', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='examcounter',
+            constraint=models.UniqueConstraint(fields=('event', 'name', 'minute'), name='unique_exam_counter'),
+        ),
+        migrations.AddIndex(
+            model_name='examactivity',
+            index=models.Index(fields=['event', 'minute'], name='canvas_exam_event_i_bd8f49_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='examactivity',
+            constraint=models.UniqueConstraint(fields=('event', 'user'), name='unique_exam_activity'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.0.7 on 2026-10-19 14:05
+
+from django.db import migrations
+from django.db.models import Sum, F, FloatField
+
+
+def build_token_balances(apps, schema_editor):
+    UserQuestionJunction = apps.get_model('course', 'UserQuestionJunction')
+    TokenUse = apps.get_model('canvas', 'TokenUse')
+    Action = apps.get_model('general', 'Action')
+    TokenBalance = apps.get_model('canvas', 'TokenBalance')
+    TokenTransaction = apps.get_model('canvas', 'TokenTransaction')
+
+    balances = {}
+    received = UserQuestionJunction.objects.filter(question__event__count_for_tokens=True) \
+        .values_list('user_id', 'question__event__course_id') \
+        .annotate(total=Sum('tokens_received')) \
+        .order_by()
+    for user_id, course_id, total in received:
+        balances.setdefault((user_id, course_id), [0, 0])[0] = total or 0
+
+    used = TokenUse.objects.values_list('user_id', 'option__course_id') \
+        .annotate(total=Sum(F('option__tokens_required') * F('num_used'), output_field=FloatField())) \
+        .order_by()
+    for user_id, course_id, total in used:
+        balances.setdefault((user_id, course_id), [0, 0])[1] = total or 0
+
+    # The balance without a course holds the total token change of the actions of the user
+    actions = Action.objects.values_list('user_id').annotate(total=Sum('token_change')).order_by()
+    for user_id, total in actions:
+        balances[(user_id, None)] = [total or 0, 0]
+
+    # Balances created since the tables were added are already current
+    for key in TokenBalance.objects.values_list('user_id', 'course_id'):
+        balances.pop(key, None)
+
+    new_balances = []
+    adjustments = []
+    for (user_id, course_id), (tokens_received, tokens_used) in balances.items():
+        if tokens_received == 0 and tokens_used == 0:
+            continue
+        new_balances.append(TokenBalance(user_id=user_id, course_id=course_id, tokens_received=tokens_received,
+                                         tokens_used=tokens_used))
+        if course_id is not None:
+            adjustments.append(TokenTransaction(user_id=user_id, course_id=course_id, source='Adjustment',
+                                                amount=tokens_received - tokens_used))
+
+    TokenBalance.objects.bulk_create(new_balances, batch_size=500)
+    TokenTransaction.objects.bulk_create(adjustments, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canvas', '0012_examcounter_examactivity'),
+        ('course', '0016_categorystats_direct_questions'),
+        ('general', '0005_auto_20201120_1808'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_token_balances, migrations.RunPython.noop),
+    ]
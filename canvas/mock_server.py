@@ -0,0 +1,337 @@
+"""
+A local stand-in for the Canvas REST API.
+
+It implements the endpoints used by this project (courses, users, assignments, assignment groups and
+grade updates) on top of an in-memory state so registration, token use and grade sync can be benchmarked
+offline with the real canvasapi client. Latency, pagination and throttling can be configured to behave
+like a real Canvas instance.
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import urlparse, parse_qs
+
+API_PREFIX = '/api/v1'
+RATE_LIMIT_EXCEEDED = '403 Forbidden (Rate Limit Exceeded)'
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` requests per second with bursts of up to `burst` requests
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.remaining = burst
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return True
+
+        with self.lock:
+            now = time.monotonic()
+            self.remaining = min(self.burst, self.remaining + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+
+            if self.remaining < 1:
+                return False
+            self.remaining -= 1
+            return True
+
+
+class CanvasState:
+    """
+    In-memory data of the stand-in server. Every course shares the same generated roster.
+    """
+
+    def __init__(self, num_students=100):
+        self.lock = threading.Lock()
+        self.ids = count(1000)
+        self.users = [self._make_user(i) for i in range(1, num_students + 1)]
+        self.users_by_id = {user['id']: user for user in self.users}
+        self.assignments = {}
+        self.assignment_groups = {}
+        self.grades = {}
+        self.request_counts = Counter()
+        self.grades_posted = 0
+
+    @staticmethod
+    def _make_user(i):
+        return {
+            'id': i,
+            'name': 'Student {}'.format(i),
+            'sortable_name': '{}, Student'.format(i),
+            'short_name': 'Student {}'.format(i),
+            'sis_user_id': '{:08d}'.format(i),
+            'login_id': 'student{}@example.com'.format(i),
+            'email': 'student{}@example.com'.format(i),
+        }
+
+    def next_id(self):
+        with self.lock:
+            return next(self.ids)
+
+    def get_course(self, course_id):
+        return {
+            'id': course_id,
+            'name': 'Canvas Stand-in Course {}'.format(course_id),
+            'course_code': 'STANDIN{}'.format(course_id),
+            'workflow_state': 'available',
+        }
+
+    def create_assignment(self, course_id, data):
+        assignment = {
+            'id': self.next_id(),
+            'course_id': course_id,
+            'name': data.get('name', ''),
+            'points_possible': float(data.get('points_possible', 0) or 0),
+            'assignment_group_id': int(data['assignment_group_id']) if data.get('assignment_group_id') else None,
+            'published': data.get('published', 'False') in ('True', 'true', '1'),
+        }
+        with self.lock:
+            self.assignments[assignment['id']] = assignment
+        return assignment
+
+    def create_assignment_group(self, course_id, data):
+        assignment_group = {
+            'id': self.next_id(),
+            'course_id': course_id,
+            'name': data.get('name', ''),
+        }
+        with self.lock:
+            self.assignment_groups[assignment_group['id']] = assignment_group
+        return assignment_group
+
+    def update_grades(self, assignment_id, grade_data):
+        with self.lock:
+            grades = self.grades.setdefault(assignment_id, {})
+            for user_id, data in grade_data.items():
+                grades[user_id] = data.get('posted_grade')
+            self.grades_posted += len(grade_data)
+
+        return {
+            'id': self.next_id(),
+            'context_type': 'Course',
+            'tag': 'submissions_update',
+            'completion': 100,
+            'workflow_state': 'completed',
+        }
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': dict(self.request_counts),
+                'total_requests': sum(self.request_counts.values()),
+                'grades_posted': self.grades_posted,
+                'assignments': len(self.assignments),
+                'assignment_groups': len(self.assignment_groups),
+            }
+
+
+def parse_nested_params(params):
+    """
+    Turn rails style form keys like grade_data[12][posted_grade] into nested dicts
+    """
+    result = {}
+    for key, values in params.items():
+        parts = re.findall(r'[^\[\]]+', key)
+        if not parts:
+            continue
+        node = result
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = values[-1]
+    return result
+
+
+class CanvasRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'CanvasStandIn/1.0'
+
+    routes = [
+        ('GET', r'/courses/(?P<course_id>\d+)', 'get_course'),
+        ('GET', r'/courses/(?P<course_id>\d+)/users', 'get_users'),
+        ('GET', r'/courses/(?P<course_id>\d+)/search_users', 'get_users'),
+        ('GET', r'/courses/(?P<course_id>\d+)/users/(?P<user_id>\d+)', 'get_user'),
+        ('GET', r'/courses/(?P<course_id>\d+)/assignments/(?P<assignment_id>\d+)', 'get_assignment'),
+        ('POST', r'/courses/(?P<course_id>\d+)/assignments', 'create_assignment'),
+        ('GET', r'/courses/(?P<course_id>\d+)/assignment_groups', 'get_assignment_groups'),
+        ('POST', r'/courses/(?P<course_id>\d+)/assignment_groups', 'create_assignment_group'),
+        ('POST', r'/courses/(?P<course_id>\d+)/assignments/(?P<assignment_id>\d+)/submissions/update_grades',
+         'update_assignment_grades'),
+        ('POST', r'/courses/(?P<course_id>\d+)/submissions/update_grades', 'update_course_grades'),
+        ('GET', r'/progress/(?P<progress_id>\d+)', 'get_progress'),
+    ]
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        self.query = parse_qs(url.query)
+        self.data = self.query
+        if method in ('POST', 'PUT'):
+            length = int(self.headers.get('Content-Length', 0) or 0)
+            self.data = parse_qs(self.rfile.read(length).decode('utf-8'))
+
+        if url.path == '/__stats':
+            return self.send_json(self.server.state.stats())
+
+        if not url.path.startswith(API_PREFIX):
+            return self.send_error_json(404, 'The specified resource does not exist.')
+        path = url.path[len(API_PREFIX):].rstrip('/')
+        self.api_path = path
+
+        for route_method, pattern, handler_name in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self.server.state.lock:
+                    self.server.state.request_counts[handler_name] += 1
+                if not self.server.rate_limiter.acquire():
+                    return self.send_rate_limited()
+                self.simulate_latency()
+                kwargs = {key: int(value) for key, value in match.groupdict().items()}
+                return getattr(self, handler_name)(**kwargs)
+
+        self.send_error_json(404, 'The specified resource does not exist.')
+
+    def simulate_latency(self):
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json({'errors': [{'message': message}]}, status=status)
+
+    def send_rate_limited(self):
+        body = RATE_LIMIT_EXCEEDED.encode('utf-8')
+        self.send_response(403)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Rate-Limit-Remaining', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def page_links(self, page, per_page, total):
+        base = 'http://{}{}{}'.format(self.headers.get('Host'), API_PREFIX, self.api_path)
+        last_page = max(1, (total + per_page - 1) // per_page)
+        links = {
+            'current': page,
+            'first': 1,
+            'last': last_page,
+        }
+        if page > 1:
+            links['prev'] = page - 1
+        if page < last_page:
+            links['next'] = page + 1
+        return ','.join(
+            '<{}?page={}&per_page={}>; rel="{}"'.format(base, target, per_page, rel) for rel, target in links.items()
+        )
+
+    def get_course(self, course_id):
+        self.send_json(self.server.state.get_course(course_id))
+
+    def get_users(self, course_id):
+        users = self.server.state.users
+        page = int(self.query.get('page', ['1'])[0])
+        per_page = min(int(self.query.get('per_page', ['10'])[0]), self.server.max_per_page)
+
+        start = (page - 1) * per_page
+        self.send_json(users[start:start + per_page], headers={
+            'Link': self.page_links(page, per_page, len(users)),
+        })
+
+    def get_user(self, course_id, user_id):
+        user = self.server.state.users_by_id.get(user_id)
+        if user is None:
+            return self.send_error_json(404, 'The specified resource does not exist.')
+        self.send_json(user)
+
+    def get_assignment(self, course_id, assignment_id):
+        assignment = self.server.state.assignments.get(assignment_id)
+        if assignment is None:
+            return self.send_error_json(404, 'The specified resource does not exist.')
+        self.send_json(assignment)
+
+    def create_assignment(self, course_id):
+        data = parse_nested_params(self.data).get('assignment', {})
+        self.send_json(self.server.state.create_assignment(course_id, data))
+
+    def get_assignment_groups(self, course_id):
+        assignment_groups = self.server.state.assignment_groups.values()
+        self.send_json([group for group in assignment_groups if group['course_id'] == course_id])
+
+    def create_assignment_group(self, course_id):
+        data = parse_nested_params(self.data)
+        self.send_json(self.server.state.create_assignment_group(course_id, data))
+
+    def update_assignment_grades(self, course_id, assignment_id):
+        grade_data = parse_nested_params(self.data).get('grade_data', {})
+        self.send_json(self.server.state.update_grades(assignment_id, grade_data))
+
+    def update_course_grades(self, course_id):
+        grade_data = parse_nested_params(self.data).get('grade_data', {})
+        self.send_json(self.server.state.update_grades(None, grade_data))
+
+    def get_progress(self, progress_id):
+        self.send_json({
+            'id': progress_id,
+            'completion': 100,
+            'workflow_state': 'completed',
+        })
+
+
+class CanvasServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, num_students=100, latency=0, jitter=0, max_per_page=100, rate_limit=0,
+                 rate_limit_burst=700, verbose=False):
+        super().__init__(address, CanvasRequestHandler)
+        self.state = CanvasState(num_students)
+        self.latency = latency
+        self.jitter = jitter
+        self.max_per_page = max_per_page
+        self.rate_limiter = RateLimiter(rate_limit, rate_limit_burst)
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+
+def start_server(host='127.0.0.1', port=0, **kwargs):
+    """
+    Start the stand-in server in a background thread and return it. Call shutdown() on it when finished.
+    """
+    server = CanvasServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -1,12 +1,18 @@
 import canvasapi
+from django.conf import settings
 from django.db import models
-from django.db.models import Sum, F, FloatField
+from django.db.models.signals import post_save, post_delete
 from django.utils import timezone
+from django.utils.functional import cached_property
 from fuzzywuzzy import process
 
 from accounts.models import MyUser
 from canvas import canvasapi_mock
+from canvas.utils.registration import is_registered, invalidate_registration
+from canvas.utils.token_balance import read_token_balance, rebuild_token_balances, \
+    rebuild_deleted_token_use_balance
 from canvas.utils.token_use import get_token_use
+from utils.request_cache import memoize
 
 
 class CanvasCourse(models.Model):
@@ -108,10 +114,10 @@ class CanvasCourse(models.Model):
     def is_registered(self, user):
         if user.is_anonymous:
             return False
-        return self.canvascourseregistration_set.filter(user=user, is_verified=True, is_blocked=False).exists()
+        return memoize(('course_registered', self.pk, user.pk), lambda: is_registered(self.pk, user.pk))
 
     def is_instructor(self, user):
-        return self.instructor == user
+        return self.instructor_id is not None and self.instructor_id == user.pk
 
     def has_view_permission(self, user):
         return user.is_teacher or self.is_instructor(user) or self.is_registered(user)
@@ -140,6 +146,8 @@ class CanvasCourseRegistration(models.Model):
     is_blocked = models.BooleanField(default=False, db_index=True)
 
     verification_code = models.IntegerField(default=random_verification_code)
+    verification_code_sent = models.BooleanField(default=False)
+    verification_code_sent_at = models.DateTimeField(null=True, blank=True)
     verification_attempts = models.IntegerField(default=3)
 
     class Meta:
@@ -162,6 +170,17 @@ class CanvasCourseRegistration(models.Model):
                 'posted_grade': self.verification_code,
             }
         })
+        self.verification_code_sent = True
+        self.verification_code_sent_at = timezone.now()
+        self.save()
+
+    @property
+    def can_resend_verification_code(self):
+        if self.verification_code_sent_at is None:
+            return True
+        resend_time = self.verification_code_sent_at + timezone.timedelta(
+            seconds=settings.VERIFICATION_CODE_RESEND_SECONDS)
+        return resend_time <= timezone.now()
 
     def set_canvas_user(self, canvas_user):
         self.canvas_user_id = canvas_user.id
@@ -181,22 +200,21 @@ class CanvasCourseRegistration(models.Model):
 
         return False
 
+    @cached_property
+    def token_balance(self):
+        return read_token_balance(self.user, self.course)
+
     @property
     def total_tokens_received(self):
-        event_ids = [x['id'] for x in self.course.events.filter(count_for_tokens=True).values('id')]
-        return self.user.question_junctions.filter(question__event_id__in=event_ids) \
-                   .aggregate(Sum('tokens_received'))['tokens_received__sum'] or 0
+        return self.token_balance.tokens_received
 
     @property
     def available_tokens(self):
-        tokens_used = self.user.token_uses.filter(option__course=self.course). \
-            aggregate(available_tokens=Sum(F('option__tokens_required') * F('num_used'), output_field=FloatField()))[
-            'available_tokens']
+        return self.token_balance.available_tokens
 
-        if not tokens_used:
-            tokens_used = 0
 
-        return self.total_tokens_received - tokens_used
+post_save.connect(invalidate_registration, sender=CanvasCourseRegistration)
+post_delete.connect(invalidate_registration, sender=CanvasCourseRegistration)
 
 
 EVENT_TYPE_CHOICES = [
@@ -241,6 +259,10 @@ class Event(models.Model):
         return "Open"
 
     def has_view_permission(self, user):
+        return memoize(('event_view_permission', self.course_id, user.pk, self.pk),
+                       lambda: self._has_view_permission(user))
+
+    def _has_view_permission(self, user):
         if self.course.is_instructor(user) or user.is_teacher:
             return True
         return self.is_open and self.course.is_registered(user)
@@ -260,6 +282,13 @@ class Event(models.Model):
     def is_exam_and_open(self):
         return self.is_exam and self.is_open
 
+    def save(self, *args, **kwargs):
+        count_for_tokens_changed = self.pk is not None and \
+            Event.objects.filter(pk=self.pk).exclude(count_for_tokens=self.count_for_tokens).exists()
+        super().save(*args, **kwargs)
+        if count_for_tokens_changed:
+            rebuild_token_balances(course_id=self.course_id)
+
 
 class TokenUseOption(models.Model):
     course = models.ForeignKey(CanvasCourse, related_name='token_use_options', on_delete=models.CASCADE)
@@ -284,7 +313,11 @@ class TokenUseOption(models.Model):
 
     def save(self, *args, **kwargs):
         self.create_assignment()
+        tokens_required_changed = self.pk is not None and \
+            TokenUseOption.objects.filter(pk=self.pk).exclude(tokens_required=self.tokens_required).exists()
         super().save(*args, **kwargs)
+        if tokens_required_changed:
+            rebuild_token_balances(course_id=self.course_id)
 
 
 class TokenUse(models.Model):
@@ -292,8 +325,9 @@ class TokenUse(models.Model):
     user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='token_uses')
     num_used = models.IntegerField(default=0)
 
-    def apply(self):
-        course_reg = CanvasCourseRegistration.objects.get(user=self.user, course=self.option.course)
+    def apply(self, course_reg=None):
+        if course_reg is None:
+            course_reg = CanvasCourseRegistration.objects.get(user=self.user, course=self.option.course)
         self.option.course.course.submissions_bulk_update(grade_data={
             course_reg.canvas_user_id: {
                 'posted_grade': self.option.points_given * self.num_used,
@@ -307,3 +341,84 @@ class TokenUse(models.Model):
                 'posted_grade': 0,
             }
         })
+
+
+post_delete.connect(rebuild_deleted_token_use_balance, sender=TokenUse)
+
+
+class TokenBalance(models.Model):
+    """
+    Materialized token balance of a user in a course, kept in sync with the TokenTransaction ledger.
+    The balance without a course holds the total token change of the user's actions.
+    """
+    user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='token_balances')
+    course = models.ForeignKey(CanvasCourse, on_delete=models.CASCADE, related_name='token_balances', null=True,
+                               blank=True)
+    tokens_received = models.FloatField(default=0)
+    tokens_used = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'course'], name='unique_token_balance'),
+            models.UniqueConstraint(fields=['user'], condition=models.Q(course__isnull=True),
+                                    name='unique_user_token_balance'),
+        ]
+
+    @property
+    def available_tokens(self):
+        return self.tokens_received - self.tokens_used
+
+
+class TokenTransaction(models.Model):
+    QUESTION = 'Question'
+    TOKEN_USE = 'Token Use'
+    ADJUSTMENT = 'Adjustment'
+
+    SOURCE_CHOICES = [
+        (QUESTION, QUESTION),
+        (TOKEN_USE, TOKEN_USE),
+        (ADJUSTMENT, ADJUSTMENT),
+    ]
+
+    user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='token_transactions')
+    course = models.ForeignKey(CanvasCourse, on_delete=models.CASCADE, related_name='token_transactions')
+    source = models.CharField(max_length=100, choices=SOURCE_CHOICES)
+    amount = models.FloatField()
+    uqj = models.ForeignKey('course.UserQuestionJunction', on_delete=models.SET_NULL, null=True, blank=True,
+                            related_name='token_transactions')
+    token_use = models.ForeignKey(TokenUse, on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='token_transactions')
+    time_created = models.DateTimeField(auto_now_add=True)
+
+
+class ExamCounter(models.Model):
+    """
+    Live counter of an exam shown on its dashboard, updated once the submissions feeding it are committed.
+    Per minute counters are stored under the minute since the epoch, the other counters under minute 0.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='exam_counters')
+    name = models.CharField(max_length=20)
+    minute = models.IntegerField(default=0)
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'name', 'minute'], name='unique_exam_counter'),
+        ]
+
+
+class ExamActivity(models.Model):
+    """
+    Last minute a student viewed a question of an exam or submitted to it
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='exam_activities')
+    user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='exam_activities')
+    minute = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'user'], name='unique_exam_activity'),
+        ]
+        indexes = [
+            models.Index(fields=['event', 'minute']),
+        ]
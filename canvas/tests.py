@@ -1,13 +1,31 @@
-from django.test import TestCase
+from importlib import import_module
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
 # Create your tests here.
 from django.utils import timezone
 
-from canvas.models import CanvasCourse
+from accounts.models import MyUser
+from canvas.mock_server import start_server
+from canvas.models import CanvasCourse, CanvasCourseRegistration, Event, TokenUseOption, TokenBalance
+from canvas.utils.exam_dashboard import get_exam_dashboard, record_exam_activity
+from canvas.utils.gradebook import Gradebook
+from canvas.utils.registration import bulk_register_roster
+from canvas.utils.token_balance import get_token_balance, rebuild_token_balances
+from canvas.utils.token_use import update_token_use, TokenUseException
+from course.models.models import QuestionCategory, MultipleChoiceSubmission
+from course.utils.utils import create_multiple_choice_question, get_token_values, get_user_question_junction
+from general.models import Action
 
 
 class MockCourseTestCase(TestCase):
 
     def setUp(self) -> None:
+        cache.clear()
         self.course = CanvasCourse(
             mock=True,
             name="Test",
@@ -33,3 +51,387 @@ class MockCourseTestCase(TestCase):
 
         self.assertEqual(self.course.course.attributes.get('name'), 'Mock Course')
         self.assertEqual(self.course.guess_user('firstname lastname')[0], self.course.course.get_users()[0].name)
+
+
+class BulkRegistrationTestCase(MockCourseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        MyUser.objects.create_user("student1", "student1@example.com", "aaaaaaaa")
+        MyUser.objects.create_user("student2", "Student2@example.com", "aaaaaaaa")
+
+    def test_bulk_register_roster(self):
+        num_registered, num_sent, num_unmatched = bulk_register_roster(self.course)
+
+        self.assertEqual(num_registered, 2)
+        self.assertEqual(num_sent, 2)
+        self.assertEqual(num_unmatched, 1)
+
+        course_reg = self.course.canvascourseregistration_set.get(user__username="student1")
+        self.assertEqual(course_reg.canvas_user_id, 1)
+        self.assertTrue(course_reg.verification_code_sent)
+        self.assertFalse(course_reg.is_verified)
+
+        self.assertEqual(bulk_register_roster(self.course), (0, 0, 1))
+
+
+class VerificationResendTestCase(MockCourseTestCase):
+
+    def test_resend_verification_code(self):
+        user = MyUser.objects.create_user("student1", "student1@example.com", "aaaaaaaa")
+        course_reg = CanvasCourseRegistration(course=self.course, user=user, canvas_user_id=1)
+        course_reg.save()
+        self.client.login(username="student1", password="aaaaaaaa")
+        url = reverse('canvas:course_register', args=[self.course.pk])
+
+        self.client.get(url)
+        course_reg.refresh_from_db()
+        sent_at = course_reg.verification_code_sent_at
+        self.assertIsNotNone(sent_at)
+
+        self.client.get(url)
+        self.assertContains(self.client.post(url, {'resend': ''}), 'Please wait')
+        course_reg.refresh_from_db()
+        self.assertEqual(course_reg.verification_code_sent_at, sent_at)
+
+        course_reg.verification_code_sent_at -= timezone.timedelta(hours=1)
+        course_reg.save()
+        self.client.post(url, {'resend': ''})
+        course_reg.refresh_from_db()
+        self.assertGreater(course_reg.verification_code_sent_at, sent_at)
+
+
+class CanvasStandInTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.server = start_server(num_students=25, max_per_page=10)
+        self.course = CanvasCourse(
+            name="Test",
+            url=self.server.url,
+            course_id=1,
+            token="test token",
+
+            allow_registration=True,
+            visible_to_students=True,
+            start_date=timezone.now(),
+            end_date=timezone.now() + timezone.timedelta(days=10),
+
+            verification_assignment_group_name="test",
+            verification_assignment_name="test",
+            bonus_assignment_group_name="test",
+        )
+        self.course.save()
+        MyUser.objects.create_user("student1", "student1@example.com", "aaaaaaaa")
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_course(self):
+        self.assertEqual(self.course.canvas_course_name, 'Canvas Stand-in Course 1')
+        self.assertEqual(len(list(self.course.course.get_users())), 25)
+        self.assertEqual(self.course.get_user(student_id='00000025').id, 25)
+
+    def test_bulk_register_roster(self):
+        self.assertEqual(bulk_register_roster(self.course), (1, 1, 24))
+
+        stats = self.server.state.stats()
+        self.assertEqual(stats['requests']['get_users'], 3)
+        self.assertEqual(stats['requests']['update_assignment_grades'], 1)
+        self.assertEqual(stats['grades_posted'], 1)
+
+
+class TokenUseTestCase(MockCourseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = MyUser.objects.create_user("student1", "student1@example.com", "aaaaaaaa")
+        CanvasCourseRegistration(course=self.course, user=self.user, canvas_user_id=1, is_verified=True).save()
+
+        event = Event(
+            name="test_event",
+            course=self.course,
+            count_for_tokens=True,
+            start_date=timezone.now(),
+            end_date=timezone.now() + timezone.timedelta(days=10),
+        )
+        event.save()
+        create_multiple_choice_question(
+            title="title",
+            text="text",
+            answer="a",
+            author=self.user,
+            category=QuestionCategory.objects.create(name="category", description="category"),
+            difficulty="EASY",
+            is_verified=True,
+            choices={'a': 'a', 'b': 'b'},
+            visible_distractor_count=1,
+            event=event,
+        )
+        self.user.question_junctions.update(tokens_received=10)
+
+        self.option1 = TokenUseOption(course=self.course, tokens_required=3, points_given=1, maximum_number_of_use=2,
+                                      assignment_name="option1")
+        self.option1.save()
+        self.option2 = TokenUseOption(course=self.course, tokens_required=4, points_given=1, maximum_number_of_use=2,
+                                      assignment_name="option2")
+        self.option2.save()
+
+    def test_update_token_use(self):
+        update_token_use(self.user, self.course, {self.option1.id: 2, self.option2.id: 1})
+        self.assertEqual(self.user.token_uses.get(option=self.option1).num_used, 2)
+        self.assertEqual(self.user.token_uses.get(option=self.option2).num_used, 1)
+
+        update_token_use(self.user, self.course, {self.option1.id: 0, self.option2.id: 1})
+        self.assertEqual(self.user.token_uses.get(option=self.option1).num_used, 0)
+        self.assertEqual(self.user.token_uses.count(), 2)
+
+    def test_invalid_token_use(self):
+        invalid_data = [
+            {self.option1.id: 2, self.option2.id: 2},
+            {self.option1.id: 3},
+            {self.option1.id: -1},
+            {self.option1.id + self.option2.id: 1},
+        ]
+        for data in invalid_data:
+            with self.assertRaises(TokenUseException):
+                update_token_use(self.user, self.course, data)
+        self.assertFalse(self.user.token_uses.exists())
+
+
+class TokenBalanceTestCase(TokenUseTestCase):
+
+    def assertBalance(self, available_tokens):
+        balance = get_token_balance(self.user, self.course)
+        ledger_total = self.user.token_transactions.filter(course=self.course).aggregate(Sum('amount'))['amount__sum']
+        self.assertAlmostEqual(balance.available_tokens, available_tokens)
+        self.assertAlmostEqual(ledger_total, available_tokens)
+
+    def test_token_use_balance(self):
+        self.assertBalance(10)
+
+        update_token_use(self.user, self.course, {self.option1.id: 2})
+        self.assertBalance(4)
+
+        update_token_use(self.user, self.course, {self.option1.id: 1, self.option2.id: 1})
+        self.assertBalance(3)
+        self.assertEqual(CanvasCourseRegistration.objects.get(user=self.user).available_tokens, 3)
+
+    def test_submission_balance(self):
+        self.assertBalance(10)
+
+        self.user.question_junctions.update(tokens_received=0)
+        self.assertEqual(len(rebuild_token_balances(course_id=self.course.id)), 1)
+        self.assertBalance(0)
+        self.assertEqual(rebuild_token_balances(course_id=self.course.id), [])
+
+        submission = MultipleChoiceSubmission(uqj=self.user.question_junctions.get(), answer='a')
+        submission.save()
+        self.assertBalance(1)
+        self.assertEqual(self.user.tokens, 1)
+        self.assertEqual(rebuild_token_balances(), [])
+
+    def test_token_use_option_change(self):
+        update_token_use(self.user, self.course, {self.option1.id: 2})
+        self.assertBalance(4)
+
+        self.option1.tokens_required = 2
+        self.option1.save()
+        self.assertBalance(6)
+
+    def test_question_delete(self):
+        self.assertBalance(10)
+        self.user.question_junctions.get().question.delete()
+        self.assertBalance(0)
+
+    def test_question_event_change(self):
+        self.assertBalance(10)
+        event = Event.objects.create(name="other event", course=self.course, count_for_tokens=False,
+                                     start_date=timezone.now(), end_date=timezone.now() + timezone.timedelta(days=10))
+        question = self.user.question_junctions.get().question
+        question.event = event
+        question.save()
+        self.assertBalance(0)
+
+    def test_migrated_balance(self):
+        Action.objects.create(user=self.user, description="test", token_change=2, status=Action.COMPLETE)
+        self.assertFalse(TokenBalance.objects.exists())
+
+        import_module('canvas.migrations.0013_backfill_token_balances').build_token_balances(apps, None)
+        submission_total = self.user.question_junctions.aggregate(Sum('tokens_received'))['tokens_received__sum']
+        self.assertEqual(CanvasCourseRegistration.objects.get(user=self.user).available_tokens, submission_total)
+        self.assertBalance(submission_total)
+        self.assertEqual(self.user.tokens, 2)
+        self.assertEqual(rebuild_token_balances(), [])
+
+
+class TokenUseDeletionTestCase(TransactionTestCase):
+    # The balance is rebuilt when the deletion is committed, which a TestCase never does
+
+    def setUp(self) -> None:
+        self.user = MyUser.objects.create_user("student1", "student1@example.com", "aaaaaaaa")
+        self.course = CanvasCourse.objects.create(
+            mock=True, name="Test", url="http://canvas.ubc.ca", course_id=1, token="test token",
+            allow_registration=True, visible_to_students=True, start_date=timezone.now(),
+            end_date=timezone.now() + timezone.timedelta(days=10), verification_assignment_group_name="test",
+            verification_assignment_name="test", bonus_assignment_group_name="test",
+        )
+        CanvasCourseRegistration(course=self.course, user=self.user, canvas_user_id=1, is_verified=True).save()
+        event = Event.objects.create(name="test_event", course=self.course, count_for_tokens=True,
+                                     start_date=timezone.now(), end_date=timezone.now() + timezone.timedelta(days=10))
+        create_multiple_choice_question(
+            title="title", text="text", answer="a", author=self.user, category=None, difficulty="EASY",
+            is_verified=True, choices={'a': 'a', 'b': 'b'}, visible_distractor_count=1, event=event,
+        )
+        self.user.question_junctions.update(tokens_received=10)
+        self.option = TokenUseOption(course=self.course, tokens_required=3, points_given=1, maximum_number_of_use=2,
+                                     assignment_name="option")
+        self.option.save()
+
+    def test_token_use_delete(self):
+        update_token_use(self.user, self.course, {self.option.id: 2})
+        self.assertEqual(get_token_balance(self.user, self.course).available_tokens, 4)
+
+        self.user.token_uses.get().delete()
+        self.assertEqual(get_token_balance(self.user, self.course).available_tokens, 10)
+        self.assertEqual(rebuild_token_balances(), [])
+
+
+class GradebookTestCase(TokenUseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        user = MyUser.objects.create_user("student2", "student2@example.com", "aaaaaaaa")
+        CanvasCourseRegistration(course=self.course, user=user, canvas_user_id=2, is_verified=True).save()
+        user.question_junctions.update(tokens_received=0.5)
+
+    def test_gradebook(self):
+        get_token_values()
+        with self.assertNumQueries(4):
+            gradebook = Gradebook(self.course)
+
+        event = self.course.events.get()
+        self.assertEqual([user.username for user, grades in gradebook.rows()], ['student1', 'student2'])
+        self.assertEqual(gradebook.get_formatted_grade(gradebook.users[1], event), '50.00%')
+        self.assertEqual(list(gradebook.iter_csv())[2], 'student2,,50.0\r\n')
+
+    def test_gradebook_view(self):
+        teacher = MyUser.objects.create_user("teacher", "teacher@example.com", "aaaaaaaa", role="Teacher")
+        self.client.force_login(teacher)
+
+        response = self.client.get('/canvas/{}/gradebook?export=csv'.format(self.course.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content).decode().count('\r\n'), 3)
+
+    def test_course_view(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get('/canvas/{}'.format(self.course.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '1000.00%')
+
+
+class EventProblemSetTestCase(TokenUseTestCase):
+
+    def test_event_problem_set_queries(self):
+        event = self.course.events.get()
+        self.client.force_login(self.user)
+        get_token_values()
+        self.client.get('/canvas/event/{}/problem-set'.format(event.pk))
+
+        for i in range(5):
+            create_multiple_choice_question(
+                title="title",
+                text="text",
+                answer="a",
+                author=self.user,
+                category=QuestionCategory.objects.get(),
+                difficulty="EASY",
+                is_verified=True,
+                choices={'a': 'a', 'b': 'b'},
+                visible_distractor_count=1,
+                event=event,
+            )
+        get_token_values()
+
+        # session, user, event, junctions and the navbar token balance, the registration state is cached
+        with self.assertNumQueries(5):
+            response = self.client.get('/canvas/event/{}/problem-set'.format(event.pk))
+        self.assertEqual(len(response.context['uqjs']), 6)
+        self.assertContains(response, 'multiple choice question')
+
+
+class RegistrationCacheTestCase(MockCourseTestCase):
+
+    def test_registration_cache(self):
+        user = MyUser.objects.create_user("student1", "student1@example.com", "aaaaaaaa")
+        self.assertFalse(self.course.is_registered(user))
+
+        course_reg = CanvasCourseRegistration(course=self.course, user=user, canvas_user_id=1)
+        course_reg.save()
+        self.assertFalse(self.course.is_registered(user))
+        with self.assertNumQueries(0):
+            self.assertFalse(self.course.is_registered(user))
+
+        self.assertTrue(course_reg.check_verification_code(course_reg.verification_code))
+        self.assertTrue(self.course.is_registered(user))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.course.is_registered(user))
+
+        course_reg.delete()
+        self.assertFalse(self.course.is_registered(user))
+
+
+class ExamDashboardTestCase(TransactionTestCase):
+    # The counters are updated when the submissions are committed, which a TestCase never does
+
+    def setUp(self) -> None:
+        self.user = MyUser.objects.create_user("student1", "student1@example.com", "aaaaaaaa")
+        course = CanvasCourse.objects.create(
+            mock=True, name="Test", url="http://canvas.ubc.ca", course_id=1, token="test token",
+            allow_registration=True, visible_to_students=True, start_date=timezone.now(),
+            end_date=timezone.now() + timezone.timedelta(days=10), verification_assignment_group_name="test",
+            verification_assignment_name="test", bonus_assignment_group_name="test",
+        )
+        CanvasCourseRegistration(course=course, user=self.user, canvas_user_id=1, is_verified=True).save()
+        self.event = Event.objects.create(name="test_event", type='EXAM', course=course, count_for_tokens=True,
+                                          start_date=timezone.now(),
+                                          end_date=timezone.now() + timezone.timedelta(days=10))
+        self.question = create_multiple_choice_question(
+            title="title", text="text", answer="a", author=self.user, category=None, difficulty="EASY",
+            is_verified=True, choices={'a': 'a', 'b': 'b'}, visible_distractor_count=1, event=self.event,
+        )
+
+    def test_exam_dashboard(self):
+        uqj = get_user_question_junction(self.user, self.question)
+        MultipleChoiceSubmission(uqj=uqj, answer='b').save()
+        MultipleChoiceSubmission(uqj=uqj, answer=self.question.answer).save()
+        # The submissions already recorded the minute, the update matches no row and nothing is inserted
+        with self.assertNumQueries(2):
+            record_exam_activity(self.event.pk, self.user.pk)
+
+        with self.assertNumQueries(3):
+            dashboard = get_exam_dashboard(self.event)
+        self.assertEqual(dashboard['submissions_per_minute'][-1]['count'], 2)
+        self.assertEqual(dashboard['active_students'], 1)
+        self.assertEqual(dashboard['grading_queue'], 0)
+        stats = next(stats for stats in dashboard['questions'] if stats['pk'] == self.question.pk)
+        self.assertEqual((stats['attempted'], stats['solved']), (1, 1))
+
+        self.client.login(username='student1', password='aaaaaaaa')
+        self.assertEqual(self.client.get(reverse('canvas:exam_dashboard', args=[self.event.pk])).status_code, 403)
+
+        self.user.role = 'Teacher'
+        self.user.save()
+        self.assertContains(self.client.get(reverse('canvas:exam_dashboard', args=[self.event.pk])), 'dashboard-data')
+        response = self.client.get(reverse('canvas:exam_dashboard_events', args=[self.event.pk]))
+        self.assertIn(b'event: dashboard', response.content)
+
+    def test_rolled_back_submission(self):
+        uqj = get_user_question_junction(self.user, self.question)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MultipleChoiceSubmission(uqj=uqj, answer='b').save()
+            raise IntegrityError()
+
+        dashboard = get_exam_dashboard(self.event)
+        self.assertEqual(dashboard['submissions_per_minute'][-1]['count'], 0)
@@ -1,14 +1,20 @@
 from django.urls import path
 
-from canvas.views.register_views import register_course_view
+from canvas.views.exam_dashboard_views import exam_dashboard_view, exam_dashboard_events_view
+from canvas.views.gradebook_views import gradebook_view
+from canvas.views.register_views import register_course_view, bulk_register_course_view
 from canvas.views.views import course_list_view, course_view, event_problem_set, events_options_view, \
     create_event_view, edit_event_view
 
 urlpatterns = [
     path('<int:pk>', course_view, name='course'),
     path('<int:pk>/register', register_course_view, name='course_register'),
+    path('<int:pk>/bulk-register', bulk_register_course_view, name='course_bulk_register'),
+    path('<int:pk>/gradebook', gradebook_view, name='gradebook'),
     path('events-options', events_options_view, name='course_events_options'),
     path('event/<int:event_id>/problem-set', event_problem_set, name='event_problem_set'),
+    path('event/<int:event_id>/dashboard', exam_dashboard_view, name='exam_dashboard'),
+    path('event/<int:event_id>/dashboard/events', exam_dashboard_events_view, name='exam_dashboard_events'),
     path('', course_list_view, name='course_list'),
     path('<int:pk>/create-event', create_event_view, name='create_event'),
     path('<int:pk>/edit-event', edit_event_view, name='edit-event')
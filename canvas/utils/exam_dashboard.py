@@ -0,0 +1,143 @@
+import time
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from utils.asgi import database_sync_to_async, get_scope_user, EventStream, send_error
+
+# Number of minutes shown in the submissions per minute chart
+MINUTES_SHOWN = 30
+# A student who viewed a question or submitted within this many minutes is counted as active
+ACTIVE_MINUTES = 5
+# Seconds between two pushes of the dashboard to the browser
+PUSH_SECONDS = 5
+STREAM_TIMEOUT_SECONDS = 60 * 60
+FALLBACK_RETRY_MILLISECONDS = 10000
+
+
+def get_current_minute():
+    return int(time.time() // 60)
+
+
+def _incr(event_id, name, minute=0, delta=1):
+    from canvas.models import ExamCounter
+
+    counters = ExamCounter.objects.filter(event_id=event_id, name=name, minute=minute)
+    if counters.update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            ExamCounter.objects.create(event_id=event_id, name=name, minute=minute, value=delta)
+    except IntegrityError:
+        # Created by another process in the meantime
+        counters.update(value=F('value') + delta)
+
+
+def record_exam_activity(event_id, user_id, minute=None):
+    """
+    Mark the user as active in the exam in the current minute. The row is only written when its minute is older, so
+    the views of a student within the same minute do not write.
+    """
+    from canvas.models import ExamActivity
+
+    minute = minute or get_current_minute()
+    activities = ExamActivity.objects.filter(event_id=event_id, user_id=user_id)
+    if activities.filter(minute__lt=minute).update(minute=minute) or activities.exists():
+        return
+    try:
+        with transaction.atomic():
+            ExamActivity.objects.create(event_id=event_id, user_id=user_id, minute=minute)
+    except IntegrityError:
+        activities.filter(minute__lt=minute).update(minute=minute)
+
+
+def record_exam_submission(event_id, user_id, finalized):
+    """
+    Count a new submission of the exam once the transaction saving it is committed, a rolled back submission is
+    never counted. The counters are updated after the commit so their rows are only locked for one query.
+    """
+    minute = get_current_minute()
+
+    def record():
+        _incr(event_id, 'submissions', minute)
+        if not finalized:
+            _incr(event_id, 'grading')
+        record_exam_activity(event_id, user_id, minute)
+
+    transaction.on_commit(record)
+
+
+def record_exam_submission_graded(event_id):
+    transaction.on_commit(lambda: _incr(event_id, 'grading', delta=-1))
+
+
+def get_exam_dashboard(event):
+    """
+    Returns the live counters of an exam. The numbers of submissions are read from counters kept up to date by the
+    submissions and the per question counts come from the question stats.
+    """
+    from canvas.models import ExamActivity
+
+    minute = get_current_minute()
+    minutes = list(range(minute - MINUTES_SHOWN + 1, minute + 1))
+    counters = {
+        (name, m): value for name, m, value in
+        event.exam_counters.filter(minute__in=minutes + [0]).values_list('name', 'minute', 'value')
+    }
+    active_students = ExamActivity.objects.filter(event=event, minute__gt=minute - ACTIVE_MINUTES).count()
+
+    questions = event.question_set.order_by('pk').values_list('pk', 'title', 'stats__attempted', 'stats__solved')
+    return {
+        'submissions_per_minute': [
+            {'time': m * 60, 'count': counters.get(('submissions', m), 0)} for m in minutes
+        ],
+        'questions': [
+            {'pk': pk, 'title': title, 'attempted': attempted or 0, 'solved': solved or 0}
+            for pk, title, attempted, solved in questions
+        ],
+        'grading_queue': max(counters.get(('grading', 0), 0), 0),
+        'active_students': active_students,
+    }
+
+
+def load_exam_dashboard(event_id, user):
+    """
+    Returns the dashboard of the event, or None if the event does not exist or the user can not edit it
+    """
+    from canvas.models import Event
+
+    event = Event.objects.select_related('course').filter(pk=event_id).first()
+    if event is None or not event.has_edit_permission(user):
+        return None
+    return get_exam_dashboard(event)
+
+
+async def exam_dashboard_stream(scope, receive, send, event_id):
+    """
+    ASGI handler pushing the dashboard of an exam as a `dashboard` event whenever one of its counters changes
+    """
+    user = await database_sync_to_async(get_scope_user)(scope)
+    load_dashboard = database_sync_to_async(load_exam_dashboard)
+    dashboard = await load_dashboard(int(event_id), user)
+    if dashboard is None:
+        await send_error(send, 404)
+        return
+
+    stream = EventStream(receive, send)
+    await stream.start()
+    try:
+        await stream.send_event('dashboard', dashboard)
+        elapsed = 0
+        while elapsed < STREAM_TIMEOUT_SECONDS:
+            if not await stream.wait(PUSH_SECONDS):
+                return
+            elapsed += PUSH_SECONDS
+
+            new_dashboard = await load_dashboard(int(event_id), user)
+            if new_dashboard is None:
+                return
+            if new_dashboard != dashboard:
+                await stream.send_event('dashboard', new_dashboard)
+            dashboard = new_dashboard
+    finally:
+        await stream.close()
@@ -0,0 +1,129 @@
+import csv
+
+from django.db.models import Sum, Count
+
+from course.utils.utils import get_token_values
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it, used to stream csv rows
+    """
+
+    def write(self, value):
+        return value
+
+
+class Gradebook:
+    """
+    Event grades of the students of a course. The whole students x events matrix is computed with a fixed
+    number of grouped queries, regardless of the number of students and events.
+    """
+
+    def __init__(self, course, users=None, events=None):
+        self.course = course
+        self.events = list(events if events is not None else course.events.all())
+        self.users = list(users if users is not None else self.get_students(course))
+        self.tokens_received = {}
+        self.tokens_worth = {}
+        self._compute()
+
+    @staticmethod
+    def get_students(course):
+        from accounts.models import MyUser
+
+        return MyUser.objects.filter(
+            canvascourseregistration__course=course,
+            canvascourseregistration__is_verified=True,
+            canvascourseregistration__is_blocked=False,
+        ).order_by('last_name', 'first_name', 'username')
+
+    def _compute(self):
+        from course.models.models import Question, UserQuestionJunction, DEFAULT_TOKEN_VALUES
+
+        event_ids = [event.id for event in self.events]
+        user_ids = [user.id for user in self.users]
+        if not event_ids or not user_ids:
+            return
+
+        token_values = get_token_values()
+        question_groups = Question.objects.non_polymorphic() \
+            .filter(event_id__in=event_ids, category__isnull=False) \
+            .values_list('event_id', 'category_id', 'difficulty') \
+            .annotate(num_questions=Count('id')) \
+            .order_by()
+        for event_id, category_id, difficulty, num_questions in question_groups:
+            token_value = token_values.get((category_id, difficulty), DEFAULT_TOKEN_VALUES.get(difficulty, 0))
+            self.tokens_worth[event_id] = self.tokens_worth.get(event_id, 0) + token_value * num_questions
+
+        received = UserQuestionJunction.objects \
+            .filter(user_id__in=user_ids, question__event_id__in=event_ids) \
+            .values_list('user_id', 'question__event_id') \
+            .annotate(total=Sum('tokens_received')) \
+            .order_by()
+        for user_id, event_id, total in received:
+            self.tokens_received[(user_id, event_id)] = total or 0
+
+    def get_grade(self, user, event):
+        """
+        Returns the grade of the user in the event as a percentage or None if the event is not worth any tokens
+        """
+        tokens_worth = self.tokens_worth.get(event.id, 0)
+        if tokens_worth == 0:
+            return None
+        return self.tokens_received.get((user.id, event.id), 0) * 100 / tokens_worth
+
+    def get_formatted_grade(self, user, event):
+        grade = self.get_grade(user, event)
+        return 'N/A' if grade is None else '{:.2f}%'.format(grade)
+
+    def get_user_grades(self, user):
+        """
+        Returns a dict of event id to the formatted grade of the user
+        """
+        return {event.id: self.get_formatted_grade(user, event) for event in self.events}
+
+    def rows(self):
+        for user in self.users:
+            yield user, [self.get_grade(user, event) for event in self.events]
+
+    def to_dict(self):
+        return {
+            'course': self.course.id,
+            'events': [{'id': event.id, 'name': event.name} for event in self.events],
+            'students': [{
+                'id': user.id,
+                'username': user.username,
+                'name': user.get_full_name(),
+                'grades': grades,
+            } for user, grades in self.rows()],
+        }
+
+    def header(self):
+        return ['Username', 'Name'] + [event.name for event in self.events]
+
+    def iter_csv(self):
+        """
+        Yields the gradebook as csv lines to be streamed to the client
+        """
+
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header())
+        for user, grades in self.rows():
+            yield writer.writerow([user.username, user.get_full_name()] + [
+                '' if grade is None else round(grade, 2) for grade in grades
+            ])
+
+    def write_xls(self, stream):
+        import xlwt
+
+        workbook = xlwt.Workbook()
+        sheet = workbook.add_sheet('Gradebook')
+        for col, title in enumerate(self.header()):
+            sheet.write(0, col, title)
+        for row, (user, grades) in enumerate(self.rows(), start=1):
+            sheet.write(row, 0, user.username)
+            sheet.write(row, 1, user.get_full_name())
+            for col, grade in enumerate(grades, start=2):
+                sheet.write(row, col, '' if grade is None else round(grade, 2))
+        workbook.save(stream)
@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from utils.request_cache import forget, forget_prefix
+
+
+def get_registration_cache():
+    return caches[settings.REGISTRATION_CACHE]
+
+
+def registration_cache_key(course_id, user_id):
+    return 'canvas:registered:{}:{}'.format(course_id, user_id)
+
+
+def is_registered(course_id, user_id):
+    """
+    Returns whether the user has a verified registration in the course that is not blocked.
+    The answer is cached for REGISTRATION_CACHE_TIMEOUT seconds or until the registration is saved or deleted.
+    """
+    from canvas.models import CanvasCourseRegistration
+
+    cache = get_registration_cache()
+    key = registration_cache_key(course_id, user_id)
+    registered = cache.get(key)
+    if registered is None:
+        registered = CanvasCourseRegistration.objects \
+            .filter(course_id=course_id, user_id=user_id, is_verified=True, is_blocked=False) \
+            .exists()
+        cache.set(key, registered, settings.REGISTRATION_CACHE_TIMEOUT)
+    return registered
+
+
+def invalidate_registration(sender, instance, **kwargs):
+    get_registration_cache().delete(registration_cache_key(instance.course_id, instance.user_id))
+    forget(('course_registered', instance.course_id, instance.user_id))
+    forget_prefix(('event_view_permission', instance.course_id, instance.user_id))
+
+
+def get_roster_user_ids(course):
+    """
+    Map the users of this website to the students of the canvas course by their email.
+    Returns a dict of user id to canvas user id and the number of students without a matching account.
+    """
+    from accounts.models import MyUser
+
+    canvas_user_ids = {}
+    for canvas_user in course.course.get_users(enrollment_type=['student'], include=['email']):
+        email = getattr(canvas_user, 'email', None) or getattr(canvas_user, 'login_id', None)
+        if email:
+            canvas_user_ids[email.lower()] = canvas_user.id
+
+    users = MyUser.objects.annotate(email_lower=Lower('email')) \
+        .filter(email_lower__in=list(canvas_user_ids.keys())) \
+        .values('id', 'email_lower')
+    roster = {user['id']: canvas_user_ids[user['email_lower']] for user in users}
+
+    return roster, len(canvas_user_ids) - len(roster)
+
+
+def send_verification_codes(course, course_regs):
+    """
+    Publish the verification codes of all the given registrations with a single canvas request
+    """
+    from canvas.models import CanvasCourseRegistration
+
+    course_regs = list(course_regs)
+    if not course_regs:
+        return 0
+
+    course.verification_assignment.submissions_bulk_update(grade_data={
+        course_reg.canvas_user_id: {
+            'posted_grade': course_reg.verification_code,
+        } for course_reg in course_regs
+    })
+    CanvasCourseRegistration.objects.filter(pk__in=[course_reg.pk for course_reg in course_regs]) \
+        .update(verification_code_sent=True, verification_code_sent_at=timezone.now())
+
+    return len(course_regs)
+
+
+def bulk_register_roster(course):
+    """
+    Create the registrations of the whole canvas roster and publish all the pending verification codes.
+    Returns the number of created registrations, the number of codes sent and the number of unmatched students.
+    """
+    from canvas.models import CanvasCourseRegistration
+
+    roster, num_unmatched = get_roster_user_ids(course)
+
+    with transaction.atomic():
+        roster_regs = course.canvascourseregistration_set.filter(user_id__in=list(roster.keys()))
+        registered_user_ids = set(roster_regs.values_list('user_id', flat=True))
+        course_regs = [
+            CanvasCourseRegistration(course=course, user_id=user_id, canvas_user_id=canvas_user_id)
+            for user_id, canvas_user_id in roster.items() if user_id not in registered_user_ids
+        ]
+        # Students registering themselves meanwhile keep their own registration
+        CanvasCourseRegistration.objects.bulk_create(course_regs, ignore_conflicts=True)
+        num_created = roster_regs.count() - len(registered_user_ids)
+
+    pending_regs = course.canvascourseregistration_set.filter(
+        canvas_user_id__isnull=False,
+        is_verified=False,
+        is_blocked=False,
+        verification_code_sent=False,
+    )
+    num_sent = send_verification_codes(course, pending_regs)
+
+    return num_created, num_sent, num_unmatched
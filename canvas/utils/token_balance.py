@@ -0,0 +1,245 @@
+from math import isclose
+
+from django.db import transaction, IntegrityError
+from django.db.models import Sum, F, FloatField
+
+
+def compute_course_token_balances(user_id=None, course_id=None):
+    """
+    Compute the course token balances from the source data.
+    Returns a dict of (user id, course id) to [tokens received, tokens used].
+    """
+    from canvas.models import TokenUse
+    from course.models.models import UserQuestionJunction
+
+    uqjs = UserQuestionJunction.objects.filter(question__event__count_for_tokens=True)
+    token_uses = TokenUse.objects.all()
+    if user_id is not None:
+        uqjs = uqjs.filter(user_id=user_id)
+        token_uses = token_uses.filter(user_id=user_id)
+    if course_id is not None:
+        uqjs = uqjs.filter(question__event__course_id=course_id)
+        token_uses = token_uses.filter(option__course_id=course_id)
+
+    balances = {}
+    received = uqjs.values_list('user_id', 'question__event__course_id').annotate(total=Sum('tokens_received'))
+    for uid, cid, total in received:
+        balances.setdefault((uid, cid), [0, 0])[0] = total or 0
+
+    used = token_uses.values_list('user_id', 'option__course_id') \
+        .annotate(total=Sum(F('option__tokens_required') * F('num_used'), output_field=FloatField()))
+    for uid, cid, total in used:
+        balances.setdefault((uid, cid), [0, 0])[1] = total or 0
+
+    return balances
+
+
+def compute_action_token_balances(user_id=None):
+    """
+    Compute the total token change of the actions of the users.
+    Returns a dict of (user id, None) to [total token change, 0].
+    """
+    from general.models import Action
+
+    actions = Action.objects.all()
+    if user_id is not None:
+        actions = actions.filter(user_id=user_id)
+
+    totals = actions.values_list('user_id').annotate(total=Sum('token_change'))
+    return {(uid, None): [total or 0, 0] for uid, total in totals}
+
+
+def _create_token_balance(user, course):
+    from canvas.models import TokenBalance, TokenTransaction
+
+    if course is None:
+        received, used = compute_action_token_balances(user.id).get((user.id, None), [0, 0])
+    else:
+        received, used = compute_course_token_balances(user.id, course.id).get((user.id, course.id), [0, 0])
+
+    try:
+        with transaction.atomic():
+            balance = TokenBalance.objects.create(user=user, course=course, tokens_received=received,
+                                                  tokens_used=used)
+            if course is not None and received - used != 0:
+                TokenTransaction.objects.create(user=user, course=course, source=TokenTransaction.ADJUSTMENT,
+                                                amount=received - used)
+            return balance, True
+    except IntegrityError:
+        return TokenBalance.objects.get(user=user, course=course), False
+
+
+def get_or_create_token_balance(user, course, lock=False):
+    """
+    Get the token balance of the user in the course. A missing balance is created from the source data.
+    Use lock inside a transaction to lock the balance row until the end of the transaction.
+    """
+    from canvas.models import TokenBalance
+
+    balances = TokenBalance.objects.filter(user=user, course=course)
+    if lock:
+        balances = balances.select_for_update()
+
+    balance = balances.first()
+    if balance is not None:
+        return balance, False
+
+    balance, created = _create_token_balance(user, course)
+    if lock:
+        balance = balances.get()
+    return balance, created
+
+
+def get_token_balance(user, course, lock=False):
+    return get_or_create_token_balance(user, course, lock)[0]
+
+
+def read_token_balance(user, course):
+    """
+    Get the token balance of the user in the course without writing to the database. A missing balance is read as an
+    empty one, since the balances of the past tokens are created by migration and kept current afterwards.
+    """
+    from canvas.models import TokenBalance
+
+    balance = TokenBalance.objects.filter(user=user, course=course).first()
+    return balance or TokenBalance(user=user, course=course)
+
+
+def record_token_changes(user, course, transactions, tokens_received=0, tokens_used=0):
+    """
+    Add the transactions to the ledger and update the balance of the user in the course accordingly.
+    Should be called in the same transaction as the change in the source data.
+    """
+    from canvas.models import TokenBalance, TokenTransaction
+
+    balance, created = get_or_create_token_balance(user, course)
+    if created:
+        # The new balance is computed from the source data which already includes the change
+        return
+
+    TokenTransaction.objects.bulk_create(transactions)
+    TokenBalance.objects.filter(pk=balance.pk).update(
+        tokens_received=F('tokens_received') + tokens_received,
+        tokens_used=F('tokens_used') + tokens_used,
+    )
+
+
+def record_tokens_received(uqj, token_change):
+    from canvas.models import TokenTransaction
+
+    event = uqj.question.event
+    if not token_change or event is None or not event.count_for_tokens:
+        return
+
+    course = event.course
+    record_token_changes(uqj.user, course, [
+        TokenTransaction(user=uqj.user, course=course, source=TokenTransaction.QUESTION, amount=token_change, uqj=uqj)
+    ], tokens_received=token_change)
+
+
+def record_tokens_received_in_bulk(user, token_changes):
+    """
+    Record the tokens received by the user in several user question junctions, with one balance update per course.
+    `token_changes` is a list of (user question junction, token change).
+    """
+    from canvas.models import TokenTransaction
+
+    courses = {}
+    for uqj, token_change in token_changes:
+        event = uqj.question.event
+        if not token_change or event is None or not event.count_for_tokens:
+            continue
+        courses.setdefault(event.course, []).append(TokenTransaction(
+            user=user, course=event.course, source=TokenTransaction.QUESTION, amount=token_change, uqj=uqj))
+
+    for course, transactions in courses.items():
+        record_token_changes(user, course, transactions,
+                             tokens_received=sum(item.amount for item in transactions))
+
+
+def record_tokens_used(user, course, token_use_changes):
+    """
+    Record the debits of the token uses. `token_use_changes` is a list of (token use, change in num_used).
+    """
+    from canvas.models import TokenTransaction
+
+    transactions = []
+    tokens_used = 0
+    for token_use, num_change in token_use_changes:
+        amount = token_use.option.tokens_required * num_change
+        if amount == 0:
+            continue
+        tokens_used += amount
+        transactions.append(TokenTransaction(user=user, course=course, source=TokenTransaction.TOKEN_USE,
+                                             amount=-amount, token_use=token_use))
+
+    if transactions:
+        record_token_changes(user, course, transactions, tokens_used=tokens_used)
+
+
+def record_action(action):
+    record_token_changes(action.user, None, [], tokens_received=action.token_change)
+
+
+def rebuild_deleted_token_use_balance(sender, instance, **kwargs):
+    """
+    Rebuild the balance of the user of a deleted token use once the deletion is committed. The balance is not rebuilt
+    right away since the token use may be deleted along with its course.
+    """
+    from canvas.models import TokenUseOption
+
+    course_id = TokenUseOption.objects.filter(pk=instance.option_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        transaction.on_commit(lambda: rebuild_token_balances(user_id=instance.user_id, course_id=course_id))
+
+
+def rebuild_token_balances(user_id=None, course_id=None, commit=True):
+    """
+    Compare the materialized token balances with the source data and fix the ones that drifted.
+    Returns a list of (user id, course id, expected balance, actual balance) of the mismatching balances.
+    """
+    from canvas.models import TokenBalance, TokenTransaction
+
+    expected = compute_course_token_balances(user_id, course_id)
+    balances = TokenBalance.objects.all()
+    if user_id is not None:
+        balances = balances.filter(user_id=user_id)
+    if course_id is not None:
+        balances = balances.filter(course_id=course_id)
+    else:
+        expected.update(compute_action_token_balances(user_id))
+
+    existing = {(balance.user_id, balance.course_id): balance for balance in balances}
+    mismatches = []
+    new_balances = []
+    changed_balances = []
+    adjustments = []
+
+    for key in set(expected.keys()) | set(existing.keys()):
+        received, used = expected.get(key, [0, 0])
+        balance = existing.get(key)
+
+        if balance is None:
+            if received == 0 and used == 0:
+                continue
+            balance = TokenBalance(user_id=key[0], course_id=key[1])
+            new_balances.append(balance)
+        elif isclose(balance.tokens_received, received) and isclose(balance.tokens_used, used):
+            continue
+        else:
+            changed_balances.append(balance)
+
+        mismatches.append((key[0], key[1], received - used, balance.available_tokens))
+        if key[1] is not None:
+            adjustments.append(TokenTransaction(user_id=key[0], course_id=key[1], source=TokenTransaction.ADJUSTMENT,
+                                                amount=received - used - balance.available_tokens))
+        balance.tokens_received = received
+        balance.tokens_used = used
+
+    if commit:
+        with transaction.atomic():
+            TokenBalance.objects.bulk_create(new_balances)
+            TokenBalance.objects.bulk_update(changed_balances, ['tokens_received', 'tokens_used'])
+            TokenTransaction.objects.bulk_create(adjustments)
+
+    return mismatches
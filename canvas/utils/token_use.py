@@ -1,4 +1,10 @@
-from canvas.utils.utils import get_course_registration
+from django.db import transaction
+
+from canvas.utils.token_balance import get_token_balance, record_tokens_used
+from utils.metrics import registry
+
+TOKEN_USE_UPDATE_SECONDS = registry.histogram(
+    'token_use_update_duration_seconds', 'Time spent updating the token uses of a student, grade sync included')
 
 
 class TokenUseException(Exception):
@@ -19,20 +25,61 @@ def get_token_use(user, token_use_option_id):
     return token_use
 
 
+def apply_token_uses(course_reg, token_uses):
+    for token_use in token_uses:
+        token_use.apply(course_reg)
+
+
+@TOKEN_USE_UPDATE_SECONDS.time()
 def update_token_use(user, course, data):
-    from canvas.models import TokenUseOption
+    """
+    Spend the user's tokens on the given token use options in a single transaction.
+    `data` maps the token use option ids to the number of times each one is used.
+    The grades are pushed to canvas only after the transaction is committed.
+    """
+    from canvas.models import CanvasCourseRegistration, TokenUse
+
+    with transaction.atomic():
+        course_reg = CanvasCourseRegistration.objects.filter(user=user, course=course).first()
+        if course_reg is None:
+            raise TokenUseException()
+        balance = get_token_balance(user, course, lock=True)
+
+        options = course.token_use_options.in_bulk(list(data.keys()))
+        if len(options) != len(data):
+            raise TokenUseException()
+
+        total_tokens_used = 0
+        for token_use_option_id, num in data.items():
+            option = options[token_use_option_id]
+            if num < 0 or num > option.maximum_number_of_use:
+                raise TokenUseException()
+            total_tokens_used += option.tokens_required * num
+
+        if total_tokens_used > balance.tokens_received:
+            raise TokenUseException()
 
-    course_reg = get_course_registration(user, course)
+        token_uses = {token_use.option_id: token_use for token_use in user.token_uses.filter(option__in=options)}
+        num_changes = {}
+        new_token_uses = []
+        changed_token_uses = []
 
-    total_tokens_used = 0
-    for token_use_option_id, num in data.items():
-        total_tokens_used += TokenUseOption.objects.get(id=token_use_option_id).tokens_required * num
+        for token_use_option_id, num in data.items():
+            token_use = token_uses.get(token_use_option_id)
+            if token_use is None:
+                num_changes[token_use_option_id] = num
+                token_use = TokenUse(user=user, option=options[token_use_option_id], num_used=num)
+                new_token_uses.append(token_use)
+            elif token_use.num_used != num:
+                num_changes[token_use_option_id] = num - token_use.num_used
+                token_use.num_used = num
+                changed_token_uses.append(token_use)
 
-    if total_tokens_used > course_reg.total_tokens_received:
-        raise TokenUseException()
+        TokenUse.objects.bulk_create(new_token_uses)
+        TokenUse.objects.bulk_update(changed_token_uses, ['num_used'])
 
-    for token_use_option_id, num in data.items():
-        token_use = get_token_use(user, token_use_option_id)
-        token_use.num_used = num
-        token_use.apply()
-        token_use.save()
+        # Fetched again since bulk_create does not set the primary keys on every database
+        updated_token_uses = list(user.token_uses.filter(option__in=num_changes.keys()).select_related('option'))
+        record_tokens_used(user, course, [(token_use, num_changes[token_use.option_id])
+                                          for token_use in updated_token_uses])
+        transaction.on_commit(lambda: apply_token_uses(course_reg, updated_token_uses))
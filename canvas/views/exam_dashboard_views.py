@@ -0,0 +1,27 @@
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404, render
+
+from canvas.models import Event
+from canvas.utils.exam_dashboard import get_exam_dashboard, load_exam_dashboard, FALLBACK_RETRY_MILLISECONDS
+from utils.asgi import format_event
+
+
+def exam_dashboard_view(request, event_id):
+    event = get_object_or_404(Event.objects.select_related('course'), pk=event_id)
+
+    if not event.has_edit_permission(request.user):
+        return render(request, "403.html", status=403)
+
+    return render(request, 'canvas/exam_dashboard.html', {
+        'event': event,
+        'dashboard': get_exam_dashboard(event),
+    })
+
+
+def exam_dashboard_events_view(request, event_id):
+    # Served only when the site does not run on ASGI, where the dashboard is streamed by exam_dashboard_stream.
+    dashboard = load_exam_dashboard(event_id, request.user)
+    if dashboard is None:
+        raise Http404()
+    return HttpResponse(format_event('dashboard', dashboard, retry=FALLBACK_RETRY_MILLISECONDS),
+                        content_type='text/event-stream')
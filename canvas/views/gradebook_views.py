@@ -0,0 +1,34 @@
+from io import BytesIO
+
+from django.http import StreamingHttpResponse, HttpResponse
+from django.shortcuts import get_object_or_404, render
+
+from canvas.models import CanvasCourse
+from canvas.utils.gradebook import Gradebook
+
+
+def gradebook_view(request, pk):
+    course = get_object_or_404(CanvasCourse, pk=pk)
+
+    if not course.has_edit_permission(request.user):
+        return render(request, "403.html", status=403)
+
+    gradebook = Gradebook(course)
+    export = request.GET.get('export', None)
+
+    if export == 'csv':
+        response = StreamingHttpResponse(gradebook.iter_csv(), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="gradebook_{}.csv"'.format(course.pk)
+        return response
+
+    if export == 'xls':
+        stream = BytesIO()
+        gradebook.write_xls(stream)
+        response = HttpResponse(stream.getvalue(), content_type='application/vnd.ms-excel')
+        response['Content-Disposition'] = 'attachment; filename="gradebook_{}.xls"'.format(course.pk)
+        return response
+
+    return render(request, 'canvas/gradebook.html', {
+        'course': course,
+        'gradebook': gradebook,
+    })
@@ -1,9 +1,11 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseBadRequest
+from django.http import HttpResponseBadRequest, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
+from django.urls import reverse_lazy
 
 from canvas.models import CanvasCourse, CanvasCourseRegistration
+from canvas.utils.registration import bulk_register_roster
 from canvas.utils.utils import get_course_registration
 
 
@@ -85,7 +87,18 @@ def _verify_registration_view(request, course, course_reg):
             return render(request, 'canvas/course_registration/verification.html', {
                 'attempts': course_reg.verification_attempts,
             })
-    course_reg.send_verification_code()
+    if 'resend' in request.POST:
+        if course_reg.can_resend_verification_code:
+            course_reg.send_verification_code()
+            messages.add_message(request, messages.SUCCESS, 'A new verification grade has been posted in Canvas.')
+        else:
+            messages.add_message(
+                request,
+                messages.ERROR,
+                'The verification grade was posted recently. Please wait a few minutes before asking again.'
+            )
+    elif not course_reg.verification_code_sent:
+        course_reg.send_verification_code()
     return render(request, 'canvas/course_registration/verification.html', {
         'attempts': course_reg.verification_attempts,
     })
@@ -119,3 +132,27 @@ def register_course_view(request, pk):
     return render(request, 'canvas/course_registration/empty.html', {
         'course': course,
     })
+
+
+@login_required
+def bulk_register_course_view(request, pk):
+    course = get_object_or_404(CanvasCourse, pk=pk)
+
+    if not course.has_edit_permission(request.user):
+        return render(request, "403.html", status=403)
+
+    if request.method == "POST":
+        num_registered, num_sent, num_unmatched = bulk_register_roster(course)
+        messages.add_message(
+            request,
+            messages.SUCCESS,
+            '{} students registered and {} verification codes sent.'.format(num_registered, num_sent)
+        )
+        if num_unmatched:
+            messages.add_message(
+                request,
+                messages.WARNING,
+                '{} students in the canvas course do not have a matching account.'.format(num_unmatched)
+            )
+
+    return HttpResponseRedirect(reverse_lazy('canvas:course', kwargs={'pk': pk}))
@@ -1,10 +1,12 @@
 import re
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
+from django.db.models import Count
 from django.shortcuts import render, get_object_or_404
 
 # Create your views here.
 from canvas.models import CanvasCourse, Event
+from canvas.utils.gradebook import Gradebook
 from canvas.utils.token_use import update_token_use, TokenUseException
 from canvas.utils.utils import get_course_registration
 from course.models.models import UserQuestionJunction
@@ -49,26 +51,34 @@ def course_view(request, pk):
         uqjs = UserQuestionJunction.objects.none()
 
     course_reg = get_course_registration(request.user, course)
+    gradebook = Gradebook(course, users=[request.user])
 
     return render(request, 'canvas/course.html', {
         'course': course,
         'course_reg': course_reg,
         'uqjs': uqjs,
         'is_instructor': is_instructor,
+        'events': gradebook.events,
+        'event_grades': gradebook.get_user_grades(request.user),
     })
 
 
 def event_problem_set(request, event_id):
-    event = get_object_or_404(Event, pk=event_id)
+    event = get_object_or_404(Event.objects.select_related('course'), pk=event_id)
 
     if not event.has_view_permission(request.user):
         return render(request, "403.html", status=403)
 
-    uqjs = UserQuestionJunction.objects.filter(user=request.user, question__event=event).all()
+    uqjs = UserQuestionJunction.objects \
+        .filter(user=request.user, question__event=event) \
+        .annotate(num_submissions=Count('submissions')) \
+        .select_related('question__category__parent')
 
     uqjs_dict = {}
-    for i in range(len(uqjs)):
-        uqjs_dict[i + 1] = uqjs[i]
+    for i, uqj in enumerate(uqjs, start=1):
+        # Every row shares the event of the page
+        uqj.question.event = event
+        uqjs_dict[i] = uqj
 
     return render(request, 'canvas/event_problem_set.html', {
         'event': event,
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'canvas_gamification.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# The handlers are imported once the settings are configured and the apps are loaded
+from canvas.utils.exam_dashboard import exam_dashboard_stream  # noqa: E402
+from course.utils.submission_events import submission_status_stream  # noqa: E402
+from utils.asgi import route_streams  # noqa: E402
+
+# Long lived event streams are served here instead of holding a Django worker thread each
+application = route_streams([
+    (r'/course/submission/events', submission_status_stream),
+    (r'/canvas/event/(?P<event_id>\d+)/dashboard/events', exam_dashboard_stream),
+], django_application)
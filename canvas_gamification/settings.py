@@ -63,7 +63,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.instrumentation.instrumentation_middleware',
     'django.middleware.security.SecurityMiddleware',
+    'utils.request_cache.request_cache_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +75,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'accounts.middlewares.login_overlay_middleware',
+    'utils.profiling.profiling_middleware',
 ]
 
 ROOT_URLCONF = 'canvas_gamification.urls'
@@ -120,6 +123,61 @@ else:
         }
     }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'canvas-gamification'),
+    }
+}
+
+# Cache alias of the course registration states. A registration change clears the state in this cache, so with a
+# per process backend like the default locmem cache the other processes keep the old state until it expires.
+REGISTRATION_CACHE = os.environ.get('REGISTRATION_CACHE', 'default')
+# Seconds a registration state is cached, only raise it when REGISTRATION_CACHE is shared by every process
+REGISTRATION_CACHE_TIMEOUT = int(os.environ.get('REGISTRATION_CACHE_TIMEOUT', 60))
+
+# Cache alias of the version stamp of the token values, a database, memcached or redis cache shared by every process.
+# Without it every process reloads its token values every few seconds.
+TOKEN_VALUES_CACHE = os.environ.get('TOKEN_VALUES_CACHE')
+
+# Cache alias of the cached api list pages and of the version stamps of the models they are keyed on, a database,
+# memcached or redis cache shared by every process. The api lists are not cached until it is set.
+API_CACHE = os.environ.get('API_CACHE')
+
+# A student can ask for the verification grade to be posted again once this many seconds have passed
+VERIFICATION_CODE_RESEND_SECONDS = int(os.environ.get('VERIFICATION_CODE_RESEND_SECONDS', 300))
+
+# A question view within this many seconds of the previous one does not update its last_viewed time
+LAST_VIEWED_DEBOUNCE_SECONDS = int(os.environ.get('LAST_VIEWED_DEBOUNCE_SECONDS', 60))
+
+# Written by the generate-openapi-schema command, set OPENAPI_SCHEMA_REGENERATE to rebuild the schema on every request
+OPENAPI_SCHEMA_FILE = os.environ.get('OPENAPI_SCHEMA_FILE', os.path.join(BASE_DIR, 'openapi.json'))
+OPENAPI_SCHEMA_REGENERATE = os.environ.get('OPENAPI_SCHEMA_REGENERATE', 'false') == 'true'
+
+# Requests running more queries or taking longer than these budgets are logged with their repeated queries
+REQUEST_QUERY_BUDGET = int(os.environ.get('REQUEST_QUERY_BUDGET', 50))
+REQUEST_TIME_BUDGET_MS = int(os.environ.get('REQUEST_TIME_BUDGET_MS', 1000))
+# A query run more than this many times in one request with different parameters is logged as an N+1 pattern
+REQUEST_DUPLICATE_QUERY_BUDGET = int(os.environ.get('REQUEST_DUPLICATE_QUERY_BUDGET', 5))
+
+# How the /metrics endpoint sums the metrics of the worker processes: 'process' only exposes the process serving
+# the scrape, 'file' sums the files the workers write in METRICS_DIR, 'cache' sums their entries in METRICS_CACHE,
+# which has to be a database, memcached or redis cache shared by every process. The published metrics are dropped on
+# deploy by the reset-metrics command.
+METRICS_AGGREGATION = os.environ.get('METRICS_AGGREGATION', 'process')
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+METRICS_CACHE = os.environ.get('METRICS_CACHE', 'default')
+# Seconds between two publications of the metrics of a worker to the shared file or cache
+METRICS_PUBLISH_SECONDS = int(os.environ.get('METRICS_PUBLISH_SECONDS', 5))
+# Bearer token of the scraper, staff users can read the metrics without it
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Staff users can profile a request with an X-Profile header or a profile query parameter, the last
+# PROFILE_BUFFER_SIZE profiles are kept in PROFILE_CACHE and listed at /admin/profiles/. Profiling is off until
+# PROFILE_CACHE names a database, memcached or redis cache shared by every process, a locmem cache is refused.
+PROFILE_BUFFER_SIZE = int(os.environ.get('PROFILE_BUFFER_SIZE', 20))
+PROFILE_CACHE = os.environ.get('PROFILE_CACHE')
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -150,7 +208,7 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
-    ]
+    ],
 }
 
 DJRICHTEXTFIELD_CONFIG = {
@@ -218,6 +276,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'utils.instrumentation': {
+            'handlers': ['file', 'console'],
+            'level': 'WARNING',
+        },
     },
 }
 
@@ -22,11 +22,19 @@ from canvas_gamification import views
 from general.views import faq
 
 urlpatterns = [
+    path('admin/request-stats/', views.request_stats_view, name='request_stats'),
+    path('admin/profiles/', views.profiles_view, name='profiles'),
+    path('admin/profiles/<int:profile_id>/', views.profile_view, name='profile'),
+    path('admin/profiles/<int:profile_id>/pstats', views.profile_download_view, {'output_format': 'pstats'},
+         name='profile_pstats'),
+    path('admin/profiles/<int:profile_id>/collapsed', views.profile_download_view, {'output_format': 'collapsed'},
+         name='profile_collapsed'),
     path('admin/', admin.site.urls),
     path('djrichtextfield/', include('djrichtextfield.urls')),
     path('accounts/', include(('accounts.urls', 'accounts'))),
     path('course/', include(('course.urls', 'course'))),
     path('faq/', faq, name='faq'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('homepage/', views.homepage, name='homepage'),
     path('actions/', views.action_view, name='actions'),
     path('terms-and-conditions/', TemplateView.as_view(template_name='terms_and_conditions.html'),
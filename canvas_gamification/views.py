@@ -1,8 +1,17 @@
+import os
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden, Http404
+from django.utils.crypto import constant_time_compare
 from django.shortcuts import render
 
 # Create your views here.
 from course.models.models import UserQuestionJunction
 from general.models import Action
+from utils.instrumentation import request_stats_table
+from utils.metrics import registry, CONTENT_TYPE
+from utils.profiling import profile_buffer, get_stats_file, get_collapsed_stacks, is_profiling_enabled
 
 
 def homepage(request):
@@ -27,3 +36,69 @@ def action_view(request):
         'header': 'Actions',
         'actions': actions,
     })
+
+
+@staff_member_required
+def request_stats_view(request):
+    """
+    Aggregated queries, outbound calls and render times of the requests handled by this process, by url name
+    """
+    return JsonResponse({
+        'pid': os.getpid(),
+        'budgets': {
+            'queries': settings.REQUEST_QUERY_BUDGET,
+            'time_ms': settings.REQUEST_TIME_BUDGET_MS,
+            'duplicate_queries': settings.REQUEST_DUPLICATE_QUERY_BUDGET,
+        },
+        'views': request_stats_table.get_stats(),
+    })
+
+
+def metrics_view(request):
+    """
+    The metrics of every worker in the prometheus text format, for staff users and scrapers with the METRICS_TOKEN
+    """
+    token = request.META.get('HTTP_AUTHORIZATION', '')
+    has_token = settings.METRICS_TOKEN and constant_time_compare(token, 'Bearer ' + settings.METRICS_TOKEN)
+    if not has_token and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.expose(), content_type=CONTENT_TYPE)
+
+
+@staff_member_required
+def profiles_view(request):
+    if not is_profiling_enabled():
+        raise Http404()
+    return render(request, 'profiles.html', {
+        'header': 'Profiles',
+        'profiles': profile_buffer.all(),
+    })
+
+
+def _get_profile(profile_id):
+    if not is_profiling_enabled():
+        raise Http404()
+    profile = profile_buffer.get(profile_id)
+    if profile is None:
+        raise Http404()
+    return profile
+
+
+@staff_member_required
+def profile_view(request, profile_id):
+    profile = _get_profile(profile_id)
+    return render(request, 'profile.html', {
+        'header': 'Profile of {} {}'.format(profile['method'], profile['path']),
+        'profile': profile,
+    })
+
+
+@staff_member_required
+def profile_download_view(request, profile_id, output_format):
+    profile = _get_profile(profile_id)
+    if output_format == 'pstats':
+        response = HttpResponse(get_stats_file(profile), content_type='application/octet-stream')
+    else:
+        response = HttpResponse(get_collapsed_stacks(profile['stats']), content_type='text/plain')
+    response['Content-Disposition'] = 'attachment; filename="profile-{}.{}"'.format(profile_id, output_format)
+    return response
@@ -125,7 +125,7 @@ class JunitProblemCreateForm(ProblemCreateForm):
 
 class ProblemFilterForm(forms.Form):
     query = forms.CharField(
-        label='Search in Question Name',
+        label='Search Questions',
         required=False,
         widget=widgets.TextInput(attrs={
             'class': 'form-control',
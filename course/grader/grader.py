@@ -6,6 +6,11 @@ import requests
 
 from canvas_gamification.settings import JUDGE0_PASSWORD, JUDGE0_HOST
 from course.utils.variables import render_text
+from utils.metrics import registry
+
+JUDGE0_REQUEST_SECONDS = registry.histogram(
+    'judge0_request_duration_seconds', 'Time spent sending a submission to the judge or fetching its results',
+    ['operation'])
 
 
 class Grader:
@@ -22,7 +27,10 @@ class MultipleChoiceGrader(Grader):
         else:
             number_of_choices = len(submission.uqj.get_rendered_choices())
 
-            number_of_submissions = submission.uqj.submissions.exclude(pk=submission.pk).count()
+            if submission.pk is None:
+                number_of_submissions = submission.uqj.num_attempts()
+            else:
+                number_of_submissions = submission.uqj.submissions.exclude(pk=submission.pk).count()
 
             return True, 1 - number_of_submissions / (number_of_choices - 1)
 
@@ -88,25 +96,28 @@ class JunitGrader(Grader):
         submission.results = []
 
         token = submission.tokens[0]
-        r = requests.get(
-            "{}/submissions/{}?base64_encoded=true".format(self.BASE_URL, token),
-            headers=self.HEADERS,
-        )
+        with JUDGE0_REQUEST_SECONDS.time(operation='evaluate'):
+            r = requests.get(
+                "{}/submissions/{}?base64_encoded=true".format(self.BASE_URL, token),
+                headers=self.HEADERS,
+            )
         submission.results.append(r.json())
 
     def submit(self, submission):
         submission.tokens = []
 
-        r = requests.post(
-            "{}/submissions".format(self.BASE_URL),
-            data={
-                "base64_encoded": False,
-                "wait": False,
-                "source_code": self.get_compiler_script(submission),
-                "language_id": 46,
-                "additional_files": self.get_additional_file(submission),
-            },
-            headers=self.HEADERS,
-        )
+        data = {
+            "base64_encoded": False,
+            "wait": False,
+            "source_code": self.get_compiler_script(submission),
+            "language_id": 46,
+            "additional_files": self.get_additional_file(submission),
+        }
+        with JUDGE0_REQUEST_SECONDS.time(operation='submit'):
+            r = requests.post(
+                "{}/submissions".format(self.BASE_URL),
+                data=data,
+                headers=self.HEADERS,
+            )
         submission.tokens.append(r.json()['token'])
         self.evaluate(submission)
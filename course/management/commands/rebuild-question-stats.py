@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from course.utils.category_stats import refresh_category_stats, rebuild_user_category_stats
+from course.utils.question_stats import rebuild_question_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the question stats from the finalized submissions and the category stats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--question', type=int, nargs='*', default=None,
+                            help='Only rebuild the stats of these question ids')
+
+    def handle(self, *args, **options):
+        num_questions = rebuild_question_stats(question_ids=options['question'])
+        self.stdout.write('Rebuilt the stats of {} questions'.format(num_questions))
+
+        num_categories = refresh_category_stats()
+        self.stdout.write('Refreshed the stats of {} categories'.format(num_categories))
+
+        num_user_stats = rebuild_user_category_stats()
+        self.stdout.write('Rebuilt {} user category stats'.format(num_user_stats))
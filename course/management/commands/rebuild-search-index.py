@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from course.utils.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the full text search documents of the questions'
+
+    def handle(self, *args, **options):
+        num_questions = rebuild_search_index()
+        self.stdout.write('Indexed {} questions'.format(num_questions))
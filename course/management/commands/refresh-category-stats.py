@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from course.utils.category_stats import refresh_category_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the category stats rollup from the questions and their stats'
+
+    def handle(self, *args, **options):
+        num_categories = refresh_category_stats()
+        self.stdout.write('Refreshed the stats of {} categories'.format(num_categories))
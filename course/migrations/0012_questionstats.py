@@ -0,0 +1,68 @@
+# Generated by Django 3.0.7 on 2026-10-19 12:06
+
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_question_stats(apps, schema_editor):
+    Submission = apps.get_model('course', 'Submission')
+    QuestionStats = apps.get_model('course', 'QuestionStats')
+
+    totals = {}
+    current_uqj_id = None
+    num_previous = num_previous_correct = num_previous_partial = 0
+
+    rows = Submission.objects.filter(finalized=True).order_by('uqj_id', 'submission_time', 'pk') \
+        .values_list('uqj_id', 'uqj__question_id', 'is_correct', 'is_partially_correct')
+    for uqj_id, question_id, is_correct, is_partially_correct in rows.iterator():
+        if uqj_id != current_uqj_id:
+            current_uqj_id = uqj_id
+            num_previous = num_previous_correct = num_previous_partial = 0
+
+        total = totals.setdefault(question_id, Counter())
+        total['total_submissions'] += 1
+        if num_previous == 0:
+            total['attempted'] += 1
+            total['first_try_solved'] += is_correct
+        if num_previous_correct == 0:
+            if is_correct:
+                total['solved'] += 1
+                total['attempts_to_solve'] += num_previous + 1
+                if num_previous_partial > 0:
+                    total['partially_solved'] -= 1
+            elif is_partially_correct and num_previous_partial == 0:
+                total['partially_solved'] += 1
+
+        num_previous += 1
+        num_previous_correct += is_correct
+        num_previous_partial += is_partially_correct
+
+    QuestionStats.objects.bulk_create([
+        QuestionStats(question_id=question_id, **total) for question_id, total in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0011_auto_20201213_1913'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempted', models.IntegerField(default=0)),
+                ('solved', models.IntegerField(default=0)),
+                ('partially_solved', models.IntegerField(default=0)),
+                ('total_submissions', models.IntegerField(default=0)),
+                ('attempts_to_solve', models.IntegerField(default=0)),
+                ('first_try_solved', models.IntegerField(default=0)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='course.Question')),
+            ],
+        ),
+        migrations.RunPython(build_question_stats, migrations.RunPython.noop),
+    ]
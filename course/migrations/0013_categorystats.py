@@ -0,0 +1,56 @@
+# Generated by Django 3.0.7 on 2026-10-19 12:08
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def build_category_stats(apps, schema_editor):
+    Question = apps.get_model('course', 'Question')
+    CategoryStats = apps.get_model('course', 'CategoryStats')
+
+    rows = Question.objects.filter(category__isnull=False) \
+        .values_list('category_id', 'category__parent_id') \
+        .annotate(
+            num_questions=Count('pk'),
+            attempted=Coalesce(Sum('stats__attempted'), Value(0)),
+            solved=Coalesce(Sum('stats__solved'), Value(0)),
+        ) \
+        .order_by()
+
+    totals = {}
+    for category_id, parent_id, num_questions, attempted, solved in rows:
+        if parent_id is None:
+            # The question count of a top level category only counts the questions of its child categories
+            totals.setdefault(category_id, Counter()).update(attempted=attempted, solved=solved)
+            continue
+        for pk in (category_id, parent_id):
+            totals.setdefault(pk, Counter()).update(num_questions=num_questions, attempted=attempted, solved=solved)
+
+    CategoryStats.objects.bulk_create([
+        CategoryStats(category_id=category_id, **total) for category_id, total in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0012_questionstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_questions', models.IntegerField(default=0)),
+                ('attempted', models.IntegerField(default=0)),
+                ('solved', models.IntegerField(default=0)),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='course.QuestionCategory')),
+            ],
+        ),
+        migrations.RunPython(build_category_stats, migrations.RunPython.noop),
+    ]
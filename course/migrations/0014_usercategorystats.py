@@ -0,0 +1,54 @@
+# Generated by Django 3.0.7 on 2026-10-19 12:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def build_user_category_stats(apps, schema_editor):
+    UserQuestionJunction = apps.get_model('course', 'UserQuestionJunction')
+    UserCategoryStats = apps.get_model('course', 'UserCategoryStats')
+
+    rows = UserQuestionJunction.objects.values_list('user_id', 'question__category_id') \
+        .annotate(
+            attempted=Count('pk', filter=Q(submissions__finalized=True), distinct=True),
+            solved=Count('pk', filter=Q(submissions__finalized=True, submissions__is_correct=True), distinct=True),
+        ) \
+        .filter(attempted__gt=0) \
+        .order_by()
+
+    UserCategoryStats.objects.bulk_create([
+        UserCategoryStats(user_id=user_id, category_id=category_id, attempted=attempted, solved=solved)
+        for user_id, category_id, attempted, solved in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('course', '0013_categorystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCategoryStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempted', models.IntegerField(default=0)),
+                ('solved', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='user_stats', to='course.QuestionCategory')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='usercategorystats',
+            constraint=models.UniqueConstraint(fields=('user', 'category'), name='unique_user_category_stats'),
+        ),
+        migrations.AddConstraint(
+            model_name='usercategorystats',
+            constraint=models.UniqueConstraint(condition=models.Q(category__isnull=True), fields=('user',), name='unique_user_uncategorized_stats'),
+        ),
+        migrations.RunPython(build_user_category_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.0.7 on 2026-10-19 12:13
+
+from bs4 import BeautifulSoup
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_search_index(apps, schema_editor):
+    Question = apps.get_model('course', 'Question')
+    QuestionSearchDocument = apps.get_model('course', 'QuestionSearchDocument')
+
+    rows = Question.objects.values_list('pk', 'title', 'text', 'category__name', 'category__parent__name')
+    QuestionSearchDocument.objects.bulk_create([
+        QuestionSearchDocument(
+            question_id=pk,
+            title=title or '',
+            text=BeautifulSoup(text, 'html.parser').get_text(' ') if text else '',
+            categories=' '.join(name for name in (parent_name, category_name) if name),
+        ) for pk, title, text, category_name, parent_name in rows.iterator()
+    ], batch_size=500)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX course_questionsearchdocument_vector_gin '
+            'ON course_questionsearchdocument USING gin (search_vector)'
+        )
+        QuestionSearchDocument.objects.update(search_vector=(
+            SearchVector('title', weight='A', config='english') +
+            SearchVector('categories', weight='B', config='english') +
+            SearchVector('text', weight='C', config='english')
+        ))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS course_questionsearchdocument_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0014_usercategorystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionSearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.TextField(blank=True)),
+                ('text', models.TextField(blank=True)),
+                ('categories', models.TextField(blank=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='course.Question')),
+            ],
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.0.7 on 2026-10-19 13:40
+
+from collections import Counter
+
+from django.db import migrations
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def rebuild_category_stats(apps, schema_editor):
+    Question = apps.get_model('course', 'Question')
+    CategoryStats = apps.get_model('course', 'CategoryStats')
+
+    rows = Question.objects.filter(category__isnull=False) \
+        .values_list('category_id', 'category__parent_id') \
+        .annotate(
+            num_questions=Count('pk'),
+            attempted=Coalesce(Sum('stats__attempted'), Value(0)),
+            solved=Coalesce(Sum('stats__solved'), Value(0)),
+        ) \
+        .order_by()
+
+    totals = {}
+    for category_id, parent_id, num_questions, attempted, solved in rows:
+        # The question count of a top level category now also counts its own questions
+        for pk in (category_id, parent_id):
+            if pk is None:
+                continue
+            totals.setdefault(pk, Counter()).update(num_questions=num_questions, attempted=attempted, solved=solved)
+
+    CategoryStats.objects.all().delete()
+    CategoryStats.objects.bulk_create([
+        CategoryStats(category_id=category_id, **total) for category_id, total in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0015_questionsearchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_category_stats, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,45 @@
 import base64
 import json
 import random
-from datetime import datetime
+from datetime import timedelta
 
-from django.db import models
-from django.db.models import Count, Q
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.utils.crypto import get_random_string
+from django.utils.functional import cached_property
 from djrichtextfield.models import RichTextField
 from polymorphic.models import PolymorphicModel
 
 from accounts.models import MyUser
 from canvas.models import Event, CanvasCourse
+from canvas.utils.exam_dashboard import record_exam_submission, record_exam_submission_graded
+from canvas.utils.token_balance import record_tokens_received, rebuild_token_balances
 from course.fields import JSONField
 from course.grader.grader import MultipleChoiceGrader, JunitGrader
+from course.utils.category_stats import update_category_stats, refresh_category_stats, move_user_category_stats
 from course.utils.junit_xml import parse_junit_xml
+from course.utils.question_cache import get_submission_summary
+from course.utils.question_stats import record_submission_stats
+from course.utils.search import update_search_document, remove_search_document, \
+    update_category_search_documents
+from course.utils.token_values import invalidate_token_values
 from course.utils.utils import get_token_value, ensure_uqj
 from course.utils.variables import render_text, generate_variables
 from general.models import Action
+from utils.metrics import registry
+
+GRADING_SECONDS = registry.histogram(
+    'submission_grading_duration_seconds', 'Time spent grading a submission, by submission type', ['type'])
+GRADING_TURNAROUND_SECONDS = registry.histogram(
+    'submission_turnaround_seconds', 'Time from a submission to its final grade, by submission type', ['type'],
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800))
+SUBMISSIONS_GRADED = registry.counter(
+    'submissions_graded_total', 'Submissions given their final grade, by submission type and result',
+    ['type', 'result'])
 
 
 class QuestionCategory(models.Model):
@@ -26,36 +48,87 @@ class QuestionCategory(models.Model):
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True)
     next_categories = models.ManyToManyField('self', related_name="prev_categories", symmetrical=False, blank=True)
 
+    _loaded_parent_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
     def __str__(self):
         if self.parent is None:
             return self.name
         else:
             return "{} :: {}".format(self.parent, self.name)
 
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        super().save(*args, **kwargs)
+        if not created:
+            update_category_search_documents(self)
+            if self.parent_id != self._loaded_parent_id:
+                # The questions of the category move from the rollup of the old parent to the new one
+                refresh_category_stats()
+        self._loaded_parent_id = self.parent_id
+
+    @property
+    def category_stats(self):
+        try:
+            return self.stats
+        except CategoryStats.DoesNotExist:
+            return CategoryStats(category=self)
+
     @property
     def average_success(self):
-        category_filter = Q(question__category=self) | Q(question__category__parent=self)
-        solved = UserQuestionJunction.objects.filter(category_filter, is_solved=True).count()
-        total = UserQuestionJunction.objects\
-            .annotate(Count('submissions'))\
-            .filter(category_filter, submissions__count__gt=0)\
-            .count()
-        if total == 0:
-            return 0
-        return 100 * solved / total
+        return 100 * self.category_stats.success_rate
 
     @property
     def question_count(self):
-        if self.parent is None:
-            cnt = 0
-            for cat in self.questioncategory_set.all():
-                cnt += cat.question_set.count()
-            return cnt
-        return self.question_set.count()
+        return self.category_stats.num_questions
 
     @property
     def next_category_ids(self):
-        return self.next_categories.values_list('pk', flat=True)
+        return [category.pk for category in self.next_categories.all()]
+
+
+class CategoryStats(models.Model):
+    """
+    Rollup of the question stats of a category and its child categories, num_questions of a top level category
+    counts both its own questions and the questions of its child categories.
+    Kept current on submissions and question changes, and recomputed with the refresh-category-stats command.
+    """
+    category = models.OneToOneField(QuestionCategory, on_delete=models.CASCADE, related_name='stats')
+    num_questions = models.IntegerField(default=0)
+    attempted = models.IntegerField(default=0)
+    solved = models.IntegerField(default=0)
+
+    @property
+    def success_rate(self):
+        if self.attempted == 0:
+            return 0
+        return self.solved / self.attempted
+
+    def __str__(self):
+        return "Stats of {}".format(self.category)
+
+
+class UserCategoryStats(models.Model):
+    """
+    Number of the questions of a category attempted and solved by a user, updated with the question stats
+    """
+    user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='category_stats')
+    category = models.ForeignKey(QuestionCategory, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='user_stats')
+    attempted = models.IntegerField(default=0)
+    solved = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='unique_user_category_stats'),
+            models.UniqueConstraint(fields=['user'], condition=models.Q(category__isnull=True),
+                                    name='unique_user_uncategorized_stats'),
+        ]
 
 
 DIFFICULTY_CHOICES = [
@@ -64,6 +137,12 @@ DIFFICULTY_CHOICES = [
     ("HARD", "HARD"),
 ]
 
+DEFAULT_TOKEN_VALUES = {
+    "EASY": 1,
+    "NORMAL": 2,
+    "HARD": 3,
+}
+
 
 class TokenValue(models.Model):
     value = models.FloatField()
@@ -72,12 +151,7 @@ class TokenValue(models.Model):
 
     def save(self, **kwargs):
         if self.value is None:
-            if self.difficulty == 'EASY':
-                self.value = 1
-            if self.difficulty == "NORMAL":
-                self.value = 2
-            if self.difficulty == 'HARD':
-                self.value = 3
+            self.value = DEFAULT_TOKEN_VALUES.get(self.difficulty)
 
         super().save(**kwargs)
 
@@ -85,6 +159,10 @@ class TokenValue(models.Model):
         unique_together = ('category', 'difficulty')
 
 
+post_save.connect(invalidate_token_values, sender=TokenValue)
+post_delete.connect(invalidate_token_values, sender=TokenValue)
+
+
 QUESTION_TYPES = {'mc': 'multiple choice question', 'parsons': 'parsons question', 'java': 'java question'}
 
 
@@ -109,10 +187,21 @@ class Question(PolymorphicModel):
     is_verified = models.BooleanField(default=False)
 
     grader = None
+    _loaded_category_id = None
+    _loaded_event_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._loaded_event_id = instance.__dict__.get('event_id')
+        return instance
 
     @property
     def type_name(self):
-        return self._meta.verbose_name
+        # The concrete class is looked up from the cached content type, so it also works on base class instances
+        real_class = self.get_real_instance_class() or type(self)
+        return real_class._meta.verbose_name
 
     @property
     def is_multiple_choice(self):
@@ -123,15 +212,14 @@ class Question(PolymorphicModel):
 
     @property
     def token_value(self):
-        return get_token_value(self.category, self.difficulty)
+        return get_token_value(self.category_id, self.difficulty)
 
     @property
     def success_rate(self):
-        total_tried = self.user_junctions.annotate(Count('submissions')).filter(submissions__count__gt=0).count()
-        total_solved = self.user_junctions.filter(is_solved=True).count()
-        if total_tried == 0:
+        try:
+            return self.stats.success_rate
+        except QuestionStats.DoesNotExist:
             return 0
-        return total_solved / total_tried
 
     @property
     def is_open(self):
@@ -145,13 +233,50 @@ class Question(PolymorphicModel):
     def is_exam_and_open(self):
         return self.event is not None and self.event.is_exam_and_open()
 
+    @property
+    def revision(self):
+        """
+        Changes whenever the question is saved, the cached renderings of the question are keyed on it
+        """
+        return self.time_modified.timestamp() if self.time_modified else None
+
     def save(self, *args, **kwargs):
         if self.max_submission_allowed is None:
             self.max_submission_allowed = 10 if self.event is not None and self.event.type == "EXAM" else 100
 
+        created = self.pk is None
         super().save(*args, **kwargs)
         ensure_uqj(None, self)
 
+        update_search_document(self)
+        if created:
+            update_category_stats(self.category_id, num_questions=1)
+        elif self.category_id != self._loaded_category_id:
+            stats = QuestionStats.objects.filter(question=self).first() or QuestionStats()
+            update_category_stats(self._loaded_category_id, num_questions=-1, attempted=-stats.attempted,
+                                  solved=-stats.solved)
+            update_category_stats(self.category_id, num_questions=1, attempted=stats.attempted, solved=stats.solved)
+            move_user_category_stats(self.pk, self._loaded_category_id, self.category_id)
+        if not created and self.event_id != self._loaded_event_id:
+            # The tokens received in the question move from the course of the old event to the new one
+            events = Event.objects.filter(pk__in=[self._loaded_event_id, self.event_id], count_for_tokens=True)
+            for course_id in set(events.values_list('course_id', flat=True)):
+                rebuild_token_balances(course_id=course_id)
+        self._loaded_category_id = self.category_id
+        self._loaded_event_id = self.event_id
+
+    def delete(self, *args, **kwargs):
+        stats = QuestionStats.objects.filter(question=self).first() or QuestionStats()
+        category_id = self.category_id
+        question_id = self.pk
+        result = super().delete(*args, **kwargs)
+        remove_search_document(question_id)
+        update_category_stats(category_id, num_questions=-1, attempted=-stats.attempted, solved=-stats.solved)
+        if self.event is not None and self.event.count_for_tokens:
+            # The tokens received in the question are gone with its user question junctions
+            rebuild_token_balances(course_id=self.event.course_id)
+        return result
+
     def has_view_permission(self, user):
         if user.is_teacher:
             return True
@@ -163,6 +288,59 @@ class Question(PolymorphicModel):
         return user.is_teacher
 
 
+class QuestionStats(models.Model):
+    """
+    Submission statistics of a question, updated when a submission is finalized.
+    Can be recomputed with the rebuild-question-stats command.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='stats')
+    attempted = models.IntegerField(default=0)
+    solved = models.IntegerField(default=0)
+    partially_solved = models.IntegerField(default=0)
+    total_submissions = models.IntegerField(default=0)
+    attempts_to_solve = models.IntegerField(default=0)
+    first_try_solved = models.IntegerField(default=0)
+
+    @property
+    def success_rate(self):
+        if self.attempted == 0:
+            return 0
+        return self.solved / self.attempted
+
+    @property
+    def mean_attempts_to_solve(self):
+        if self.solved == 0:
+            return 0
+        return self.attempts_to_solve / self.solved
+
+    @property
+    def first_try_success_rate(self):
+        if self.attempted == 0:
+            return 0
+        return self.first_try_solved / self.attempted
+
+    def __str__(self):
+        return "Stats of {}".format(self.question)
+
+
+class QuestionSearchDocument(models.Model):
+    """
+    Searchable text of a question. The search vector is only maintained on PostgreSQL.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='search_document')
+    title = models.TextField(blank=True)
+    text = models.TextField(blank=True)
+    categories = models.TextField(blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    def get_fields(self):
+        return {
+            'title': self.title,
+            'text': self.text,
+            'categories': self.categories,
+        }
+
+
 class VariableQuestion(Question):
     variables = JSONField()
 
@@ -215,8 +393,18 @@ class UserQuestionJunction(models.Model):
         unique_together = ('user', 'question')
 
     def viewed(self):
-        self.last_viewed = datetime.now()
-        self.save()
+        """
+        Bump last_viewed with a single column update, skipped if the question was viewed within the debounce window
+        """
+        now = timezone.now()
+        threshold = now - timedelta(seconds=settings.LAST_VIEWED_DEBOUNCE_SECONDS)
+        if self.last_viewed is not None and self.last_viewed > threshold:
+            return
+
+        UserQuestionJunction.objects \
+            .filter(models.Q(last_viewed__isnull=True) | models.Q(last_viewed__lte=threshold), pk=self.pk) \
+            .update(last_viewed=now)
+        self.last_viewed = now
 
     @property
     def is_allowed_to_submit(self):
@@ -227,7 +415,7 @@ class UserQuestionJunction(models.Model):
         if self.is_solved:
             return False
 
-        return self.submissions.count() < self.question.max_submission_allowed and self.question.is_open
+        return self.num_attempts() < self.question.max_submission_allowed and self.question.is_open
 
     def _get_variables(self):
         if not isinstance(self.question, VariableQuestion):
@@ -273,19 +461,33 @@ class UserQuestionJunction(models.Model):
         random.shuffle(lines)
         return lines
 
+    @cached_property
+    def submission_summary(self):
+        return get_submission_summary(self)
+
     def num_attempts(self):
+        num_submissions = getattr(self, 'num_submissions', None)
+        if num_submissions is not None:
+            return num_submissions
         return self.submissions.count()
 
     def formatted_num_attempts(self):
         return "Used " + str(self.num_attempts()) + " out of " + str(self.question.max_submission_allowed)
 
+    @property
+    def has_submissions(self):
+        num_submissions = getattr(self, 'num_submissions', None)
+        if num_submissions is not None:
+            return num_submissions > 0
+        return self.submissions.exists()
+
     @property
     def status_class(self):
         if self.is_solved:
             return "table-success"
         if self.is_partially_solved:
             return "table-warning"
-        if self.submissions.exists():
+        if self.has_submissions:
             return "table-danger"
         return ""
 
@@ -295,7 +497,7 @@ class UserQuestionJunction(models.Model):
             return "Solved"
         if self.is_partially_solved:
             return "Partially Solved"
-        if self.submissions.exists():
+        if self.has_submissions:
             return "Wrong"
         if self.last_viewed:
             return "Unsolved"
@@ -327,6 +529,14 @@ class Submission(PolymorphicModel):
     show_answer = True
     show_detail = False
 
+    _was_finalized = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._was_finalized = instance.__dict__.get('finalized', False)
+        return instance
+
     @property
     def question(self):
         return self.uqj.question
@@ -374,7 +584,7 @@ class Submission(PolymorphicModel):
 
     @property
     def token_value(self):
-        return get_token_value(self.question.category, self.question.difficulty)
+        return get_token_value(self.question.category_id, self.question.difficulty)
 
     @property
     def formatted_tokens_received(self):
@@ -384,13 +594,18 @@ class Submission(PolymorphicModel):
         if self.finalized:
             return
 
-        self.is_correct, self.grade = self.uqj.question.grader.grade(self)
+        submission_type = self.__class__.__name__
+        with GRADING_SECONDS.time(type=submission_type):
+            self.is_correct, self.grade = self.uqj.question.grader.grade(self)
 
         if not self.is_correct and self.grade > 0:
             self.is_partially_correct = True
 
         if not self.in_progress:
             self.finalized = True
+            turnaround = timezone.now() - self.submission_time if self.submission_time else timedelta()
+            GRADING_TURNAROUND_SECONDS.observe(turnaround.total_seconds(), type=submission_type)
+            SUBMISSIONS_GRADED.inc(type=submission_type, result=self.status)
 
         if commit:
             self.save()
@@ -401,23 +616,50 @@ class Submission(PolymorphicModel):
             self.calculate_grade()
         return self.grade
 
-    def save(self, *args, **kwargs):
-
+    def save(self, *args, actions=None, **kwargs):
+        """
+        When a list is given as `actions`, the action of the submission is appended to it instead of being created,
+        so that the actions of several submissions can be created together with Action.create_actions
+        """
         if not self.finalized:
             self.calculate_grade(commit=False)
 
-        if not self.in_progress and (self.is_correct or self.is_partially_correct or self.question.is_exam):
-            user_question_junction = self.uqj
-            received_tokens = self.grade * self.token_value
-            token_change = received_tokens - user_question_junction.tokens_received
-
-            if self.question.is_exam or token_change > 0:
-                user_question_junction.tokens_received = received_tokens
-                user_question_junction.save()
-
-            Action.create_action(self.user, self.get_description(), received_tokens, Action.COMPLETE)
-
-        super().save(*args, **kwargs)
+        is_new = self._state.adding
+        was_finalized = self._was_finalized
+        with transaction.atomic():
+            if not self.in_progress and (self.is_correct or self.is_partially_correct or self.question.is_exam):
+                user_question_junction = self.uqj
+                received_tokens = self.grade * self.token_value
+                token_change = received_tokens - user_question_junction.tokens_received
+
+                if self.question.is_exam or token_change > 0:
+                    user_question_junction.tokens_received = received_tokens
+                    user_question_junction.save()
+                    record_tokens_received(user_question_junction, token_change)
+
+                if actions is None:
+                    Action.create_action(self.user, self.get_description(), received_tokens, Action.COMPLETE)
+                else:
+                    actions.append(Action(user=self.user, description=self.get_description(),
+                                          token_change=received_tokens, status=Action.COMPLETE))
+
+            super().save(*args, **kwargs)
+
+            if self.finalized and not self._was_finalized:
+                record_submission_stats(self)
+                self._was_finalized = True
+
+        self.uqj.__dict__.pop('submission_summary', None)
+        self._record_exam_counters(is_new, was_finalized)
+
+    def _record_exam_counters(self, is_new, was_finalized):
+        event = self.question.event
+        if event is None or not event.is_exam:
+            return
+        if is_new:
+            record_exam_submission(event.pk, self.uqj.user_id, self.finalized)
+        elif self.finalized and not was_finalized:
+            record_exam_submission_graded(event.pk)
 
     def submit(self):
         pass
@@ -1,14 +1,42 @@
-from django.test import TestCase, Client
+import asyncio
+import pstats
+import tempfile
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
 
 from accounts.models import MyUser
-from course.models.models import QuestionCategory, Question, Event, CanvasCourse
-from course.utils.utils import create_multiple_choice_question, create_java_question
+from canvas.models import CanvasCourseRegistration
+from course.models.models import QuestionCategory, Question, Event, CanvasCourse, TokenValue, QuestionStats, \
+    MultipleChoiceQuestion, MultipleChoiceSubmission, UserQuestionJunction, CategoryStats
+from course.utils.category_stats import refresh_category_stats, rebuild_user_category_stats
+from course.utils.question_stats import rebuild_question_stats
+from course.utils.search import search_questions, inverted_index
+from course.utils.submission_events import submission_status_stream
+from course.utils.token_values import token_value_table, TokenValueTable
+from course.views.views import PROBLEM_SET_PAGE_SIZE
+from utils.cache_versions import bump_cache_versions, get_cache_versions
+from utils.instrumentation import request_stats_table, get_query_fingerprint
+from utils.metrics import MetricsRegistry, FileStore, get_store
+from utils.request_cache import request_cache_middleware, get_request_cache
+from course.utils.utils import create_multiple_choice_question, create_java_question, get_token_value, \
+    get_token_values, get_user_question_junction
 
 
 class ProblemTestCase(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
 
         MyUser.objects.create_user("test_user", "test@s202.ok.ubc.ca", "aaaaaaaa")
@@ -108,3 +136,640 @@ class EnsureUQJTest(ProblemTestCase):
         self.assertEquals(self.user.question_junctions.count(), Question.objects.all().count())
         self.assertEquals(user.question_junctions.count(), Question.objects.all().count())
         self.assertEqual(Question.objects.first().user_junctions.count(), MyUser.objects.count())
+
+
+class TokenValueTest(ProblemTestCase):
+
+    def test_token_value_lookup(self):
+        token_value_table.invalidate()
+        self.assertEqual(get_token_value(self.category, "EASY"), 1)
+        get_token_values()
+
+        question = Question.objects.first()
+        with self.assertNumQueries(0):
+            self.assertEqual(question.token_value, 1)
+            self.assertEqual(get_token_value(self.category.pk, "EASY"), 1)
+            self.assertEqual(get_token_value(None, "EASY"), 0)
+
+    def test_token_value_invalidation(self):
+        self.assertEqual(get_token_value(self.category, "HARD"), 3)
+
+        TokenValue.objects.filter(category=self.category, difficulty="HARD").get().delete()
+        TokenValue(category=self.category, difficulty="HARD", value=5).save()
+        self.assertEqual(get_token_value(self.category, "HARD"), 5)
+
+    @override_settings(CACHES={
+        'default': settings.CACHES['default'],
+        'token_values': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'token_values_cache'},
+    }, TOKEN_VALUES_CACHE='token_values')
+    def test_token_value_invalidation_across_processes(self):
+        call_command('createcachetable', verbosity=0)
+        token_value_table.invalidate()
+        self.assertEqual(get_token_value(self.category, "HARD"), 3)
+        other_process = TokenValueTable()
+        self.assertEqual(other_process.get_values()[(self.category.pk, "HARD")], 3)
+
+        TokenValue.objects.filter(category=self.category, difficulty="HARD").update(value=5)
+        token_value_table.invalidate()
+        other_process.last_check = 0
+        self.assertEqual(other_process.get_values()[(self.category.pk, "HARD")], 5)
+
+    @override_settings(TOKEN_VALUES_CACHE='default')
+    def test_token_values_process_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            token_value_table.invalidate()
+
+
+class TokenValuesTableTest(ProblemTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            QuestionCategory(name="sub category {}".format(i), description="", parent=self.category).save()
+        teacher = MyUser.objects.create_user("teacher", "teacher@s202.ok.ubc.ca", "aaaaaaaa", role="Teacher")
+        self.client.force_login(teacher)
+
+    def test_token_values_table(self):
+        response = self.client.get('/course/token-values')
+        self.assertEqual(response.context['values'], [[1, 2, 3]] * 3)
+        self.assertEqual(TokenValue.objects.filter(category__parent=self.category).count(), 9)
+
+        values = [str(i) for i in range(9)]
+        response = self.client.post('/course/token-values', {'values[]': values})
+        self.assertEqual(response.context['values'], [[0, 1, 2], [3, 4, 5], [6, 7, 8]])
+
+        category = QuestionCategory.objects.get(name="sub category 2")
+        self.assertEqual(get_token_value(category, "HARD"), 8)
+
+
+class QuestionStatsTest(ProblemTestCase):
+
+    def submit(self, user, question, answer):
+        uqj = UserQuestionJunction.objects.get(user=user, question=question)
+        MultipleChoiceSubmission(uqj=uqj, answer=answer).save()
+
+    def test_question_stats(self):
+        question = MultipleChoiceQuestion.objects.first()
+        user2 = MyUser.objects.get(username='test_user2')
+
+        self.submit(self.user, question, 'b')
+        self.submit(self.user, question, 'a')
+        self.submit(self.user, question, 'a')
+        self.submit(user2, question, 'a')
+
+        stats = QuestionStats.objects.get(question=question)
+        self.assertEqual((stats.attempted, stats.solved, stats.total_submissions), (2, 2, 4))
+        self.assertEqual(stats.mean_attempts_to_solve, 1.5)
+        self.assertEqual(stats.first_try_success_rate, 0.5)
+        self.assertEqual(Question.objects.get(pk=question.pk).success_rate, 1)
+
+        expected = [getattr(stats, field.name) for field in QuestionStats._meta.fields if field.name != 'id']
+        rebuild_question_stats()
+        stats = QuestionStats.objects.get(question=question)
+        self.assertEqual([getattr(stats, field.name) for field in QuestionStats._meta.fields if field.name != 'id'],
+                         expected)
+
+
+class CategoryStatsTest(ProblemTestCase):
+
+    def test_category_stats(self):
+        sub_category = QuestionCategory(name="sub category", description="", parent=self.category)
+        sub_category.save()
+        question = MultipleChoiceQuestion.objects.first()
+        question.category = sub_category
+        question.save()
+
+        uqj = UserQuestionJunction.objects.get(user=self.user, question=question)
+        MultipleChoiceSubmission(uqj=uqj, answer='b').save()
+        uqj = UserQuestionJunction.objects.get(user=self.user, question=MultipleChoiceQuestion.objects.last())
+        MultipleChoiceSubmission(uqj=uqj, answer='a').save()
+
+        expected = {
+            self.category.pk: (20, 50),
+            sub_category.pk: (1, 0),
+        }
+        for _ in range(2):
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/question-category/')
+            self.assertEqual({
+                category['pk']: (category['numQuestions'], category['avgSuccess']) for category in response.json()
+            }, expected)
+            refresh_category_stats()
+
+    def test_parent_change(self):
+        sub_category = QuestionCategory(name="sub category", description="", parent=self.category)
+        sub_category.save()
+        question = MultipleChoiceQuestion.objects.first()
+        question.category = sub_category
+        question.save()
+        uqj = UserQuestionJunction.objects.get(user=self.user, question=question)
+        MultipleChoiceSubmission(uqj=uqj, answer='a').save()
+
+        other_category = QuestionCategory(name="other category", description="")
+        other_category.save()
+        sub_category = QuestionCategory.objects.get(pk=sub_category.pk)
+        sub_category.parent = other_category
+        sub_category.save()
+
+        stats = {stats.category_id: (stats.num_questions, stats.attempted, stats.solved)
+                 for stats in CategoryStats.objects.all()}
+        self.assertEqual(stats, {
+            self.category.pk: (19, 0, 0),
+            sub_category.pk: (1, 1, 1),
+            other_category.pk: (1, 1, 1),
+        })
+
+
+class UserCategoryStatsTest(ProblemTestCase):
+
+    def test_user_stats(self):
+        for question in MultipleChoiceQuestion.objects.all()[:2]:
+            uqj = UserQuestionJunction.objects.get(user=self.user, question=question)
+            MultipleChoiceSubmission(uqj=uqj, answer='a').save()
+
+        expected = [{'category': self.category.pk, 'avgSuccess': 10}]
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/user-stats/{}/'.format(self.user.pk))
+        self.assertEqual(response.json()['successRateByCategory'], expected)
+
+        rebuild_user_category_stats()
+        response = self.client.get('/api/user-stats/', {'course': self.course.pk})
+        self.assertEqual(response.json()['results'], [])
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/user-stats/')
+        self.assertEqual(response.json()['results'][0]['successRateByCategory'], expected)
+        self.assertEqual(self.user.success_rate_by_category, expected)
+
+    def test_question_category_change(self):
+        question = MultipleChoiceQuestion.objects.first()
+        uqj = UserQuestionJunction.objects.get(user=self.user, question=question)
+        MultipleChoiceSubmission(uqj=uqj, answer='a').save()
+
+        other_category = QuestionCategory(name="other category", description="")
+        other_category.save()
+        question = MultipleChoiceQuestion.objects.get(pk=question.pk)
+        question.category = other_category
+        question.save()
+
+        stats = {stats.category_id: (stats.attempted, stats.solved) for stats in self.user.category_stats.all()}
+        self.assertEqual(stats, {self.category.pk: (0, 0), other_category.pk: (1, 1)})
+        self.assertEqual(self.user.success_rate_by_category, [
+            {'category': self.category.pk, 'avgSuccess': 0},
+            {'category': other_category.pk, 'avgSuccess': 100},
+        ])
+
+
+class ProblemSetTest(ProblemTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.role = "Teacher"
+        self.user.save()
+        self.client.force_login(self.user)
+        get_token_values()
+
+    def test_problem_set_queries(self):
+        self.client.get('/course/problem-set')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/course/problem-set')
+        self.assertEqual(len(response.context['uqjs']), 20)
+        self.assertIsNone(response.context['next_page_query'])
+
+        for i in range(40):
+            create_multiple_choice_question(
+                title="title",
+                text='text',
+                answer='a',
+                max_submission_allowed=999,
+                tutorial='tt',
+                author=self.user,
+                category=self.category,
+                difficulty="EASY",
+                is_verified=True,
+                variables='[]',
+                choices={'a': 'a', 'b': 'b'},
+                visible_distractor_count=3,
+                event=self.event
+            )
+        get_token_values()
+
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get('/course/problem-set')
+        uqjs = response.context['uqjs']
+        self.assertEqual(len(uqjs), PROBLEM_SET_PAGE_SIZE)
+
+        response = self.client.get('/course/problem-set', {'after': uqjs[-1].question_id})
+        self.assertEqual(len(response.context['uqjs']), 60 - PROBLEM_SET_PAGE_SIZE)
+        self.assertGreater(response.context['uqjs'][0].question_id, uqjs[-1].question_id)
+
+
+class QuestionSearchTest(ProblemTestCase):
+
+    def test_search(self):
+        first, second = MultipleChoiceQuestion.objects.all()[:2]
+        first.title = "Recursion basics"
+        first.save()
+        second.text = "<p>Write a <b>recursive</b> function</p>"
+        second.save()
+
+        inverted_index.clear()
+        ranks = search_questions("recurs")
+        self.assertEqual(set(ranks.keys()), {first.pk, second.pk})
+        self.assertGreater(ranks[first.pk], ranks[second.pk])
+        self.assertEqual(set(search_questions("recursive function").keys()), {second.pk})
+        self.assertEqual(len(search_questions("category")), 20)
+
+        second.text = "Loops"
+        second.save()
+        self.assertEqual(set(search_questions("recurs").keys()), {first.pk})
+
+        self.user.role = "Teacher"
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get('/course/problem-set', {'query': 'Recursion'})
+        self.assertEqual([uqj.question_id for uqj in response.context['uqjs']], [first.pk])
+
+    def test_search_order(self):
+        first, second = MultipleChoiceQuestion.objects.all()[:2]
+        first.text = "<p>Recursion</p>"
+        first.save()
+        second.title = "Recursion"
+        second.save()
+
+        self.user.role = "Teacher"
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get('/course/problem-set', {'query': 'Recursion'})
+        self.assertEqual([uqj.question_id for uqj in response.context['uqjs']], [second.pk, first.pk])
+        response = self.client.get('/course/problem-set', {'query': 'Recursion', 'after': second.pk})
+        self.assertEqual([uqj.question_id for uqj in response.context['uqjs']], [first.pk])
+
+    def test_category_rename(self):
+        search_questions("category")
+        self.category.name = "renamed"
+        with self.assertNumQueries(3):
+            self.category.save()
+        self.assertEqual(len(search_questions("renamed")), 20)
+        self.assertEqual(search_questions("category"), {})
+
+
+class LastViewedTest(ProblemTestCase):
+
+    def test_viewed_debounce(self):
+        uqj = UserQuestionJunction.objects.filter(user=self.user).first()
+        with self.assertNumQueries(1):
+            uqj.viewed()
+        first_viewed = UserQuestionJunction.objects.get(pk=uqj.pk).last_viewed
+        self.assertIsNotNone(first_viewed)
+
+        with self.assertNumQueries(0):
+            uqj.viewed()
+        uqj = UserQuestionJunction.objects.get(pk=uqj.pk)
+        uqj.viewed()
+        self.assertEqual(UserQuestionJunction.objects.get(pk=uqj.pk).last_viewed, first_viewed)
+
+        with self.settings(LAST_VIEWED_DEBOUNCE_SECONDS=0):
+            uqj.viewed()
+        self.assertGreater(UserQuestionJunction.objects.get(pk=uqj.pk).last_viewed, first_viewed)
+
+
+class RequestCacheTest(ProblemTestCase):
+
+    def test_request_identity_map(self):
+        question = Question.objects.first()
+        get_user_question_junction(self.user, question)
+
+        def view(request):
+            # the junction, the registration and the event of the question
+            with self.assertNumQueries(3):
+                uqj = get_user_question_junction(self.user, question)
+                self.assertIs(get_user_question_junction(self.user, question), uqj)
+                self.assertFalse(self.course.is_registered(self.user))
+                self.assertFalse(self.event.has_view_permission(self.user))
+                self.assertFalse(question.has_view_permission(self.user))
+            return uqj
+
+        uqj = request_cache_middleware(view)(None)
+        self.assertIsNone(get_request_cache())
+        self.assertIsNot(get_user_question_junction(self.user, question), uqj)
+
+    def test_registration_change(self):
+        def view(request):
+            self.assertFalse(self.event.has_view_permission(self.user))
+            CanvasCourseRegistration(course=self.course, user=self.user, canvas_user_id=1, is_verified=True).save()
+            self.assertTrue(self.event.has_view_permission(self.user))
+
+        request_cache_middleware(view)(None)
+
+
+class RequestInstrumentationTest(ProblemTestCase):
+
+    def setUp(self):
+        super().setUp()
+        request_stats_table.clear()
+        self.client.login(username='test_user', password='aaaaaaaa')
+
+    def test_query_fingerprint(self):
+        self.assertEqual(
+            get_query_fingerprint('SELECT * FROM "q" WHERE "id" IN (%s, %s,%s) LIMIT 21'),
+            get_query_fingerprint('SELECT * FROM "q"  WHERE "id" IN (%s) LIMIT 1'),
+        )
+
+    @override_settings(REQUEST_DUPLICATE_QUERY_BUDGET=0)
+    def test_request_stats(self):
+        with self.assertLogs('utils.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('homepage'))
+        self.assertIn('(homepage) over budget: repeated queries', logs.output[0])
+
+        stats = {s['view_name']: s for s in request_stats_table.get_stats()}['homepage']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['sql_count'], 0)
+        self.assertGreater(stats['template_time'], 0)
+
+        self.assertEqual(self.client.get(reverse('request_stats')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('request_stats'))
+        self.assertIn('homepage', [s['view_name'] for s in response.json()['views']])
+
+
+class MetricsTest(ProblemTestCase):
+
+    def test_metrics_view(self):
+        self.client.login(username='test_user', password='aaaaaaaa')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        uqj = get_user_question_junction(self.user, MultipleChoiceQuestion.objects.first())
+        MultipleChoiceSubmission(uqj=uqj, answer='b').save()
+        self.client.get(reverse('homepage'))
+        self.user.is_staff = True
+        self.user.save()
+        content = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('submissions_graded_total{type="MultipleChoiceSubmission",result="Wrong"}', content)
+        self.assertIn('http_request_duration_seconds_count{view="homepage",method="GET",status="200"}', content)
+
+    def test_file_aggregation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            workers = [MetricsRegistry(FileStore(directory)) for _ in range(2)]
+            for worker in workers:
+                worker.histogram('test_seconds', 'test', ['view'], buckets=(1,)).observe(0.5, view='a')
+                worker.publish(force=True)
+
+            self.assertIn('test_seconds_bucket{view="a",le="1"} 2\n', workers[0].expose())
+            self.assertIn('test_seconds_sum{view="a"} 1\n', workers[1].expose())
+
+    @override_settings(CACHES={
+        'default': settings.CACHES['default'],
+        'metrics': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'metrics_cache'},
+    }, METRICS_AGGREGATION='cache', METRICS_CACHE='metrics')
+    def test_cache_aggregation(self):
+        call_command('createcachetable', verbosity=0)
+        workers = [MetricsRegistry(get_store()) for _ in range(2)]
+        for worker in workers:
+            worker.counter('test_total', 'test').inc()
+            worker.publish(force=True)
+        self.assertIn('test_total 2\n', workers[0].expose())
+
+        call_command('reset-metrics', stdout=StringIO())
+        self.assertIn('test_total 1\n', workers[0].expose())
+
+    @override_settings(METRICS_AGGREGATION='cache', METRICS_CACHE='default')
+    def test_process_cache_aggregation(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_store()
+
+
+@override_settings(CACHES={
+    'default': settings.CACHES['default'],
+    'profiles': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'profile_cache'},
+}, PROFILE_CACHE='profiles')
+class ProfilingTest(ProblemTestCase):
+
+    def setUp(self):
+        super().setUp()
+        call_command('createcachetable', verbosity=0)
+        self.client.login(username='test_user', password='aaaaaaaa')
+
+    def test_profile_request(self):
+        self.assertFalse(self.client.get(reverse('homepage'), {'profile': 1}).has_header('X-Profile-Id'))
+        self.user.is_staff = True
+        self.user.save()
+
+        profile_id = int(self.client.get(reverse('homepage'), HTTP_X_PROFILE='1')['X-Profile-Id'])
+        self.assertContains(self.client.get(reverse('profiles')), reverse('profile', args=[profile_id]))
+        self.assertContains(self.client.get(reverse('profile', args=[profile_id])), 'canvas_gamification/views.py')
+
+        stacks = self.client.get(reverse('profile_collapsed', args=[profile_id])).content.decode()
+        self.assertIn('(homepage);', stacks)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(self.client.get(reverse('profile_pstats', args=[profile_id])).content)
+            f.flush()
+            self.assertGreater(pstats.Stats(f.name).total_calls, 0)
+
+    @override_settings(PROFILE_CACHE=None)
+    def test_profiling_disabled(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertFalse(self.client.get(reverse('homepage'), HTTP_X_PROFILE='1').has_header('X-Profile-Id'))
+        self.assertEqual(self.client.get(reverse('profiles')).status_code, 404)
+
+    @override_settings(PROFILE_CACHE='default')
+    def test_process_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.client.get(reverse('homepage'))
+
+
+class QuestionConditionalGetTest(ProblemTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.role = 'Teacher'
+        self.user.save()
+        self.client.login(username='test_user', password='aaaaaaaa')
+        self.question = MultipleChoiceQuestion.objects.last()
+        self.url = reverse('course:question_view', args=[self.question.pk])
+
+    def test_not_modified(self):
+        # the first visit sets the csrf cookie the page depends on
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.assertFalse(self.client.post(self.url, {'answer': 'b'}).has_header('ETag'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_submission_changes_history_key(self):
+        self.client.get(self.url)
+        uqj = get_user_question_junction(self.user, self.question)
+        key = make_template_fragment_key('question_submissions', [
+            uqj.pk, 0, None, self.question.revision, self.question.token_value, False])
+        self.assertIsNotNone(cache.get(key))
+
+        submission = MultipleChoiceSubmission(uqj=uqj, answer='b')
+        submission.submit()
+        submission.save()
+        self.client.get(self.url)
+        key = make_template_fragment_key('question_submissions', [
+            uqj.pk, 1, submission.pk, self.question.revision, self.question.token_value, False])
+        self.assertIsNotNone(cache.get(key))
+
+
+@override_settings(CACHES={
+    'default': settings.CACHES['default'],
+    'api': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'api_cache'},
+}, API_CACHE='api')
+class QuestionApiTest(ProblemTestCase):
+
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+        super().setUp()
+        self.user.role = 'Teacher'
+        self.user.save()
+        self.client.login(username='test_user', password='aaaaaaaa')
+
+    def test_paginated_sparse_list(self):
+        response = self.client.get('/api/questions/', {'page_size': 5, 'fields': 'id,title'})
+        page = response.json()
+        self.assertEqual(len(page['results']), 5)
+        self.assertEqual(set(page['results'][0].keys()), {'id', 'title'})
+
+        next_page = self.client.get(page['next']).json()
+        self.assertEqual(next_page['results'][0]['id'], page['results'][-1]['id'] + 1)
+
+    def test_cached_list(self):
+        self.client.get('/api/questions/')
+        # only the session, the user, the version stamps and the cached page are loaded
+        with self.assertNumQueries(4):
+            self.client.get('/api/questions/')
+
+        question = Question.objects.first()
+        question.title = 'new title'
+        question.save()
+        self.assertEqual(self.client.get('/api/questions/').json()['results'][0]['title'], 'new title')
+
+    def test_cached_list_relation_change(self):
+        next_category = QuestionCategory.objects.create(name="next", description="next")
+        self.client.get('/api/question-category/')
+        self.category.next_categories.add(next_category)
+        categories = {category['pk']: category for category in self.client.get('/api/question-category/').json()}
+        self.assertEqual(categories[self.category.pk]['nextCategories'], [next_category.pk])
+
+    @override_settings(API_CACHE='default')
+    def test_process_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.client.get('/api/questions/')
+
+
+class BulkSubmissionTest(ProblemTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.role = 'Teacher'
+        self.user.save()
+        self.client.login(username='test_user', password='aaaaaaaa')
+
+    def test_bulk_submission(self):
+        first, second = MultipleChoiceQuestion.objects.all()[:2]
+        response = self.client.post('/api/multiple-choice-submissions/', {'submissions': [
+            {'question': first.pk, 'answer': 'a'},
+            {'question': first.pk, 'answer': 'a'},
+            {'question': second.pk, 'answer': 'b'},
+            {'question': 0, 'answer': 'a'},
+        ]}, content_type='application/json')
+
+        verdicts = response.json()
+        self.assertEqual([verdict['accepted'] for verdict in verdicts], [True, False, True, False])
+        self.assertEqual(verdicts[0]['status'], 'Correct')
+        self.assertEqual(verdicts[1]['error'], 'You have already submitted this answer!')
+        self.assertEqual(verdicts[2]['status'], 'Wrong')
+        self.assertEqual(MultipleChoiceSubmission.objects.count(), 2)
+        self.assertEqual(self.user.actions.count(), 1)
+        self.assertTrue(UserQuestionJunction.objects.get(user=self.user, question=first).is_solved)
+        stats = QuestionStats.objects.get(question=first)
+        self.assertEqual((stats.attempted, stats.solved, stats.total_submissions), (1, 1, 1))
+
+    def test_invalid_batch(self):
+        response = self.client.post('/api/multiple-choice-submissions/', {'submissions': [
+            {'question': 'first', 'answer': 'a'},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MultipleChoiceSubmission.objects.exists())
+
+
+@override_settings(CACHES={
+    'default': settings.CACHES['default'],
+    'api': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'api_cache'},
+}, API_CACHE='api')
+class CacheVersionsTest(TransactionTestCase):
+
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+
+    def test_bump_on_commit(self):
+        with transaction.atomic():
+            bump_cache_versions(Question)
+            # a concurrent request caches the rows it read before the commit under this stamp
+            version = get_cache_versions([Question])
+        self.assertNotEqual(get_cache_versions([Question]), version)
+
+
+class TokenValueCommitTest(TransactionTestCase):
+
+    def test_invalidate_on_commit(self):
+        category = QuestionCategory.objects.create(name="category", description="category")
+        with transaction.atomic():
+            TokenValue(category=category, difficulty="HARD", value=5).save()
+            # a concurrent request loads the values from before the commit
+            token_value_table.get_values()
+        self.assertIsNone(token_value_table.values)
+
+
+class SubmissionEventsTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = MyUser.objects.create_user('test_user', 'test@s202.ok.ubc.ca', 'aaaaaaaa')
+        question = create_multiple_choice_question(
+            title='title', text='text', answer='a', max_submission_allowed=10, tutorial='', author=self.user,
+            category=None, difficulty='EASY', is_verified=True, variables='[]', choices={'a': 'a', 'b': 'b'},
+            visible_distractor_count=1, event=None,
+        )
+        self.submission = MultipleChoiceSubmission(uqj=get_user_question_junction(self.user, question), answer='a')
+        self.submission.save()
+        self.client.login(username='test_user', password='aaaaaaaa')
+
+    def stream(self, *pks):
+        scope = {'type': 'http', 'path': '/course/submission/events', 'headers': [
+            (b'cookie', '{}={}'.format(settings.SESSION_COOKIE_NAME, self.client.session.session_key).encode()),
+        ], 'query_string': 'pks={}'.format(','.join(str(pk) for pk in pks)).encode()}
+        messages = []
+
+        async def receive():
+            await asyncio.sleep(60)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(submission_status_stream)(scope, receive, send)
+        return messages
+
+    def test_stream(self):
+        other = MultipleChoiceSubmission(uqj=self.submission.uqj, answer='b')
+        other.save()
+        messages = self.stream(self.submission.pk, other.pk)
+        self.assertEqual(messages[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in messages[1:]).decode()
+        self.assertEqual(body.count('event: result'), 2)
+        self.assertIn('"status": "Correct"', body)
+        self.assertIn('"status": "Wrong"', body)
+
+        self.assertEqual(self.stream(other.pk + 1)[0]['status'], 404)
+
+    def test_fallback(self):
+        response = self.client.get('/course/submission/events', {'pks': self.submission.pk})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn(b'event: result', response.content)
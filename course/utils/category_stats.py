@@ -0,0 +1,153 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Sum, F, Q, Value
+from django.db.models.functions import Coalesce
+
+from utils.cache_versions import bump_cache_versions
+
+
+def update_category_stats(category_id, **changes):
+    """
+    Add the changes to the stats of the category and of its parent category
+    """
+    from course.models.models import QuestionCategory, CategoryStats
+
+    if category_id is None:
+        return
+    parent_id = QuestionCategory.objects.filter(pk=category_id).values_list('parent_id', flat=True).first()
+    changes = {field: value for field, value in changes.items() if value}
+    if not changes:
+        return
+
+    category_ids = [pk for pk in (category_id, parent_id) if pk is not None]
+    for pk in category_ids:
+        CategoryStats.objects.get_or_create(category_id=pk)
+    CategoryStats.objects.filter(category_id__in=category_ids) \
+        .update(**{field: F(field) + value for field, value in changes.items()})
+    bump_cache_versions(CategoryStats)
+
+
+def refresh_category_stats():
+    """
+    Recompute the stats of every category from its questions and the questions of its child categories.
+    Returns the number of categories with stats.
+    """
+    from course.models.models import Question, CategoryStats
+
+    rows = Question.objects.filter(category__isnull=False) \
+        .values_list('category_id', 'category__parent_id') \
+        .annotate(num_questions=Count('pk'), attempted=Coalesce(Sum('stats__attempted'), Value(0)),
+                  solved=Coalesce(Sum('stats__solved'), Value(0))) \
+        .order_by()
+
+    totals = {}
+    for category_id, parent_id, num_questions, attempted, solved in rows:
+        for pk in (category_id, parent_id):
+            if pk is None:
+                continue
+            totals.setdefault(pk, Counter()).update(num_questions=num_questions, attempted=attempted, solved=solved)
+
+    with transaction.atomic():
+        CategoryStats.objects.all().delete()
+        CategoryStats.objects.bulk_create([
+            CategoryStats(category_id=category_id, **total) for category_id, total in totals.items()
+        ])
+    bump_cache_versions(CategoryStats)
+
+    return len(totals)
+
+
+def update_user_category_stats(user_id, category_id, **changes):
+    from course.models.models import UserCategoryStats
+
+    changes = {field: value for field, value in changes.items() if value}
+    if not changes:
+        return
+
+    stats, _ = UserCategoryStats.objects.get_or_create(user_id=user_id, category_id=category_id)
+    UserCategoryStats.objects.filter(pk=stats.pk) \
+        .update(**{field: F(field) + value for field, value in changes.items()})
+    bump_cache_versions(UserCategoryStats)
+
+
+def move_user_category_stats(question_id, old_category_id, new_category_id):
+    """
+    Move the question from the per user stats of its old category to the stats of its new category, for every user
+    who attempted it
+    """
+    from course.models.models import UserQuestionJunction, UserCategoryStats
+
+    finalized = Q(submissions__finalized=True)
+    rows = UserQuestionJunction.objects.filter(question_id=question_id).values_list('user_id') \
+        .annotate(attempted=Count('pk', filter=finalized, distinct=True),
+                  solved=Count('pk', filter=finalized & Q(submissions__is_correct=True), distinct=True)) \
+        .filter(attempted__gt=0) \
+        .order_by()
+
+    user_ids_by_solved = {}
+    for user_id, _, solved in rows:
+        user_ids_by_solved.setdefault(solved, []).append(user_id)
+    if not user_ids_by_solved:
+        return
+
+    with transaction.atomic():
+        UserCategoryStats.objects.bulk_create([
+            UserCategoryStats(user_id=user_id, category_id=new_category_id)
+            for user_ids in user_ids_by_solved.values() for user_id in user_ids
+        ], ignore_conflicts=True)
+        for solved, user_ids in user_ids_by_solved.items():
+            UserCategoryStats.objects.filter(user_id__in=user_ids, category_id=old_category_id) \
+                .update(attempted=F('attempted') - 1, solved=F('solved') - solved)
+            UserCategoryStats.objects.filter(user_id__in=user_ids, category_id=new_category_id) \
+                .update(attempted=F('attempted') + 1, solved=F('solved') + solved)
+    bump_cache_versions(UserCategoryStats)
+
+
+def rebuild_user_category_stats(user_ids=None):
+    """
+    Recompute the per user category stats from the user question junctions.
+    Returns the number of (user, category) pairs with stats.
+    """
+    from course.models.models import UserQuestionJunction, UserCategoryStats
+
+    uqjs = UserQuestionJunction.objects.all()
+    stats = UserCategoryStats.objects.all()
+    if user_ids is not None:
+        uqjs = uqjs.filter(user_id__in=user_ids)
+        stats = stats.filter(user_id__in=user_ids)
+
+    finalized = Q(submissions__finalized=True)
+    rows = uqjs.values_list('user_id', 'question__category_id') \
+        .annotate(attempted=Count('pk', filter=finalized, distinct=True),
+                  solved=Count('pk', filter=finalized & Q(submissions__is_correct=True), distinct=True)) \
+        .filter(attempted__gt=0) \
+        .order_by()
+
+    new_stats = [
+        UserCategoryStats(user_id=user_id, category_id=category_id, attempted=attempted, solved=solved)
+        for user_id, category_id, attempted, solved in rows
+    ]
+    with transaction.atomic():
+        stats.delete()
+        UserCategoryStats.objects.bulk_create(new_stats)
+    bump_cache_versions(UserCategoryStats)
+
+    return len(new_stats)
+
+
+def get_category_question_counts():
+    """
+    Returns a dict of category id to the number of questions in the category
+    """
+    from course.models.models import Question
+
+    return dict(Question.objects.values_list('category_id').annotate(Count('pk')).order_by('category_id'))
+
+
+def get_success_rate_by_category(user_category_stats, question_counts):
+    solved = {stats.category_id: stats.solved for stats in user_category_stats}
+    return [{
+        'category': category_id,
+        'avgSuccess': 100 * solved.get(category_id, 0) / num_questions,
+    } for category_id, num_questions in question_counts.items()]
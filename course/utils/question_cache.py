@@ -0,0 +1,53 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+
+def get_submission_summary(uqj):
+    """
+    Returns the number of submissions, the number of submissions still being graded and the time and id of the
+    latest submission of a user question junction
+    """
+    return uqj.submissions.aggregate(
+        num=Count('pk'),
+        pending=Count('pk', filter=Q(finalized=False)),
+        latest=Max('submission_time'),
+        latest_pk=Max('pk'),
+    )
+
+
+def get_question_etag(request, question, uqj, title):
+    """
+    Returns the ETag of the question page of the user, or None when the page has to be rendered again anyway
+    """
+    user = request.user
+    summary = uqj.submission_summary
+    if not user.is_authenticated or summary['pending'] or len(get_messages(request)):
+        return None
+
+    parts = [
+        question.pk, question.revision, question.token_value, question.is_open, question.is_exam_and_open, title,
+        uqj.pk, uqj.random_seed, uqj.opened_tutorial, uqj.tokens_received, uqj.is_solved, uqj.is_partially_solved,
+        summary['num'], summary['latest'],
+        user.pk, user.role, user.username, user.first_name, user.tokens,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+    ]
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def get_question_not_modified_response(request, etag):
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=etag)
+
+
+def set_question_etag(response, etag):
+    if etag is not None and response.status_code == 200:
+        response['ETag'] = etag
+    # The page is private to the user and has to be revalidated on every visit
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,128 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Q, F
+
+from course.utils.category_stats import update_category_stats, update_user_category_stats
+from utils.cache_versions import bump_cache_versions
+
+
+def get_stats_change(num_previous, num_previous_correct, num_previous_partial, is_correct, is_partially_correct):
+    """
+    Returns the change in the question stats made by a newly finalized submission of a user question junction,
+    given the number of finalized, correct and partially correct submissions the junction had before it.
+    """
+    change = {'total_submissions': 1}
+
+    if num_previous == 0:
+        change['attempted'] = 1
+        if is_correct:
+            change['first_try_solved'] = 1
+
+    if num_previous_correct == 0:
+        if is_correct:
+            change['solved'] = 1
+            change['attempts_to_solve'] = num_previous + 1
+            if num_previous_partial > 0:
+                change['partially_solved'] = -1
+        elif is_partially_correct and num_previous_partial == 0:
+            change['partially_solved'] = 1
+
+    return change
+
+
+def record_submission_stats(submission):
+    """
+    Update the stats of the question of a submission that has just been finalized. Has to be called in the transaction
+    saving the submission, the user question junction is locked until its end so that concurrent submissions of the
+    junction count each other as previous submissions.
+    """
+    from course.models.models import UserQuestionJunction
+
+    list(UserQuestionJunction.objects.select_for_update().filter(pk=submission.uqj_id).values_list('pk'))
+    previous = submission.uqj.submissions.filter(finalized=True).exclude(pk=submission.pk).aggregate(
+        total=Count('pk'),
+        correct=Count('pk', filter=Q(is_correct=True)),
+        partial=Count('pk', filter=Q(is_partially_correct=True)),
+    )
+    record_submissions_stats([submission], {
+        submission.uqj_id: [previous['total'], previous['correct'], previous['partial']],
+    })
+
+
+def record_submissions_stats(submissions, previous):
+    """
+    Update the stats of the questions of newly finalized submissions, with one update per question and category.
+    `previous` is a dict of user question junction id to the number of finalized, correct and partially correct
+    submissions the junction had before the submissions, it is updated with them.
+    """
+    from course.models.models import QuestionStats
+
+    question_changes = {}
+    category_changes = {}
+    user_category_changes = {}
+    for submission in submissions:
+        counts = previous.setdefault(submission.uqj_id, [0, 0, 0])
+        change = get_stats_change(*counts, submission.is_correct, submission.is_partially_correct)
+        counts[0] += 1
+        counts[1] += submission.is_correct
+        counts[2] += submission.is_partially_correct
+
+        category_id = submission.question.category_id
+        category_change = {field: change[field] for field in ('attempted', 'solved') if field in change}
+        question_changes.setdefault(submission.uqj.question_id, Counter()).update(change)
+        category_changes.setdefault(category_id, Counter()).update(category_change)
+        user_category_changes.setdefault((submission.uqj.user_id, category_id), Counter()).update(category_change)
+
+    QuestionStats.objects.bulk_create([QuestionStats(question_id=pk) for pk in question_changes],
+                                      ignore_conflicts=True)
+    for question_id, change in question_changes.items():
+        QuestionStats.objects.filter(question_id=question_id) \
+            .update(**{field: F(field) + value for field, value in change.items()})
+    bump_cache_versions(QuestionStats)
+    for category_id, change in category_changes.items():
+        update_category_stats(category_id, **change)
+    for (user_id, category_id), change in user_category_changes.items():
+        update_user_category_stats(user_id, category_id, **change)
+
+
+def rebuild_question_stats(question_ids=None):
+    """
+    Recompute the stats of the questions from their finalized submissions.
+    Returns the number of questions with stats.
+    """
+    from course.models.models import Submission, QuestionStats
+
+    submissions = Submission.objects.filter(finalized=True)
+    stats = QuestionStats.objects.all()
+    if question_ids is not None:
+        submissions = submissions.filter(uqj__question_id__in=question_ids)
+        stats = stats.filter(question_id__in=question_ids)
+
+    totals = {}
+    current_uqj_id = None
+    num_previous = num_previous_correct = num_previous_partial = 0
+
+    rows = submissions.order_by('uqj_id', 'submission_time', 'pk') \
+        .values_list('uqj_id', 'uqj__question_id', 'is_correct', 'is_partially_correct')
+    for uqj_id, question_id, is_correct, is_partially_correct in rows.iterator():
+        if uqj_id != current_uqj_id:
+            current_uqj_id = uqj_id
+            num_previous = num_previous_correct = num_previous_partial = 0
+
+        change = get_stats_change(num_previous, num_previous_correct, num_previous_partial,
+                                  is_correct, is_partially_correct)
+        totals.setdefault(question_id, Counter()).update(change)
+
+        num_previous += 1
+        num_previous_correct += is_correct
+        num_previous_partial += is_partially_correct
+
+    with transaction.atomic():
+        stats.delete()
+        QuestionStats.objects.bulk_create([
+            QuestionStats(question_id=question_id, **total) for question_id, total in totals.items()
+        ])
+    bump_cache_versions(QuestionStats)
+
+    return len(totals)
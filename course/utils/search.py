@@ -0,0 +1,233 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from bs4 import BeautifulSoup
+from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import Q, F
+
+SEARCH_CONFIG = 'english'
+# Weight of a term in the title, the category names and the text of a question
+FIELD_WEIGHTS = {
+    'title': 'A',
+    'categories': 'B',
+    'text': 'C',
+}
+RANK_WEIGHTS = {
+    'A': 1.0,
+    'B': 0.4,
+    'C': 0.2,
+}
+
+
+def uses_postgres_search():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def strip_html(html):
+    if not html:
+        return ''
+    return BeautifulSoup(html, 'html.parser').get_text(' ')
+
+
+def get_category_names(category_name, parent_category_name):
+    return ' '.join(name for name in (parent_category_name, category_name) if name)
+
+
+def get_search_fields(title, text, category_name, parent_category_name):
+    return {
+        'title': title or '',
+        'text': strip_html(text),
+        'categories': get_category_names(category_name, parent_category_name),
+    }
+
+
+class InvertedIndex:
+    """
+    Process-local term -> {question id: score} index of the search documents, used when the database has no
+    full text search. It is loaded with a single query and updated in place when a question is saved.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = None
+        self.documents = None
+        self.terms = None
+
+    def _load(self):
+        from course.models.models import QuestionSearchDocument
+
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        for document in QuestionSearchDocument.objects.all():
+            self._add(document.question_id, document.get_fields())
+        self.terms = None
+
+    def _add(self, question_id, fields):
+        scores = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(fields[field]):
+                scores[term] += RANK_WEIGHTS[weight]
+
+        for term, score in scores.items():
+            self.postings[term][question_id] = score
+        self.documents[question_id] = list(scores.keys())
+
+    def _remove(self, question_id):
+        for term in self.documents.pop(question_id, []):
+            self.postings[term].pop(question_id, None)
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def _expand(self, prefix):
+        if self.terms is None:
+            self.terms = sorted(self.postings.keys())
+        start = bisect_left(self.terms, prefix)
+        for term in self.terms[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def update(self, question_id, fields):
+        with self.lock:
+            if self.postings is None:
+                return
+            self._remove(question_id)
+            if fields is not None:
+                self._add(question_id, fields)
+            self.terms = None
+
+    def search(self, query):
+        """
+        Returns a dict of question id to rank of the questions matching every term of the query as a prefix
+        """
+        with self.lock:
+            if self.postings is None:
+                self._load()
+
+            ranks = None
+            for prefix in set(tokenize(query)):
+                scores = defaultdict(float)
+                for term in self._expand(prefix):
+                    for question_id, score in self.postings[term].items():
+                        scores[question_id] += score
+                if ranks is None:
+                    ranks = scores
+                else:
+                    ranks = {question_id: rank + scores[question_id] for question_id, rank in ranks.items()
+                             if question_id in scores}
+            return dict(ranks or {})
+
+    def clear(self):
+        with self.lock:
+            self.postings = self.documents = self.terms = None
+
+
+inverted_index = InvertedIndex()
+
+
+def get_search_vector():
+    vectors = [SearchVector(field, weight=weight, config=SEARCH_CONFIG) for field, weight in FIELD_WEIGHTS.items()]
+    vector = vectors[0]
+    for other in vectors[1:]:
+        vector = vector + other
+    return vector
+
+
+def update_search_document(question):
+    """
+    Index the title, text and category names of the question
+    """
+    from course.models.models import QuestionSearchDocument
+
+    category = question.category
+    fields = get_search_fields(question.title, question.text, category and category.name,
+                               category and category.parent and category.parent.name)
+    QuestionSearchDocument.objects.update_or_create(question_id=question.pk, defaults=fields)
+
+    if uses_postgres_search():
+        QuestionSearchDocument.objects.filter(question_id=question.pk).update(search_vector=get_search_vector())
+    else:
+        inverted_index.update(question.pk, fields)
+
+
+def update_category_search_documents(category):
+    """
+    Index the category names of the questions of the category and of its child categories again, with a single update
+    """
+    from course.models.models import QuestionSearchDocument
+
+    documents = QuestionSearchDocument.objects.filter(
+        Q(question__category=category) | Q(question__category__parent=category))
+    changed_documents = []
+    for document in documents.select_related('question__category__parent'):
+        question_category = document.question.category
+        document.categories = get_category_names(
+            question_category.name, question_category.parent and question_category.parent.name)
+        changed_documents.append(document)
+    QuestionSearchDocument.objects.bulk_update(changed_documents, ['categories'], batch_size=500)
+
+    if uses_postgres_search():
+        documents.update(search_vector=get_search_vector())
+    else:
+        for document in changed_documents:
+            inverted_index.update(document.question_id, document.get_fields())
+
+
+def remove_search_document(question_id):
+    if not uses_postgres_search():
+        inverted_index.update(question_id, None)
+
+
+def rebuild_search_index():
+    """
+    Recreate the search documents of every question. Returns the number of indexed questions.
+    """
+    from course.models.models import Question, QuestionSearchDocument
+
+    rows = Question.objects.values_list('pk', 'title', 'text', 'category__name', 'category__parent__name')
+    documents = [
+        QuestionSearchDocument(question_id=pk, **get_search_fields(title, text, category_name, parent_name))
+        for pk, title, text, category_name, parent_name in rows.iterator()
+    ]
+
+    with transaction.atomic():
+        QuestionSearchDocument.objects.all().delete()
+        QuestionSearchDocument.objects.bulk_create(documents)
+        if uses_postgres_search():
+            QuestionSearchDocument.objects.update(search_vector=get_search_vector())
+
+    inverted_index.clear()
+    return len(documents)
+
+
+def get_search_query(terms):
+    return SearchQuery(' & '.join('{}:*'.format(term) for term in terms), config=SEARCH_CONFIG, search_type='raw')
+
+
+def search_questions(query):
+    """
+    Returns a dict of question id to rank of the questions matching every word of the query, the words are
+    matched as prefixes of the indexed terms
+    """
+    from course.models.models import QuestionSearchDocument
+
+    terms = tokenize(query)
+    if not terms:
+        return {}
+
+    if not uses_postgres_search():
+        return inverted_index.search(query)
+
+    search_query = get_search_query(terms)
+    matches = QuestionSearchDocument.objects \
+        .filter(search_vector=search_query) \
+        .annotate(rank=SearchRank(F('search_vector'), search_query)) \
+        .values_list('question_id', 'rank')
+    return dict(matches)
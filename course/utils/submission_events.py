@@ -0,0 +1,101 @@
+from urllib.parse import parse_qs
+
+from utils.asgi import database_sync_to_async, get_scope_user, EventStream, send_error
+
+# Seconds between two checks of the submissions being graded. Every check calls calculate_grade on each of them,
+# which asks the judge for the results of the code submissions.
+POLL_SECONDS = 2
+# A stream is closed after this many seconds, the browser opens a new one if submissions are still being graded
+STREAM_TIMEOUT_SECONDS = 10 * 60
+# Most submissions followed by one stream
+MAX_STREAMED_SUBMISSIONS = 50
+# Milliseconds the browser waits before asking again when the status is not streamed
+FALLBACK_RETRY_MILLISECONDS = 3000
+
+
+def get_submission_state(submission):
+    """
+    Returns the status of a submission as shown to its user, with the test results once it is graded
+    """
+    from course.models.models import CodeSubmission
+
+    if submission.question.is_exam_and_open:
+        # The grades are hidden until the exam is over
+        return {'pk': submission.pk, 'finalized': submission.finalized,
+                'status': 'Submitted' if submission.finalized else 'Evaluating'}
+
+    state = {
+        'pk': submission.pk,
+        'finalized': submission.finalized,
+        'status': submission.status,
+        'grade': submission.grade,
+        'formatted_tokens_received': submission.formatted_tokens_received,
+    }
+    if submission.finalized and isinstance(submission, CodeSubmission):
+        state['results'] = submission.get_formatted_test_results()
+    return state
+
+
+def parse_submission_pks(value):
+    """
+    Returns the submission ids of a comma separated `pks` parameter
+    """
+    return [int(pk) for pk in value.split(',') if pk.isdigit()][:MAX_STREAMED_SUBMISSIONS]
+
+
+def get_event_name(state):
+    return 'result' if state['finalized'] else 'status'
+
+
+def load_submission_states(pks, user):
+    """
+    Returns the states of the submissions of the user by id, grading first the ones whose results have landed.
+    The ids of the other users' submissions are left out.
+    """
+    from course.models.models import Submission
+
+    submissions = Submission.objects.filter(pk__in=pks, uqj__user_id=user.pk).select_related('uqj__question')
+    states = {}
+    for submission in submissions:
+        if not submission.finalized:
+            submission.calculate_grade()
+        states[submission.pk] = get_submission_state(submission)
+    return states
+
+
+async def submission_status_stream(scope, receive, send):
+    """
+    ASGI handler streaming the status transitions of the submissions of the `pks` query parameter as `status`
+    events, and the final state of each one as a `result` event once it is graded. A page follows all of its
+    submissions being graded with one stream.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode())
+    pks = parse_submission_pks(query.get('pks', [''])[0])
+    user = await database_sync_to_async(get_scope_user)(scope)
+    load_states = database_sync_to_async(load_submission_states)
+    states = await load_states(pks, user)
+    if not states:
+        await send_error(send, 404)
+        return
+
+    stream = EventStream(receive, send)
+    await stream.start()
+    try:
+        for state in states.values():
+            await stream.send_event(get_event_name(state), state)
+
+        pending = [pk for pk, state in states.items() if not state['finalized']]
+        elapsed = 0
+        while pending and elapsed < STREAM_TIMEOUT_SECONDS:
+            if not await stream.wait(POLL_SECONDS):
+                return
+            elapsed += POLL_SECONDS
+
+            new_states = await load_states(pending, user)
+            for pk, state in new_states.items():
+                if state != states[pk]:
+                    await stream.send_event(get_event_name(state), state)
+            states.update(new_states)
+            pending = [pk for pk in pending if pk in new_states and not new_states[pk]['finalized']]
+    finally:
+        await stream.close()
@@ -0,0 +1,137 @@
+from django.db import transaction
+
+from canvas.utils.token_balance import record_tokens_received_in_bulk
+from course.exceptions import SubmissionException
+from course.utils.question_stats import record_submissions_stats
+
+MAX_BULK_SUBMISSIONS = 100
+
+
+def _lock_user_question_junctions(user, questions):
+    """
+    Returns the user question junctions of the questions, locked until the end of the transaction, with the
+    (answer, finalized, is correct, is partially correct) of their previous submissions
+    """
+    from course.models.models import UserQuestionJunction, Submission
+
+    uqjs = {
+        uqj.question_id: uqj
+        for uqj in UserQuestionJunction.objects.select_for_update().filter(user=user, question__in=questions)
+    }
+    for question in questions:
+        if question.pk not in uqjs:
+            uqjs[question.pk] = UserQuestionJunction.objects.create(user=user, question=question)
+
+    previous = {uqj.pk: [] for uqj in uqjs.values()}
+    rows = Submission.objects.filter(uqj__in=uqjs.values()) \
+        .values_list('uqj_id', 'answer', 'finalized', 'is_correct', 'is_partially_correct')
+    for uqj_id, answer, finalized, is_correct, is_partially_correct in rows:
+        previous[uqj_id].append((answer, finalized, is_correct, is_partially_correct))
+
+    for question in questions:
+        uqj = uqjs[question.pk]
+        uqj.user = user
+        uqj.question = question
+        uqj.num_submissions = len(previous[uqj.pk])
+    return uqjs, previous
+
+
+def _check_answer(user, question, uqj, answer, submitted):
+    if question is None or not question.has_view_permission(user):
+        raise SubmissionException("Question not found")
+    if (uqj.pk, answer) in submitted:
+        raise SubmissionException("You have already submitted this answer!")
+    if not uqj.is_allowed_to_submit:
+        raise SubmissionException("You are not allowed to submit")
+
+
+def _save_submissions(user, submissions, previous):
+    """
+    Save the graded submissions and do the bookkeeping of Submission.save for the whole batch
+    """
+    from course.models.models import Submission, UserQuestionJunction
+    from general.models import Action
+
+    uqjs = {}
+    token_changes = {}
+    actions = []
+    for submission in submissions:
+        uqj = uqjs[submission.uqj_id] = submission.uqj
+        question = submission.question
+        if submission.is_correct or submission.is_partially_correct or question.is_exam:
+            received_tokens = submission.grade * submission.token_value
+            token_change = received_tokens - uqj.tokens_received
+            if question.is_exam or token_change > 0:
+                uqj.tokens_received = received_tokens
+                token_changes[uqj] = token_changes.get(uqj, 0) + token_change
+            actions.append(Action(user=user, description=submission.get_description(),
+                                  token_change=received_tokens, status=Action.COMPLETE))
+
+        # Multi table models can not be bulk created, only the rows are inserted one at a time
+        super(Submission, submission).save()
+        submission._was_finalized = True
+
+    for uqj in uqjs.values():
+        rows = previous[uqj.pk] + [
+            (submission.answer, True, submission.is_correct, submission.is_partially_correct)
+            for submission in submissions if submission.uqj is uqj
+        ]
+        uqj.is_solved = any(is_correct for _, _, is_correct, _ in rows)
+        uqj.is_partially_solved = not uqj.is_solved and any(partial for _, _, _, partial in rows)
+    UserQuestionJunction.objects.bulk_update(uqjs.values(), ['tokens_received', 'is_solved', 'is_partially_solved'])
+
+    record_tokens_received_in_bulk(user, list(token_changes.items()))
+    record_submissions_stats(submissions, {
+        uqj_id: [
+            sum(finalized for _, finalized, _, _ in rows),
+            sum(finalized and is_correct for _, finalized, is_correct, _ in rows),
+            sum(finalized and partial for _, finalized, _, partial in rows),
+        ] for uqj_id, rows in previous.items()
+    })
+    Action.create_actions(actions)
+
+
+def submit_multiple_choice_answers(user, answers):
+    """
+    Grade and save a batch of (question id, answer) pairs of multiple choice questions in one transaction.
+    The user question junctions are locked before every pair is checked against the previous submissions and the
+    earlier pairs of the batch, so concurrent batches of the same user are checked one after the other.
+    Returns the saved submission, or the SubmissionException, of every pair.
+    """
+    from course.models.models import MultipleChoiceQuestion, MultipleChoiceSubmission
+
+    question_ids = {question_id for question_id, _ in answers}
+    questions = {
+        question.pk: question
+        for question in MultipleChoiceQuestion.objects.filter(pk__in=question_ids).select_related('event__course')
+    }
+
+    results = []
+    with transaction.atomic():
+        uqjs, previous = _lock_user_question_junctions(user, list(questions.values()))
+        submitted = {(uqj_id, row[0]) for uqj_id, rows in previous.items() for row in rows}
+
+        for question_id, answer in answers:
+            question = questions.get(question_id)
+            uqj = uqjs.get(question_id)
+            try:
+                _check_answer(user, question, uqj, answer, submitted)
+            except SubmissionException as e:
+                results.append(e)
+                continue
+
+            submission = MultipleChoiceSubmission(uqj=uqj, answer=answer)
+            submission.submit()
+            submission.calculate_grade(commit=False)
+            results.append(submission)
+
+            submitted.add((uqj.pk, answer))
+            uqj.num_submissions += 1
+            uqj.is_solved = uqj.is_solved or submission.is_correct
+
+        submissions = [result for result in results if isinstance(result, MultipleChoiceSubmission)]
+        _save_submissions(user, submissions, previous)
+        for submission in submissions:
+            submission._record_exam_counters(True, False)
+
+    return results
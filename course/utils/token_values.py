@@ -0,0 +1,118 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from utils.shared_cache import get_shared_cache
+
+TOKEN_VALUES_VERSION_KEY = 'course:token_values:version'
+VERSION_CHECK_INTERVAL = 5
+
+
+class TokenValueTable:
+    """
+    Process-local (category id, difficulty) -> token value map loaded with a single query.
+
+    Saving or deleting a TokenValue clears the table of the current process and bumps a version stamp
+    in TOKEN_VALUES_CACHE. Other processes compare their version with the stamp at most every VERSION_CHECK_INTERVAL
+    seconds and reload when it has changed. Without TOKEN_VALUES_CACHE they reload every VERSION_CHECK_INTERVAL
+    seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = None
+        self.version = None
+        self.last_check = 0
+
+    @property
+    def version_cache(self):
+        if settings.TOKEN_VALUES_CACHE is None:
+            return None
+        return get_shared_cache('TOKEN_VALUES_CACHE')
+
+    def _get_version(self, cache):
+        version = cache.get(TOKEN_VALUES_VERSION_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(TOKEN_VALUES_VERSION_KEY, version, None)
+            version = cache.get(TOKEN_VALUES_VERSION_KEY, version)
+        return version
+
+    def _load(self):
+        from course.models.models import TokenValue
+
+        cache = self.version_cache
+        version = self._get_version(cache) if cache is not None else None
+        values = {
+            (category_id, difficulty): value
+            for category_id, difficulty, value in TokenValue.objects.values_list('category_id', 'difficulty', 'value')
+        }
+        self.values, self.version, self.last_check = values, version, time.monotonic()
+
+    def _is_stale(self):
+        if self.values is None:
+            return True
+        now = time.monotonic()
+        if now - self.last_check < VERSION_CHECK_INTERVAL:
+            return False
+        self.last_check = now
+        cache = self.version_cache
+        return cache is None or cache.get(TOKEN_VALUES_VERSION_KEY) != self.version
+
+    def get_values(self):
+        with self.lock:
+            if self._is_stale():
+                self._load()
+            return self.values
+
+    def _clear(self):
+        with self.lock:
+            self.values = None
+        cache = self.version_cache
+        if cache is not None:
+            cache.set(TOKEN_VALUES_VERSION_KEY, uuid.uuid4().hex, None)
+
+    def invalidate(self):
+        # Cleared now for the rest of the current transaction, and again once it is committed since another request
+        # may have loaded the values from before the commit in the meantime
+        self._clear()
+        transaction.on_commit(self._clear)
+
+
+token_value_table = TokenValueTable()
+
+
+def invalidate_token_values(**kwargs):
+    token_value_table.invalidate()
+
+
+def get_or_create_token_values(categories):
+    """
+    Returns a dict of (category id, difficulty) to TokenValue for every difficulty of the categories.
+    The missing token values are created with their default value in a single query.
+    """
+    from course.models.models import TokenValue, DIFFICULTY_CHOICES, DEFAULT_TOKEN_VALUES
+
+    def load():
+        return {
+            (token_value.category_id, token_value.difficulty): token_value
+            for token_value in TokenValue.objects.filter(category__in=categories)
+        }
+
+    token_values = load()
+    missing = [
+        TokenValue(category=category, difficulty=difficulty, value=DEFAULT_TOKEN_VALUES.get(difficulty))
+        for category in categories for difficulty, _ in DIFFICULTY_CHOICES
+        if (category.pk, difficulty) not in token_values
+    ]
+
+    if missing:
+        TokenValue.objects.bulk_create(missing, ignore_conflicts=True)
+        invalidate_token_values()
+        # Loaded again since bulk_create does not set the primary keys on every database
+        token_values = load()
+
+    return token_values
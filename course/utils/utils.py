@@ -1,8 +1,20 @@
+from utils.request_cache import memoize
+
+
 def get_user_question_junction(user, question):
+    """
+    Returns the junction of the user and the question. The same instance is returned for the rest of the request.
+    """
+    return memoize(('user_question_junction', user.pk, question.pk),
+                   lambda: _get_or_create_user_question_junction(user, question))
+
+
+def _get_or_create_user_question_junction(user, question):
     from course.models.models import UserQuestionJunction
 
-    if user.question_junctions.filter(question=question).exists():
-        return user.question_junctions.get(question=question)
+    user_question_junction = user.question_junctions.filter(question=question).first()
+    if user_question_junction is not None:
+        return user_question_junction
     user_question_junction = UserQuestionJunction(user=user, question=question)
     user_question_junction.save()
     return user_question_junction
@@ -41,15 +53,28 @@ def ensure_uqj(user, question):
 
 def get_token_value(category, difficulty):
     from course.models.models import TokenValue
+    from course.utils.token_values import token_value_table
 
     if not category or not difficulty:
         return 0
 
-    if not TokenValue.objects.filter(category=category, difficulty=difficulty).exists():
-        token_value = TokenValue(category=category, difficulty=difficulty)
-        token_value.save()
-        return token_value.value
-    return TokenValue.objects.get(category=category, difficulty=difficulty).value
+    category_id = getattr(category, 'pk', category)
+    value = token_value_table.get_values().get((category_id, difficulty))
+    if value is not None:
+        return value
+
+    token_value = TokenValue(category_id=category_id, difficulty=difficulty)
+    token_value.save()
+    return token_value.value
+
+
+def get_token_values():
+    """
+    Returns a dict of (category id, difficulty) to token value without touching the database
+    """
+    from course.utils.token_values import token_value_table
+
+    return token_value_table.get_values()
 
 
 def increment_char(c):
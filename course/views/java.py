@@ -67,7 +67,7 @@ def _java_question_view(request, question, key):
         try:
             submit_solution(question, request.user, answer_dict)
             messages.add_message(request, messages.INFO,
-                                 "Your Code has been submitted and is being evaluated! Refresh page to view results.")
+                                 "Your Code has been submitted and is being evaluated! Its status is updated below.")
         except SubmissionException as e:
             messages.add_message(request, messages.ERROR, "{}".format(e))
 
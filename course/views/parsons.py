@@ -66,7 +66,7 @@ def _parsons_question_view(request, question, key):
         try:
             submit_solution(question, request.user, code)
             messages.add_message(request, messages.INFO,
-                                 "Your code has been submitted and is being evaluated! Refresh page to view results.")
+                                 "Your code has been submitted and is being evaluated! Its status is updated below.")
         except SubmissionException as e:
             messages.add_message(request, messages.ERROR, "{}".format(e))
 
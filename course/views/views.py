@@ -1,24 +1,36 @@
+from functools import partial
+
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
+from django.db import transaction
 from django.db.models import Q, Count
 from django.forms import formset_factory
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, HttpResponse
 from django.shortcuts import render, get_object_or_404
 from rest_framework.reverse import reverse_lazy
 
+from canvas.utils.exam_dashboard import record_exam_activity
 from course.forms.forms import ProblemFilterForm
 from course.forms.java import JavaQuestionForm
 from course.forms.multiple_choice import CheckboxQuestionForm, MultipleChoiceQuestionForm, ChoiceForm
 from course.models.models import Question, MultipleChoiceQuestion, CheckboxQuestion, JavaQuestion, JavaSubmission, \
     QuestionCategory, DIFFICULTY_CHOICES, TokenValue, Submission, UserQuestionJunction
 from course.models.parsons_question import ParsonsQuestion, ParsonsSubmission
-from course.utils.utils import get_user_question_junction
+from course.utils.question_cache import get_question_etag, get_question_not_modified_response, set_question_etag
+from course.utils.search import search_questions
+from course.utils.submission_events import load_submission_states, parse_submission_pks, get_event_name, \
+    FALLBACK_RETRY_MILLISECONDS
+from course.utils.token_values import get_or_create_token_values, invalidate_token_values
+from course.utils.utils import get_user_question_junction, get_question_title
 from course.views.java import _java_question_create_view, _java_question_view, _java_submission_detail_view, \
     _java_question_edit_view
 from course.views.multiple_choice import _multiple_choice_question_create_view, _multiple_choice_question_view, \
     _multiple_choice_question_edit_view
 from course.views.parsons import _parsons_question_create_view, _parsons_question_view, \
     _parsons_submission_detail_view, _parsons_question_edit_view
+from utils.asgi import format_event
+
+PROBLEM_SET_PAGE_SIZE = 50
 
 
 def teacher_check(user):
@@ -65,7 +77,20 @@ def question_view(request, pk, key=None):
 
     uqj = get_user_question_junction(request.user, question)
     uqj.viewed()
+    if question.is_exam_and_open:
+        record_exam_activity(question.event_id, request.user.pk)
+
+    etag = None
+    if request.method == 'GET':
+        etag = get_question_etag(request, question, uqj, get_question_title(request.user, question, key))
+        response = get_question_not_modified_response(request, etag)
+        if response is not None:
+            return response
+
+    return set_question_etag(_question_type_view(request, question, key), etag)
+
 
+def _question_type_view(request, question, key):
     if isinstance(question, JavaQuestion):
         return _java_question_view(request, question, key)
 
@@ -111,6 +136,59 @@ def question_delete_view(request, pk):
     return HttpResponseRedirect(reverse_lazy('course:problem_set'))
 
 
+def _get_page_queries(request, after, last_question_id):
+    """
+    Returns the query strings of the first page, when the page is not the first one, and of the page starting after
+    `last_question_id`, when there is one
+    """
+    params = request.GET.copy()
+    params.pop('after', None)
+    first_page_query = params.urlencode() if after else None
+    next_page_query = None
+    if last_question_id is not None:
+        params['after'] = last_question_id
+        next_page_query = params.urlencode()
+    return first_page_query, next_page_query
+
+
+def _paginate_by_question_id(request, uqjs):
+    """
+    Keyset pagination of the junctions ordered by question id, a page starts after the last question of the
+    previous page. Returns the junctions of the page and the query strings of the first and the next pages.
+    """
+    after = request.GET.get('after', '')
+    if after.isdigit():
+        uqjs = uqjs.filter(question_id__gt=after)
+    uqjs = list(uqjs[:PROBLEM_SET_PAGE_SIZE + 1])
+
+    last_question_id = None
+    if len(uqjs) > PROBLEM_SET_PAGE_SIZE:
+        uqjs = uqjs[:PROBLEM_SET_PAGE_SIZE]
+        last_question_id = uqjs[-1].question_id
+
+    return (uqjs, ) + _get_page_queries(request, after, last_question_id)
+
+
+def _paginate_by_rank(request, uqjs, ranks):
+    """
+    Pagination of the junctions ordered by the search rank of their question, then by question id. The order is
+    computed from the question ids of the matching junctions, a page starts after the last question of the previous
+    page in that order and only its junctions are loaded.
+    """
+    question_ids = sorted(uqjs.values_list('question_id', flat=True), key=lambda pk: (-ranks[pk], pk))
+    after = request.GET.get('after', '')
+    start = 0
+    if after.isdigit() and int(after) in ranks:
+        after_key = (-ranks[int(after)], int(after))
+        start = sum(1 for pk in question_ids if (-ranks[pk], pk) <= after_key)
+    page_ids = question_ids[start:start + PROBLEM_SET_PAGE_SIZE]
+
+    page = {uqj.question_id: uqj for uqj in uqjs.filter(question_id__in=page_ids)}
+    last_question_id = page_ids[-1] if len(question_ids) > start + PROBLEM_SET_PAGE_SIZE else None
+
+    return ([page[pk] for pk in page_ids if pk in page], ) + _get_page_queries(request, after, last_question_id)
+
+
 @user_passes_test(teacher_check)
 def problem_set_view(request):
     query = request.GET.get('query', None)
@@ -121,8 +199,10 @@ def problem_set_view(request):
 
     q = Q(question__is_verified=True)
 
+    ranks = None
     if query:
-        q = q & Q(question__title__contains=query)
+        ranks = search_questions(query)
+        q = q & Q(question_id__in=list(ranks.keys()))
     if difficulty:
         q = q & Q(question__difficulty=difficulty)
     if category:
@@ -138,22 +218,31 @@ def problem_set_view(request):
     if solved == "Partially Correct":
         q = q & Q(is_partially_solved=True)
     if solved == 'Wrong':
-        q = q & Q(submissions__count__gt=0, is_solved=False,
+        q = q & Q(num_submissions__gt=0, is_solved=False,
                   is_partially_solved=False)
     if solved == 'New':
-        q = q & Q(submissions__count=0, last_viewed__isnull=True)
+        q = q & Q(num_submissions=0, last_viewed__isnull=True)
 
     if request.user.is_authenticated:
-        uqjs = request.user.question_junctions.annotate(Count('submissions')).filter(q).all()
+        uqjs = request.user.question_junctions \
+            .annotate(num_submissions=Count('submissions')) \
+            .filter(q) \
+            .select_related('question__author', 'question__event', 'question__category__parent', 'question__stats') \
+            .order_by('question_id')
     else:
         uqjs = UserQuestionJunction.objects.none()
 
+    # The search results are shown by rank
+    paginate = partial(_paginate_by_rank, ranks=ranks) if ranks else _paginate_by_question_id
+    uqjs, first_page_query, next_page_query = paginate(request, uqjs)
     form = ProblemFilterForm(request.GET)
 
     return render(request, 'problem_set.html', {
         'uqjs': uqjs,
         'form': form,
         'header': 'problem_set',
+        'first_page_query': first_page_query,
+        'next_page_query': next_page_query,
     })
 
 
@@ -170,40 +259,54 @@ def submission_detail_view(request, pk):
     raise Http404()
 
 
+def submission_events_view(request):
+    # Served only when the site does not run on ASGI, where the events are streamed by submission_status_stream.
+    # The browser asks again after the retry delay while submissions are being graded.
+    states = load_submission_states(parse_submission_pks(request.GET.get('pks', '')), request.user)
+    if not states:
+        raise Http404()
+
+    events = [format_event(get_event_name(state), state, retry=FALLBACK_RETRY_MILLISECONDS)
+              for state in states.values()]
+    return HttpResponse(''.join(events), content_type='text/event-stream')
+
+
 @user_passes_test(teacher_check)
 def token_values_table_view(request):
-    query_set = QuestionCategory.objects.filter(parent__isnull=False).all()
+    categories = list(QuestionCategory.objects.filter(parent__isnull=False).select_related('parent').all())
+    difficulties = [x for x, y in DIFFICULTY_CHOICES]
+    token_values = get_or_create_token_values(categories)
 
     if request.method == 'POST':
         sent_values = request.POST.getlist('values[]', None)
-        values = []
-
-        for i, category in enumerate(query_set):
-            values.append(sent_values[i * len(DIFFICULTY_CHOICES):(i + 1) * len(DIFFICULTY_CHOICES)])
-
-            for j, difficulty in enumerate([x for x, y in DIFFICULTY_CHOICES]):
-                token_value = TokenValue.objects.get(category=category, difficulty=difficulty)
-                token_value.value = sent_values[i * len(DIFFICULTY_CHOICES) + j]
-                token_value.save()
-    else:
-        values = []
-
-        for category in query_set:
-            values.append([])
-
-            for difficulty, x in DIFFICULTY_CHOICES:
-
-                if TokenValue.objects.filter(category=category, difficulty=difficulty).exists():
-                    token_value = TokenValue.objects.get(category=category, difficulty=difficulty)
-                else:
-                    token_value = TokenValue(category=category, difficulty=difficulty)
-                    token_value.save()
 
-                values[-1].append(token_value.value)
+        try:
+            if len(sent_values) != len(categories) * len(difficulties):
+                raise ValueError()
+
+            changed_token_values = []
+            for i, category in enumerate(categories):
+                for j, difficulty in enumerate(difficulties):
+                    token_value = token_values[(category.pk, difficulty)]
+                    value = float(sent_values[i * len(difficulties) + j])
+                    if token_value.value != value:
+                        token_value.value = value
+                        changed_token_values.append(token_value)
+
+            with transaction.atomic():
+                TokenValue.objects.bulk_update(changed_token_values, ['value'])
+            if changed_token_values:
+                invalidate_token_values()
+            messages.add_message(request, messages.SUCCESS, 'Token values were saved successfully')
+        except ValueError:
+            token_values = get_or_create_token_values(categories)
+            messages.add_message(request, messages.ERROR, 'Invalid token values')
+
+    values = [[token_values[(category.pk, difficulty)].value for difficulty in difficulties] for category in categories]
 
     return render(request, 'token_values_table.html', {
         'values': values,
         'difficulties': [x for d, x in DIFFICULTY_CHOICES],
-        'categories': query_set,
+        'categories': categories,
         'header': 'token_values',
     })
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from utils.metrics import get_store
+
+
+class Command(BaseCommand):
+    help = 'Drop the metrics published by the worker processes to the shared store, run it on deploy'
+
+    def handle(self, *args, **options):
+        store = get_store()
+        if store is None:
+            self.stdout.write('The metrics of the processes are not aggregated')
+            return
+        store.reset()
+        self.stdout.write('Reset the {} store of the metrics'.format(settings.METRICS_AGGREGATION))
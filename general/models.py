@@ -1,5 +1,5 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 
 # Create your models here.
 from djrichtextfield.models import RichTextField
@@ -30,8 +30,28 @@ class Action(models.Model):
 
     @classmethod
     def create_action(cls, user, description, token_change, status):
+        from canvas.utils.token_balance import record_action
+
         action = Action(user=user, description=description, token_change=token_change, status=status)
-        action.save()
+        with transaction.atomic():
+            action.save()
+            record_action(action)
+
+    @classmethod
+    def create_actions(cls, actions):
+        """
+        Insert the unsaved actions with a single query and update the balances of their users
+        """
+        from canvas.utils.token_balance import record_token_changes
+
+        token_changes = {}
+        for action in actions:
+            token_changes[action.user] = token_changes.get(action.user, 0) + action.token_change
+
+        with transaction.atomic():
+            Action.objects.bulk_create(actions)
+            for user, token_change in token_changes.items():
+                record_token_changes(user, None, [], tokens_received=token_change)
 
 
 class ContactUs(models.Model):
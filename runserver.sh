@@ -1,5 +1,8 @@
 #!/bin/bash
 sleep 10
 python manage.py collectstatic --no-input
+python manage.py generate-openapi-schema
 python manage.py migrate --no-input
+python manage.py createcachetable
+python manage.py reset-metrics
 python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import re
+from importlib import import_module
+from http.cookies import SimpleCookie
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    # Stops nginx from buffering the events
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def format_event(event, data, retry=None):
+    """
+    Returns a server-sent event with the json encoded data
+    """
+    lines = []
+    if retry is not None:
+        lines.append('retry: {}'.format(retry))
+    lines.append('event: {}'.format(event))
+    lines.append('data: {}'.format(json.dumps(data)))
+    return '\n'.join(lines) + '\n\n'
+
+
+def database_sync_to_async(func):
+    """
+    Like sync_to_async, for functions using the database outside of the request cycle which closes the connections
+    """
+
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(wrapper)
+
+
+def get_scope_user(scope):
+    """
+    Returns the user of the session cookie of an ASGI connection
+    """
+    from django.contrib.auth import get_user
+
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookies.load(value.decode('latin1'))
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+
+    session_store = import_module(settings.SESSION_ENGINE).SessionStore
+    session = session_store(session_key.value if session_key else None)
+    return get_user(SimpleNamespace(session=session))
+
+
+class EventStream:
+    """
+    Server-sent event response of an ASGI http connection
+    """
+
+    def __init__(self, receive, send):
+        self.receive = receive
+        self.send = send
+        self.disconnected = asyncio.Event()
+        self.listener = None
+
+    async def _listen(self):
+        while True:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                self.disconnected.set()
+                return
+
+    async def start(self):
+        await self.send({'type': 'http.response.start', 'status': 200, 'headers': STREAM_HEADERS})
+        self.listener = asyncio.ensure_future(self._listen())
+
+    async def send_event(self, event, data):
+        await self.send({'type': 'http.response.body', 'body': format_event(event, data).encode(), 'more_body': True})
+
+    async def wait(self, seconds):
+        """
+        Sleep for the given seconds, returns False when the client disconnected in the meantime
+        """
+        try:
+            await asyncio.wait_for(self.disconnected.wait(), seconds)
+        except asyncio.TimeoutError:
+            return True
+        return False
+
+    async def close(self):
+        if self.listener is not None:
+            self.listener.cancel()
+        if not self.disconnected.is_set():
+            await self.send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def send_error(send, status):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def route_streams(routes, default):
+    """
+    ASGI application handing the http requests whose path matches one of the (regex, handler) `routes` to the
+    handler, with the named groups of the regex as keyword arguments, and every other connection to `default`
+    """
+    routes = [(re.compile(pattern), handler) for pattern, handler in routes]
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'http':
+            for pattern, handler in routes:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    return await handler(scope, receive, send, **match.groupdict())
+        return await default(scope, receive, send)
+
+    return application
@@ -0,0 +1,74 @@
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from utils.shared_cache import get_shared_cache
+
+
+def get_versions_cache():
+    """
+    Returns API_CACHE, which holds the version stamps and the responses keyed on them, or None when it is not set
+    """
+    if settings.API_CACHE is None:
+        return None
+    return get_shared_cache('API_CACHE')
+
+
+def get_version_key(model):
+    return 'cache_version:{}'.format(model._meta.label_lower)
+
+
+def get_cache_versions(models):
+    """
+    Returns the version stamps of the models, a stamp changes whenever a row of its model is changed
+    """
+    cache = get_versions_cache()
+    keys = [get_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_cache_versions(*models):
+    """
+    Bump the version stamps of the models now, for the rest of the current transaction, and again once it is
+    committed, since a concurrent request may have cached the rows it read before the commit under the first stamp
+    """
+    cache = get_versions_cache()
+    if not models or cache is None:
+        return
+
+    def bump():
+        cache.set_many({get_version_key(model): uuid.uuid4().hex for model in models}, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def track_cache_versions(*models):
+    """
+    Bump the version stamp of the models, or of their parent model, whenever one of their rows is saved or deleted
+    or one of their many to many relations is changed. Rows changed with queryset updates have to bump the stamp with
+    bump_cache_versions.
+    """
+    def bump(sender, **kwargs):
+        bump_cache_versions(*[model for model in models if issubclass(sender, model)])
+
+    def bump_relation(sender, instance, action, model, **kwargs):
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        # Both sides of the relation are changed, the instance is on one side and the added or removed rows on the
+        # other
+        bump_cache_versions(*[
+            tracked for tracked in models if isinstance(instance, tracked) or issubclass(model, tracked)
+        ])
+
+    dispatch_uid = 'cache_versions:' + ','.join(get_version_key(model) for model in models)
+    post_save.connect(bump, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(bump, weak=False, dispatch_uid=dispatch_uid)
+    m2m_changed.connect(bump_relation, weak=False, dispatch_uid=dispatch_uid)
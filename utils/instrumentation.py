@@ -0,0 +1,267 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template
+
+from utils.metrics import registry, VIEW_REQUEST_SECONDS, OUTBOUND_REQUEST_SECONDS, get_outbound_service
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_install_lock = threading.Lock()
+
+_NUMBERS = re.compile(r'\b\d+\b')
+_PLACEHOLDER_LISTS = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+# Number of repeated queries kept in the aggregates of a view
+TOP_DUPLICATES = 5
+
+
+def get_query_fingerprint(sql):
+    """
+    Returns the sql with its literals and placeholder lists collapsed, queries differing only by their parameters
+    share a fingerprint
+    """
+    sql = _PLACEHOLDER_LISTS.sub('(%s)', sql)
+    sql = _NUMBERS.sub('?', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class RequestMetrics:
+    """
+    Queries, outbound http calls and template renders of one request
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.fingerprint_times = Counter()
+        self.http_calls = []
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def record_query(self, sql, seconds):
+        self.sql_count += 1
+        self.sql_time += seconds
+        fingerprint = get_query_fingerprint(sql)
+        self.fingerprints[fingerprint] += 1
+        self.fingerprint_times[fingerprint] += seconds
+
+    def record_http_call(self, method, url, status, seconds):
+        self.http_calls.append({'method': method, 'host': urlsplit(url).netloc, 'status': status, 'time': seconds})
+
+    def record_template(self, seconds):
+        self.template_time += seconds
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    @property
+    def http_time(self):
+        return sum(call['time'] for call in self.http_calls)
+
+    def get_duplicate_queries(self, threshold=1):
+        """
+        Returns the (fingerprint, count) of the queries run more than `threshold` times, most repeated first
+        """
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > threshold]
+
+    def get_budget_violations(self):
+        violations = []
+        if self.sql_count > settings.REQUEST_QUERY_BUDGET:
+            violations.append('{} queries'.format(self.sql_count))
+        if self.duration * 1000 > settings.REQUEST_TIME_BUDGET_MS:
+            violations.append('{:.0f}ms'.format(self.duration * 1000))
+        if self.get_duplicate_queries(settings.REQUEST_DUPLICATE_QUERY_BUDGET):
+            violations.append('repeated queries')
+        return violations
+
+
+def get_request_metrics():
+    """
+    Returns the metrics of the current request or None outside of a request
+    """
+    return getattr(_local, 'metrics', None)
+
+
+def _record_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics = get_request_metrics()
+        if metrics is not None:
+            metrics.record_query(sql, time.perf_counter() - start)
+
+
+def _instrument_http(send):
+    def instrumented_send(session, request, **kwargs):
+        start = time.perf_counter()
+        status = None
+        try:
+            response = send(session, request, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            seconds = time.perf_counter() - start
+            OUTBOUND_REQUEST_SECONDS.observe(
+                seconds, service=get_outbound_service(request.url), method=request.method, status=status or 'error')
+            metrics = get_request_metrics()
+            if metrics is not None:
+                metrics.record_http_call(request.method, request.url, status, seconds)
+
+    instrumented_send.instrumented = True
+    return instrumented_send
+
+
+def _instrument_template(render):
+    def instrumented_render(template, *args, **kwargs):
+        metrics = get_request_metrics()
+        if metrics is None:
+            return render(template, *args, **kwargs)
+
+        # Templates rendered while rendering another one are already counted in its time
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(template, *args, **kwargs)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.record_template(time.perf_counter() - start)
+
+    instrumented_render.instrumented = True
+    return instrumented_render
+
+
+def install_instrumentation():
+    """
+    Wrap the sending of every outbound http request, the judge, canvas and recaptcha clients all go through
+    requests, and the rendering of the templates loaded by the template engine. Includes and inclusion tags are
+    counted in the render time of the template using them.
+    """
+    with _install_lock:
+        if not getattr(requests.Session.send, 'instrumented', False):
+            requests.Session.send = _instrument_http(requests.Session.send)
+        if not getattr(Template.render, 'instrumented', False):
+            Template.render = _instrument_template(Template.render)
+
+
+class RequestStatsTable:
+    """
+    Per process aggregates of the request metrics by url name
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def add(self, view_name, metrics, over_budget):
+        with self.lock:
+            stats = self.stats.setdefault(view_name, {
+                'view_name': view_name,
+                'requests': 0,
+                'over_budget': 0,
+                'time': 0.0,
+                'max_time': 0.0,
+                'sql_count': 0,
+                'max_sql_count': 0,
+                'sql_time': 0.0,
+                'http_calls': 0,
+                'http_time': 0.0,
+                'template_time': 0.0,
+                'duplicate_queries': Counter(),
+            })
+            stats['requests'] += 1
+            stats['over_budget'] += over_budget
+            stats['time'] += metrics.duration
+            stats['max_time'] = max(stats['max_time'], metrics.duration)
+            stats['sql_count'] += metrics.sql_count
+            stats['max_sql_count'] = max(stats['max_sql_count'], metrics.sql_count)
+            stats['sql_time'] += metrics.sql_time
+            stats['http_calls'] += len(metrics.http_calls)
+            stats['http_time'] += metrics.http_time
+            stats['template_time'] += metrics.template_time
+
+            duplicates = stats['duplicate_queries']
+            for sql, count in metrics.get_duplicate_queries():
+                duplicates[sql] = max(duplicates[sql], count)
+            if len(duplicates) > TOP_DUPLICATES:
+                stats['duplicate_queries'] = Counter(dict(duplicates.most_common(TOP_DUPLICATES)))
+
+    def get_stats(self):
+        """
+        Returns the aggregates of every url name, the slowest in total first
+        """
+        with self.lock:
+            stats = [dict(
+                stats,
+                duplicate_queries=[{'sql': sql, 'count': count} for sql, count in
+                                   stats['duplicate_queries'].most_common()],
+            ) for stats in self.stats.values()]
+        return sorted(stats, key=lambda s: s['time'], reverse=True)
+
+    def clear(self):
+        with self.lock:
+            self.stats = {}
+
+
+request_stats_table = RequestStatsTable()
+
+
+def _log_request(request, view_name, metrics, violations):
+    duplicates = metrics.get_duplicate_queries(settings.REQUEST_DUPLICATE_QUERY_BUDGET)
+    logger.warning(
+        "%s %s (%s) over budget: %s. %d queries in %.0fms, %d http calls in %.0fms, templates %.0fms%s",
+        request.method, request.path, view_name, ', '.join(violations),
+        metrics.sql_count, metrics.sql_time * 1000, len(metrics.http_calls), metrics.http_time * 1000,
+        metrics.template_time * 1000,
+        ''.join('\n  {}x {}'.format(count, sql) for sql, count in duplicates),
+    )
+
+
+def _finish_request(request, metrics, response):
+    metrics.finish()
+    resolver_match = getattr(request, 'resolver_match', None)
+    view_name = resolver_match.view_name if resolver_match else '<unresolved>'
+    violations = metrics.get_budget_violations()
+    if violations:
+        _log_request(request, view_name, metrics, violations)
+    request_stats_table.add(view_name, metrics, bool(violations))
+
+    status = response.status_code if response is not None else 500
+    VIEW_REQUEST_SECONDS.observe(metrics.duration, view=view_name, method=request.method, status=status)
+    registry.publish()
+
+
+def instrumentation_middleware(get_response):
+    # Records the queries, outbound http calls and template render time of every request, logs the requests over
+    # the budgets and adds them to the aggregates of their url name and to the request metrics
+    install_instrumentation()
+
+    def middleware(request):
+        metrics = _local.metrics = RequestMetrics()
+        response = None
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_record_query))
+                response = get_response(request)
+            return response
+        finally:
+            _local.metrics = None
+            _finish_request(request, metrics, response)
+
+    return middleware
@@ -0,0 +1,345 @@
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from utils.shared_cache import get_shared_cache, claim_number, get_claimed_values
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join('{}="{}"'.format(name, value) for name, value in escaped) + '}'
+
+
+class Metric:
+    """
+    Values of a metric by label values, kept in the memory of the process
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self.lock:
+            return {json.dumps(key): self._copy(value) for key, value in self.values.items()}
+
+    def _copy(self, value):
+        return value
+
+    def merge(self, value, other):
+        raise NotImplementedError()
+
+    def samples(self, key, value):
+        """
+        Returns the (name, labels, value) exposed for the values of one set of label values
+        """
+        raise NotImplementedError()
+
+    def expose(self, values):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.type),
+        ]
+        for key in sorted(values):
+            for name, labels, value in self.samples(json.loads(key), values[key]):
+                lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, value, other):
+        return value + other
+
+    def samples(self, key, value):
+        yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Timer(ContextDecorator):
+    """
+    Observes the seconds spent in a block or a decorated function
+    """
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def _recreate_cm(self):
+        # A decorated function can run in several threads at once, each call is timed by its own timer
+        return Timer(self.histogram, self.labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram(Metric):
+    """
+    Counts of the observations falling in each bucket, followed by the sum of the observations
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, amount, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            counts[bisect_left(self.buckets, amount)] += 1
+            counts[-1] += amount
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def _copy(self, value):
+        return list(value)
+
+    def merge(self, value, other):
+        return [a + b for a, b in zip(value, other)]
+
+    def samples(self, key, value):
+        labels = list(zip(self.labelnames, key))
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), value):
+            cumulative += count
+            yield self.name + '_bucket', labels + [('le', _format_value(float(bound)))], cumulative
+        yield self.name + '_sum', labels, value[-1]
+        yield self.name + '_count', labels, cumulative
+
+
+class FileStore:
+    """
+    Every process writes its values to its own file of the directory, the files are summed when collected.
+    The files of stopped processes are kept so the counters never go down, until the store is reset on deploy.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, '{}-{}.json'.format(os.getpid(), uuid.uuid4().hex[:8]))
+
+    def _get_paths(self):
+        return glob.glob(os.path.join(self.directory, '*.json'))
+
+    def publish(self, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        snapshots = []
+        for path in self._get_paths():
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+        return snapshots
+
+    def reset(self):
+        for path in self._get_paths():
+            os.remove(path)
+
+
+class CacheStore:
+    """
+    Every process stores its values under its own slot of a cache shared by the processes, the slots are summed when
+    collected. The slots of stopped processes are kept so the counters never go down, until the store is reset on
+    deploy, which starts a new generation of slots.
+    """
+    GENERATION_KEY = 'metrics:generation'
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.generation = None
+        self.slot = None
+
+    def _get_generation(self):
+        generation = self.cache.get(self.GENERATION_KEY)
+        if generation is None:
+            self.cache.add(self.GENERATION_KEY, uuid.uuid4().hex, None)
+            generation = self.cache.get(self.GENERATION_KEY)
+        return generation
+
+    def _get_prefix(self, generation):
+        return 'metrics:{}:worker'.format(generation)
+
+    def publish(self, snapshot):
+        generation = self._get_generation()
+        if generation != self.generation:
+            # A process claims a slot of every new generation with its first publication
+            self.slot = claim_number(self.cache, self._get_prefix(generation), snapshot, None)
+            self.generation = generation
+        else:
+            self.cache.set('{}:{}'.format(self._get_prefix(generation), self.slot), snapshot, None)
+
+    def load(self):
+        return list(get_claimed_values(self.cache, self._get_prefix(self._get_generation())).values())
+
+    def reset(self):
+        """
+        Drop the slots of the current generation, the running processes publish their values again in the next one
+        """
+        generation = self.cache.get(self.GENERATION_KEY)
+        self.cache.set(self.GENERATION_KEY, uuid.uuid4().hex, None)
+        if generation is not None:
+            prefix = self._get_prefix(generation)
+            numbers = get_claimed_values(self.cache, prefix)
+            self.cache.delete_many(['{}:{}'.format(prefix, number) for number in numbers] + [prefix + ':last'])
+
+
+def get_store():
+    """
+    Returns the store of METRICS_AGGREGATION, the cache aggregation requires METRICS_CACHE to be shared by every
+    process
+    """
+    if settings.METRICS_AGGREGATION == 'file':
+        return FileStore(settings.METRICS_DIR)
+    if settings.METRICS_AGGREGATION == 'cache':
+        return CacheStore(get_shared_cache('METRICS_CACHE'))
+    return None
+
+
+class MetricsRegistry:
+    """
+    The metrics of the application. With a shared store every process publishes its values at most every
+    METRICS_PUBLISH_SECONDS, and the exposition sums the values published by all of them.
+    """
+
+    def __init__(self, store=None):
+        self.lock = threading.Lock()
+        self.publish_lock = threading.Lock()
+        self.metrics = {}
+        self._store = store
+        self.last_published = 0
+
+    def _register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_store()
+        return self._store
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def publish(self, force=False):
+        if self.store is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_published < settings.METRICS_PUBLISH_SECONDS:
+            return
+        # Another thread of the process is already publishing the same values
+        if not self.publish_lock.acquire(blocking=force):
+            return
+        try:
+            self.last_published = now
+            self.store.publish(self.snapshot())
+        finally:
+            self.publish_lock.release()
+
+    def collect(self):
+        """
+        Returns the values of every metric, summed over the processes sharing the store
+        """
+        if self.store is None:
+            return self.snapshot()
+
+        self.publish(force=True)
+        collected = {name: {} for name in self.metrics}
+        for snapshot in self.store.load():
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in values.items():
+                    current = collected[name].get(key)
+                    collected[name][key] = value if current is None else metric.merge(current, value)
+        return collected
+
+    def expose(self):
+        """
+        Returns the metrics in the prometheus text exposition format
+        """
+        collected = self.collect()
+        lines = []
+        for name in sorted(self.metrics):
+            lines += self.metrics[name].expose(collected.get(name, {}))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+VIEW_REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by url name', ['view', 'method', 'status'])
+OUTBOUND_REQUEST_SECONDS = registry.histogram(
+    'outbound_request_duration_seconds', 'Time spent waiting on an outbound http request, by service',
+    ['service', 'method', 'status'])
+
+
+def get_outbound_service(url):
+    """
+    Returns the service an outbound request is sent to, every request going elsewhere than the judge or recaptcha
+    is a canvas api call
+    """
+    host = urlsplit(url).netloc
+    if host == urlsplit(settings.JUDGE0_HOST).netloc:
+        return 'judge0'
+    if host == urlsplit(getattr(settings, 'RECAPTCHA_URL', '')).netloc:
+        return 'recaptcha'
+    return 'canvas'
@@ -0,0 +1,182 @@
+import cProfile
+import marshal
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+from utils.instrumentation import get_request_metrics
+from utils.shared_cache import get_shared_cache, claim_number
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAMETER = 'profile'
+# Number of functions, by cumulative time, kept in the summary of a profile
+TOP_FUNCTIONS = 40
+# Deepest call stack written to the collapsed stacks
+MAX_STACK_DEPTH = 100
+# Stacks spending less seconds than this under a function are not followed further
+MIN_STACK_SECONDS = 0.00001
+PROFILE_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def is_profiling_requested(request):
+    return PROFILE_HEADER in request.META or PROFILE_PARAMETER in request.GET
+
+
+def format_function(function):
+    filename, line, name = function
+    if filename == '~':
+        # Built-in functions
+        return name
+    if filename.startswith(settings.BASE_DIR):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    return '{}:{}({})'.format(filename, line, name)
+
+
+def get_top_functions(stats, limit=TOP_FUNCTIONS):
+    """
+    Returns the functions of the cProfile stats spending the most cumulative time
+    """
+    functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{
+        'function': format_function(function),
+        'calls': calls,
+        'total_time': total_time,
+        'cumulative_time': cumulative_time,
+    } for function, (_, calls, total_time, cumulative_time, _) in functions]
+
+
+def get_collapsed_stacks(stats):
+    """
+    Returns the cProfile stats as collapsed stacks, one `caller;...;function microseconds` line per stack, readable
+    by flamegraph.pl and speedscope. cProfile only records the callers of each function, so the time of a
+    function is split between its callers in proportion of the time spent under each of them.
+    """
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, cumulative_time) in callers.items():
+            callees.setdefault(caller, []).append((function, cumulative_time))
+
+    lines = {}
+
+    def walk(function, stack, ratio):
+        stack = stack + [format_function(function)]
+        own_time = int(stats[function][2] * ratio * 1000000)
+        if own_time:
+            key = ';'.join(stack)
+            lines[key] = lines.get(key, 0) + own_time
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+        for callee, cumulative_time in callees.get(function, []):
+            callee_time = stats[callee][3]
+            if cumulative_time * ratio < MIN_STACK_SECONDS or format_function(callee) in stack:
+                continue
+            walk(callee, stack, ratio * min(cumulative_time / callee_time, 1))
+
+    for function, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(function, [], 1)
+    return ''.join('{} {}\n'.format(stack, value) for stack, value in lines.items())
+
+
+def is_profiling_enabled():
+    return settings.PROFILE_CACHE is not None
+
+
+class ProfileBuffer:
+    """
+    The last PROFILE_BUFFER_SIZE profiles, stored in a ring of entries of PROFILE_CACHE, which has to be shared by
+    every process
+    """
+    ID_PREFIX = 'profiles:id'
+
+    @property
+    def cache(self):
+        return get_shared_cache('PROFILE_CACHE')
+
+    def _slot_key(self, profile_id):
+        return 'profiles:{}'.format(profile_id % settings.PROFILE_BUFFER_SIZE)
+
+    def add(self, profile):
+        profile['id'] = claim_number(self.cache, self.ID_PREFIX, True, PROFILE_TIMEOUT)
+        self.cache.set(self._slot_key(profile['id']), profile, PROFILE_TIMEOUT)
+        return profile['id']
+
+    def get(self, profile_id):
+        profile = self.cache.get(self._slot_key(profile_id))
+        if profile is None or profile['id'] != profile_id:
+            return None
+        return profile
+
+    def all(self):
+        """
+        Returns the profiles in the buffer, the latest first
+        """
+        keys = ['profiles:{}'.format(slot) for slot in range(settings.PROFILE_BUFFER_SIZE)]
+        return sorted(self.cache.get_many(keys).values(), key=lambda profile: profile['id'], reverse=True)
+
+
+profile_buffer = ProfileBuffer()
+
+
+def get_stats_file(profile):
+    """
+    Returns the profile in the pstats file format, readable by pstats.Stats and snakeviz
+    """
+    return marshal.dumps(profile['stats'])
+
+
+def _profile_request(get_response, request):
+    metrics = get_request_metrics()
+    sql_before = metrics.fingerprints.copy() if metrics else None
+    sql_time_before = metrics.fingerprint_times.copy() if metrics else None
+    http_calls_before = len(metrics.http_calls) if metrics else 0
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    response = profiler.runcall(get_response, request)
+    duration = time.perf_counter() - start
+    profiler.create_stats()
+
+    resolver_match = getattr(request, 'resolver_match', None)
+    profile = {
+        'time': timezone.now(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view_name': resolver_match.view_name if resolver_match else None,
+        'user': request.user.username,
+        'status': response.status_code,
+        'duration': duration,
+        'functions': get_top_functions(profiler.stats),
+        'queries': [],
+        'http_calls': [],
+        'stats': profiler.stats,
+    }
+    if metrics:
+        times = metrics.fingerprint_times - sql_time_before
+        profile['queries'] = [
+            {'sql': sql, 'count': count, 'time': times[sql]}
+            for sql, count in (metrics.fingerprints - sql_before).most_common()
+        ]
+        profile['http_calls'] = metrics.http_calls[http_calls_before:]
+
+    response['X-Profile-Id'] = profile_buffer.add(profile)
+    return response
+
+
+def profiling_middleware(get_response):
+    # Runs the requests of staff users asking for it with an X-Profile header or a profile query parameter under
+    # cProfile, every other request only pays for the check of the flag. Profiling is off until PROFILE_CACHE is set.
+    if not is_profiling_enabled():
+        raise MiddlewareNotUsed()
+    # Fails on startup when the cache is not shared
+    get_shared_cache('PROFILE_CACHE')
+
+    def middleware(request):
+        if is_profiling_requested(request) and request.user.is_staff:
+            return _profile_request(get_response, request)
+        return get_response(request)
+
+    return middleware
@@ -0,0 +1,52 @@
+import threading
+
+_local = threading.local()
+
+
+def get_request_cache():
+    """
+    Returns the memo dict of the current request or None outside of a request
+    """
+    return getattr(_local, 'cache', None)
+
+
+def memoize(key, func):
+    """
+    Returns the value of `key` for the current request, computing it with `func` the first time.
+    Outside of a request `func` is always called.
+    """
+    cache = get_request_cache()
+    if cache is None:
+        return func()
+    if key not in cache:
+        cache[key] = func()
+    return cache[key]
+
+
+def forget(key):
+    cache = get_request_cache()
+    if cache is not None:
+        cache.pop(key, None)
+
+
+def forget_prefix(prefix):
+    """
+    Forget the values of the tuple keys starting with `prefix`
+    """
+    cache = get_request_cache()
+    if cache is not None:
+        for key in [key for key in cache if isinstance(key, tuple) and key[:len(prefix)] == prefix]:
+            del cache[key]
+
+
+def request_cache_middleware(get_response):
+    # Identity map and memo of the lookups done while handling a request, cleared at the end of the request
+
+    def middleware(request):
+        _local.cache = {}
+        try:
+            return get_response(request)
+        finally:
+            _local.cache = None
+
+    return middleware
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+# Backends of the caches shared by every process of the site. They all add a key atomically, of several processes
+# adding the same key at once only one succeeds, while the incr of the database cache is a read followed by a write.
+SHARED_BACKENDS = (
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.memcached.MemcachedCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django_redis.cache.RedisCache',
+)
+
+
+def get_shared_cache(setting_name):
+    """
+    Returns the cache named by the setting. Raises ImproperlyConfigured when its backend is not shared by the
+    processes, like the default locmem cache which keeps a copy per process.
+    """
+    alias = getattr(settings, setting_name)
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in SHARED_BACKENDS:
+        raise ImproperlyConfigured("{} has to name a cache shared by every process, the backend of '{}' is {}".format(
+            setting_name, alias, backend))
+    return caches[alias]
+
+
+def claim_number(cache, prefix, value, timeout):
+    """
+    Stores the value under the first free key `<prefix>:<number>` and returns its number. The keys are claimed with
+    add so two processes never get the same number, the last number claimed is only a hint to start from.
+    """
+    last_key = '{}:last'.format(prefix)
+    number = cache.get(last_key, 0) + 1
+    while not cache.add('{}:{}'.format(prefix, number), value, timeout):
+        number += 1
+    cache.set(last_key, number, timeout)
+    return number
+
+
+def get_claimed_values(cache, prefix):
+    """
+    Returns the values stored by claim_number under the prefix, by number
+    """
+    last = cache.get('{}:last'.format(prefix), 0)
+    keys = {'{}:{}'.format(prefix, number): number for number in range(1, last + 1)}
+    values = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+    # Numbers claimed after the hint was last written
+    number = last + 1
+    value = cache.get('{}:{}'.format(prefix, number))
+    while value is not None:
+        values[number] = value
+        number += 1
+        value = cache.get('{}:{}'.format(prefix, number))
+    return values